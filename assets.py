@@ -0,0 +1,211 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyglet
+from pyglet.model import Model
+
+from culling import aabb_from_vertices
+from model.obj import UPLOAD_BLOCK, load_obj_meshes, upload_meshes
+
+
+# Loader threads parse OBJ files in chunks of this many bytes: every regex and NumPy call
+# holds the GIL until it returns, and shorter calls let the main thread in sooner
+LOAD_CHUNK_SIZE = 1 << 18
+
+
+def obj_shape_arrays(filename, chunk_size=LOAD_CHUNK_SIZE):
+    '''
+    The meshes of an OBJ file merged into the (vertice, indice, color) arrays taken by
+    RenderWindow.add_shape, colored by their normals, and their bounding box. The arrays
+    are read-only, so shapes sharing them share one uploaded vertex list.
+    '''
+    mesh_list = load_obj_meshes(filename, chunk_size)
+    counts = [len(mesh.vertices) // 3 for mesh in mesh_list]
+    offsets = np.cumsum([0] + counts[:-1])
+    vertices = np.concatenate([np.asarray(mesh.vertices, dtype=np.float32) for mesh in mesh_list])
+    indices = np.concatenate([np.asarray(mesh.indices, dtype=np.uint32) + offset
+                              for mesh, offset in zip(mesh_list, offsets)])
+    colors = np.full((len(vertices) // 3, 4), 255, dtype=np.uint8)
+    colors[:, :3] = np.concatenate([np.reshape(mesh.normals, (-1, 3)) for mesh in mesh_list]) * 127.5 + 127.5
+    colors = colors.ravel()
+    for array in (vertices, indices, colors):
+        array.flags.writeable = False
+    return (vertices, indices, colors), aabb_from_vertices(vertices)
+
+
+class AssetHandle:
+    '''
+    An asset requested from an AssetManager. Until the asset is uploaded, `value` holds a
+    placeholder and `ready` is False; `error` holds the exception if loading failed.
+    Callbacks added with on_ready run on the main thread once the load is over.
+    '''
+    def __init__(self, filename, placeholder=None):
+        self.filename = filename
+        self.value = placeholder
+        self.ready = False
+        self.error = None
+        self._callbacks = []
+
+    @property
+    def done(self):
+        return self.ready or self.error is not None
+
+    def on_ready(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def _finish(self, value=None, error=None):
+        if error is None:
+            self.value, self.ready = value, True
+        self.error = error
+        for callback in self._callbacks:
+            callback(self)
+        self._callbacks = []
+
+    def __repr__(self):
+        state = 'ready' if self.ready else 'failed' if self.error is not None else 'loading'
+        return f'{self.__class__.__name__}({self.filename!r}, {state})'
+
+
+class AssetManager:
+    '''
+    Loads assets without stalling the frame loop. Files are parsed and images decoded on a
+    pool of worker threads; the GL uploads that must happen on the main thread are split
+    into small steps (see model.obj.upload_vertex_list) and run by update, once per frame,
+    until `budget` seconds are spent. Every load returns an AssetHandle right away.
+    '''
+    def __init__(self, workers=2, budget=0.004, block=UPLOAD_BLOCK, chunk_size=LOAD_CHUNK_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='assets')
+        self.budget = budget
+        self.block = block
+        self.chunk_size = chunk_size
+        # (handle, future, upload, key): waiting for a worker, in request order
+        self._loading = []
+        # (handle, steps): upload generators, run one at a time
+        self._uploads = deque()
+        # futures of prepare functions shared by loads with the same key, until they finish
+        self._prepared = {}
+        # seconds spent in the last update
+        self.update_time = 0.0
+        self._placeholder_texture = None
+
+    @property
+    def pending(self):
+        return len(self._loading) + len(self._uploads)
+
+    @property
+    def placeholder_texture(self):
+        if self._placeholder_texture is None:
+            pattern = pyglet.image.CheckerImagePattern((255, 0, 255, 255), (0, 0, 0, 255))
+            self._placeholder_texture = pattern.create_image(8, 8).get_texture()
+        return self._placeholder_texture
+
+    def submit(self, handle, prepare, upload, key=None):
+        '''
+        Run `prepare()` on a worker thread, then `upload(result)` on the main thread: a
+        generator whose steps update runs within its budget, returning the asset. Loads
+        submitted with the same `key` while its `prepare()` call runs share that call; once
+        it finishes, the next load with that key calls `prepare()` again, so it sees the
+        files as they are then.
+        '''
+        if key is None:
+            future = self.executor.submit(prepare)
+        elif key in self._prepared:
+            future = self._prepared[key]
+        else:
+            future = self._prepared[key] = self.executor.submit(prepare)
+        self._loading.append((handle, future, upload, key))
+        return handle
+
+    def load_model(self, filename, batch=None, group=None, atlas=None, packed=False):
+        '''
+        Load an OBJ file as a pyglet Model, like OBJModelDecoder (see upload_meshes for
+        `atlas` and `packed`). The handle's value is the Model from the start; it draws
+        nothing until its meshes are uploaded.
+        '''
+        model = Model(vertex_lists=[], groups=[], batch=batch)
+        atlas_names = atlas.regions if atlas is not None else {}
+
+        def prepare():
+            mesh_list = load_obj_meshes(filename, self.chunk_size)
+            textures = {}
+            for mesh in mesh_list:
+                name = mesh.material.texture_name
+                if name and name not in textures and name not in atlas_names:
+                    textures[name] = pyglet.image.load(name, file=pyglet.resource.file(name))
+            return mesh_list, textures
+
+        return self.submit(AssetHandle(filename, model), prepare,
+                           lambda result: upload_meshes(model, result[0], group, result[1], self.block,
+                                                        atlas, packed))
+
+    def load_texture(self, filename):
+        '''
+        Decode an image file into a texture. The handle's value is a checkerboard
+        placeholder texture until the image is uploaded.
+        '''
+        def upload(image):
+            texture = image.get_texture()
+            yield
+            return texture
+
+        return self.submit(AssetHandle(filename, self.placeholder_texture),
+                           lambda: pyglet.image.load(filename), upload)
+
+    def update(self, budget=None) -> int:
+        '''
+        Run upload steps of finished loads until `budget` seconds (the manager's budget by
+        default) have passed, at least one so that loads always progress. Returns the
+        number of steps run.
+        '''
+        start = time.perf_counter()
+        deadline = start + (self.budget if budget is None else budget)
+        steps = 0
+        while True:
+            self._collect()
+            if not self._uploads:
+                break
+            handle, upload = self._uploads[0]
+            try:
+                next(upload)
+            except StopIteration as stop:
+                self._uploads.popleft()
+                handle._finish(stop.value)
+            except Exception as exception:
+                self._uploads.popleft()
+                handle._finish(error=exception)
+            steps += 1
+            if time.perf_counter() >= deadline:
+                break
+        self.update_time = time.perf_counter() - start
+        return steps
+
+    def finish(self):
+        '''
+        Block until every pending load is uploaded.
+        '''
+        while self.pending:
+            if not self._uploads:
+                self._loading[0][1].exception()
+            self.update(np.inf)
+
+    def _collect(self):
+        waiting = []
+        for handle, future, upload, key in self._loading:
+            if not future.done():
+                waiting.append((handle, future, upload, key))
+                continue
+            if self._prepared.get(key) is future:
+                del self._prepared[key]
+            if future.exception() is not None:
+                handle._finish(error=future.exception())
+            else:
+                self._uploads.append((handle, upload(future.result())))
+        self._loading = waiting
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+'''
+Frame times of the main.py scene while a large generated OBJ (a --grid x --grid vertex
+grid) loads in the background with RenderWindow.load_shape, against loading it in one
+frame. The loaded shape is placed behind the camera, so drawing it is not part of the
+frame times, only loading and uploading it.
+
+The time the asset manager spends per frame must stay within twice its budget (a step may
+start just before the budget runs out), and 95% of the frames within 1/60 s. Before that,
+models, textures and shapes loaded through the AssetManager are checked against their
+synchronous counterparts.
+
+    python -m benchmarks.assets [--grid 500] [--budget 0.004]
+'''
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.gl import glFinish
+from pyglet.math import Mat4, Vec3
+
+from assets import AssetManager, obj_shape_arrays
+from benchmarks.obj_parallel import write_grid_obj
+from headless import OffscreenTarget
+from main import build_scene
+from model.obj import OBJModelDecoder
+from render import RenderWindow
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+FRAME_BUDGET = 1 / 60
+
+
+def check_models(directory):
+    manager = AssetManager(block=1000)
+    for source in MODELS:
+        filename = os.path.join(directory, os.path.basename(source))
+        shutil.copy(source, filename)
+        expected = OBJModelDecoder().decode(filename, None, None)
+        handle = manager.load_model(filename)
+        assert not handle.ready and handle.value.vertex_lists == []
+        manager.finish()
+        assert handle.ready and repr(handle.value.vertex_stats) == repr(expected.vertex_stats)
+        for old, new in zip(expected.vertex_lists, handle.value.vertex_lists):
+            for name in ('position', 'normals', 'colors'):
+                assert np.array_equal(getattr(old, name)[:], getattr(new, name)[:]), (filename, name)
+            assert np.array_equal(np.asarray(old.indices[:]) - old.start, np.asarray(new.indices[:]) - new.start)
+
+    handle = manager.load_texture('textures/grass_top.png')
+    assert handle.value is manager.placeholder_texture
+    manager.finish()
+    image = pyglet.image.load('textures/grass_top.png')
+    assert handle.ready and (handle.value.width, handle.value.height) == (image.width, image.height)
+
+    missing = manager.load_texture(os.path.join(directory, 'missing.png'))
+    manager.finish()
+    assert not missing.ready and missing.error is not None
+    manager.shutdown()
+
+
+def check_shapes(filename):
+    renderer = RenderWindow(320, 240, 'benchmark', visible=False)
+    handles = [renderer.load_shape(Mat4.from_translation(Vec3(x, 0, 0)), filename) for x in (-1, 1)]
+    assert renderer.shape_triangles.tolist() == [12, 12]
+    renderer.assets.finish()
+    (vertices, indices, _), (low, high) = obj_shape_arrays(filename)
+    assert all(handle.ready for handle in handles)
+    assert renderer.shapes[0].indexed_vertices_list is renderer.shapes[1].indexed_vertices_list
+    assert renderer.shape_triangles.tolist() == [len(indices) // 3] * 2
+    assert np.allclose(renderer.bounds.centers, (low + high) / 2)
+    renderer.close()
+
+
+def frame_loop(renderer, load):
+    target = OffscreenTarget(*renderer.get_framebuffer_size())
+    renderer.switch_to()
+    target.bind()
+    # warm up: first uploads and lazily imported code are not part of the run
+    for _ in range(3):
+        renderer.update(1 / 60)
+        renderer.on_draw()
+    glFinish()
+
+    handle = load(renderer)
+    frame_times, asset_times = [], []
+    while not (handle is None or handle.ready):
+        start = time.perf_counter()
+        renderer.update(1 / 60)
+        renderer.on_draw()
+        glFinish()
+        frame_times.append(time.perf_counter() - start)
+        asset_times.append(renderer.assets.update_time)
+        assert handle.error is None, handle.error
+    target.unbind()
+    return np.array(frame_times), np.array(asset_times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', type=int, default=500)
+    parser.add_argument('--budget', type=float, default=0.004, help='asset upload time per frame, seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        check_models(directory)
+        filename = os.path.join(directory, 'grid.obj')
+        size = write_grid_obj(filename, args.grid)
+        check_shapes(filename)
+        behind = Mat4.from_translation(Vec3(0, 0, 10))
+        print(f'{args.grid}x{args.grid} grid: {size / 2 ** 20:.0f} MiB, {os.cpu_count()} CPUs')
+
+        def load_sync(renderer):
+            start = time.perf_counter()
+            arrays, _ = obj_shape_arrays(filename, None)
+            renderer.add_shape(behind, *arrays)
+            print(f'  in one frame: {(time.perf_counter() - start) * 1e3:.0f} ms frame')
+
+        def load_async(renderer):
+            renderer.assets.budget = args.budget
+            return renderer.load_shape(behind, filename)
+
+        for load in (load_sync, load_async):
+            # no mesh cache, so both parse the file
+            for cache in (name for name in os.listdir(directory) if name.endswith('.meshcache')):
+                os.remove(os.path.join(directory, cache))
+            renderer = RenderWindow(640, 480, 'benchmark', visible=False)
+            build_scene(renderer)
+            renderer.animate = True
+            frame_times, asset_times = frame_loop(renderer, load)
+            renderer.close()
+
+        print(f'  in the background: {len(frame_times)} frames, frame time median '
+              f'{np.median(frame_times) * 1e3:.1f} ms, 95% {np.percentile(frame_times, 95) * 1e3:.1f} ms, '
+              f'max {frame_times.max() * 1e3:.1f} ms; uploads max {asset_times.max() * 1e3:.1f} ms/frame')
+        assert asset_times.max() < 2 * args.budget, 'asset uploads went over budget'
+        assert np.percentile(frame_times, 95) < FRAME_BUDGET, 'frames went over budget while loading'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+'''
+Texture binds and draw calls of a model of --blocks x --blocks cubes, each with its own
+material textured with one of the block textures, loaded with OBJModelDecoder on its own
+and with a texture atlas of the textures; plus atlas build and cache load times.
+
+Before measuring, packed rectangles are checked not to overlap, atlas regions and their
+padding against the images, the atlas cache against its sources, and the model drawn with
+the atlas against the model drawn with its own textures.
+
+    python -m benchmarks.atlas [--blocks 20] [--frames 100]
+'''
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+import pyglet.graphics.vertexdomain
+from pyglet.gl import GL_DEPTH_TEST, glClear, glClearColor, glEnable, glFinish, GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT
+from pyglet.math import Mat4, Vec3
+
+from headless import OffscreenTarget
+from model.atlas import ATLAS_CACHE_SUFFIX, _image_pixels, build_texture_atlas, load_texture_atlas, \
+    pack_rectangles, texture_names
+from model.obj import OBJModelDecoder, load_obj_meshes
+
+
+TEXTURES = ['textures/grass_top.png', 'textures/sand.png', 'textures/bedrock.png']
+
+CUBE_FACES = [(1, 2, 4, 3), (5, 7, 8, 6), (1, 5, 6, 2), (3, 4, 8, 7), (1, 3, 7, 5), (2, 6, 8, 4)]
+
+
+def write_block_obj(filename, blocks, textures):
+    '''
+    A blocks x blocks grid of tilted unit cubes, each an object with its own material
+    textured with one of `textures`, with [0, 1] texture coordinates on every face.
+    '''
+    corners = np.array([(x, y, z) for x in (0, 1) for y in (0, 1) for z in (0, 1)], dtype=float) - 0.5
+    tilt = Mat4.from_rotation(0.5, Vec3(1, 0, 0)) @ Mat4.from_rotation(0.6, Vec3(0, 1, 0))
+    corners = corners @ np.array(tilt, dtype=float).reshape(4, 4)[:3, :3]
+    normals = np.array([(-1, 0, 0), (1, 0, 0), (0, -1, 0), (0, 1, 0), (0, 0, -1), (0, 0, 1)])
+    normals = normals @ np.array(tilt, dtype=float).reshape(4, 4)[:3, :3]
+
+    base = os.path.splitext(filename)[0]
+    with open(base + '.mtl', 'w') as f:
+        for i in range(blocks * blocks):
+            shade = 0.7 + 0.3 * (i % 7) / 6
+            f.write(f'newmtl block{i}\nKd {shade:.3f} {shade:.3f} {shade:.3f}\n'
+                    f'map_Kd {textures[i % len(textures)]}\n')
+    with open(filename, 'w') as f:
+        f.write(f'mtllib {os.path.basename(base)}.mtl\n')
+        f.write('vt 0 0\nvt 1 0\nvt 1 1\nvt 0 1\n')
+        f.write(''.join(f'vn {x:.6f} {y:.6f} {z:.6f}\n' for x, y, z in normals))
+        for i in range(blocks * blocks):
+            center = np.array([i % blocks, i // blocks, 0]) * 1.5 - (blocks - 1) * 0.75
+            f.write(f'o block{i}\nusemtl block{i}\n')
+            f.write(''.join(f'v {x:.6f} {y:.6f} {z:.6f}\n' for x, y, z in corners + center))
+            for n, face in enumerate(CUBE_FACES):
+                f.write('f ' + ' '.join(f'{c - 9}/{t}/{n + 1}' for t, c in enumerate(face, 1)) + '\n')
+
+
+def check_packing():
+    rng = np.random.default_rng(1)
+    for padding in (0, 2):
+        sizes = rng.integers(1, 70, (200, 2))
+        positions, (width, height) = pack_rectangles(sizes, padding)
+        low, high = positions - padding, positions + sizes + padding
+        assert low.min() >= 0 and high[:, 0].max() <= width and high[:, 1].max() <= height
+        overlap = (np.maximum(low[:, None], low[None]) < np.minimum(high[:, None], high[None])).all(axis=2)
+        assert np.count_nonzero(overlap) == len(sizes), 'packed rectangles overlap'
+        print(f'packed 200 rectangles with padding {padding}: {width}x{height}, '
+              f'{np.prod(sizes, axis=1).sum() / (width * height):.0%} used')
+
+
+def check_atlas(directory):
+    atlas = build_texture_atlas(TEXTURES, padding=2)
+    for name in TEXTURES:
+        x, y, w, h = atlas.regions[name]
+        image = _image_pixels(name)
+        assert np.array_equal(atlas.pixels[y:y + h, x:x + w], image), name
+        # the padding repeats the edge pixels
+        assert np.array_equal(atlas.pixels[y - 2:y, x:x + w], np.repeat(image[:1], 2, axis=0)), name
+        assert np.array_equal(atlas.pixels[y:y + h, x + w:x + w + 2], np.repeat(image[:, -1:], 2, axis=1)), name
+        uv = atlas.map_tex_coords(name, [0, 0, 1, 1]).reshape(2, 2) * (atlas.width, atlas.height)
+        assert np.allclose(uv, [(x, y), (x + w, y + h)]), name
+    assert atlas.map_tex_coords(TEXTURES[0], [0, 0, 2, 1]) is None
+    assert atlas.map_tex_coords('textures/missing.png', [0, 0]) is None
+
+    sources = [os.path.join(directory, os.path.basename(name)) for name in TEXTURES]
+    for name, source in zip(TEXTURES, sources):
+        shutil.copy(name, source)
+    cache_filename = os.path.join(directory, 'blocks' + ATLAS_CACHE_SUFFIX)
+    built = load_texture_atlas(sources, cache_filename)
+    cached = load_texture_atlas(sources, cache_filename)
+    assert isinstance(cached.pixels, np.memmap) and np.array_equal(cached.pixels, built.pixels)
+    assert cached.regions == built.regions
+    assert not isinstance(load_texture_atlas(sources[:2], cache_filename).pixels, np.memmap)
+    os.utime(sources[0], ns=(0, 0))
+    assert not isinstance(load_texture_atlas(sources, cache_filename).pixels, np.memmap)
+
+
+@contextmanager
+def counted_calls(counts):
+    '''
+    Count texture binds and indexed draw calls issued by pyglet while drawing a batch.
+    '''
+    originals = [(pyglet.gl, 'glBindTexture'), (pyglet.graphics.vertexdomain, 'glDrawElements'),
+                 (pyglet.graphics.vertexdomain, 'glMultiDrawElements')]
+    originals = [(module, name, getattr(module, name)) for module, name in originals]
+
+    def counted(name, function):
+        def call(*args):
+            counts[name] = counts.get(name, 0) + 1
+            return function(*args)
+        return call
+
+    for module, name, function in originals:
+        setattr(module, name, counted(name, function))
+    try:
+        yield counts
+    finally:
+        for module, name, function in originals:
+            setattr(module, name, function)
+
+
+def draw_model(window, filename, atlas, frames, target):
+    batch = pyglet.graphics.Batch()
+    model = pyglet.model.load(filename, decoder=OBJModelDecoder(atlas=atlas), batch=batch)
+    target.bind()
+    glClearColor(0, 0, 0, 1)
+    glEnable(GL_DEPTH_TEST)
+    counts = {}
+    with counted_calls(counts):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        batch.draw()
+    pixels = target.read_pixels()
+
+    target.bind()
+    start = time.perf_counter()
+    for _ in range(frames):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        batch.draw()
+    glFinish()
+    elapsed = (time.perf_counter() - start) / frames
+    target.unbind()
+    groups = len(set(model.groups))
+    return pixels, counts, groups, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--blocks', type=int, default=20)
+    parser.add_argument('--frames', type=int, default=100)
+    args = parser.parse_args()
+
+    # material texture names are relative to the repository root
+    pyglet.resource.path = [os.getcwd()]
+    pyglet.resource.reindex()
+    window = pyglet.window.Window(640, 480, visible=False)
+    window.projection = Mat4.perspective_projection(window.aspect_ratio, 0.1, 100, 60)
+    window.view = Mat4.look_at(Vec3(0, 0, 1.5 * args.blocks), Vec3(0, 0, 0), Vec3(0, 1, 0))
+    target = OffscreenTarget(640, 480)
+
+    check_packing()
+    with tempfile.TemporaryDirectory() as directory:
+        check_atlas(directory)
+
+        filename = os.path.join(directory, 'blocks.obj')
+        write_block_obj(filename, args.blocks, TEXTURES)
+        names = texture_names(load_obj_meshes(filename))
+        cache_filename = filename + ATLAS_CACHE_SUFFIX
+        start = time.perf_counter()
+        atlas = load_texture_atlas(names, cache_filename)
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        atlas = load_texture_atlas(names, cache_filename)
+        cached = time.perf_counter() - start
+        print(f'atlas of {len(names)} textures: {atlas.width}x{atlas.height}, '
+              f'built in {built * 1e3:.1f} ms, loaded from cache in {cached * 1e3:.2f} ms')
+
+        results = [draw_model(window, filename, packed, args.frames, target) for packed in (None, atlas)]
+
+    (before, before_counts, before_groups, before_time), (after, after_counts, after_groups, after_time) = results
+    difference = np.abs(before.astype(int) - after.astype(int))[..., :3]
+    assert np.count_nonzero(before[..., :3]) > 0.1 * before[..., 0].size, 'nothing was drawn'
+    assert difference.mean() < 1, f'the atlas changes the image (mean difference {difference.mean():.2f})'
+    assert after_counts.get('glBindTexture', 0) == 1
+    cubes = args.blocks * args.blocks
+    for label, counts, groups, elapsed in (('own textures', before_counts, before_groups, before_time),
+                                           ('atlas', after_counts, after_groups, after_time)):
+        draws = counts.get('glDrawElements', 0) + counts.get('glMultiDrawElements', 0)
+        print(f'{cubes} cubes, {label:<12}: {groups:4} groups, {counts.get("glBindTexture", 0):4} texture binds, '
+              f'{draws:4} draw calls, {elapsed * 1e3:6.2f} ms/frame')
+    print(f'image difference: mean {difference.mean():.3f}, max {difference.max()}')
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+BVH build, refit and query throughput on synthetic scenes of random boxes, compared with
+a linear scan over all boxes. Every query is first checked against the linear scan, on a
+built tree, a refit one and one grown by appending boxes. Pure NumPy, no display needed.
+
+    python -m benchmarks.bvh [--counts 1000 10000 100000] [--queries 200]
+'''
+import argparse
+import time
+
+import numpy as np
+from pyglet.math import Mat4, Vec3
+
+from bvh import BVH, ray_aabbs
+from culling import aabbs_in_frustum, frustum_planes
+
+
+def random_boxes(rng, count, spread):
+    centers = rng.uniform(-spread, spread, (count, 3)).astype(np.float32)
+    extents = rng.uniform(0.1, 1.0, (count, 3)).astype(np.float32)
+    return centers - extents, centers + extents
+
+
+def random_rays(rng, count, spread):
+    origins = rng.uniform(-spread, spread, (count, 3)).astype(np.float32)
+    directions = rng.normal(size=(count, 3)).astype(np.float32)
+    return origins, directions
+
+
+def random_frustums(rng, count, spread):
+    projection = Mat4.perspective_projection(aspect=4 / 3, z_near=0.1, z_far=spread, fov=60)
+    for eye, target in zip(rng.uniform(-spread, spread, (count, 2, 3)), rng.uniform(-spread, spread, (count, 2, 3))):
+        yield frustum_planes(projection @ Mat4.look_at(Vec3(*eye[0]), target=Vec3(*target[0]), up=Vec3(0, 1, 0)))
+
+
+def check(tree, lo, hi, rays, frustums):
+    for origin, direction in zip(*rays):
+        hit, t_near = ray_aabbs(origin, direction, lo, hi)
+        indices, distances = tree.ray_query(origin, direction)
+        assert np.array_equal(np.sort(indices), np.flatnonzero(hit))
+        assert np.all(np.diff(distances) >= 0) and np.allclose(distances, t_near[indices])
+    for planes in frustums:
+        assert np.array_equal(tree.frustum_query(planes), aabbs_in_frustum((lo + hi) / 2, (hi - lo) / 2, planes))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for count in args.counts:
+        spread = 2 * count ** (1 / 3)
+        lo, hi = random_boxes(rng, count, spread)
+        rays = random_rays(rng, args.queries, spread)
+        frustums = list(random_frustums(rng, 20, spread))
+
+        start = time.perf_counter()
+        tree = BVH(lo, hi)
+        build = time.perf_counter() - start
+        check(tree, lo, hi, (rays[0][:20], rays[1][:20]), frustums)
+
+        # move a tenth of the boxes and refit
+        moved = rng.choice(count, count // 10, replace=False)
+        offset = rng.uniform(-1, 1, (len(moved), 3)).astype(np.float32)
+        lo[moved] += offset
+        hi[moved] += offset
+        refit = timed(tree.refit, moved, lo[moved], hi[moved])
+        check(tree, lo, hi, (rays[0][:20], rays[1][:20]), frustums)
+
+        # grow a tree from empty by appending the boxes in steps of a hundredth
+        grown = BVH(lo[:0], hi[:0])
+        step = max(1, count // 100)
+        append = timed(lambda: [grown.append(lo[i:i + step], hi[i:i + step]) for i in range(0, count, step)])
+        check(grown, lo, hi, (rays[0][:20], rays[1][:20]), frustums)
+
+        linear_rays = timed(lambda: [ray_aabbs(o, d, lo, hi) for o, d in zip(*rays)]) / args.queries
+        tree_rays = timed(lambda: [tree.ray_query(o, d) for o, d in zip(*rays)]) / args.queries
+        centers, extents = (lo + hi) / 2, (hi - lo) / 2
+        linear_frustum = timed(lambda: [aabbs_in_frustum(centers, extents, p) for p in frustums]) / len(frustums)
+        tree_frustum = timed(lambda: [tree.frustum_query(p) for p in frustums]) / len(frustums)
+
+        print(f'{count:>7} boxes: build {build * 1e3:7.1f} ms, refit 10% {refit * 1e3:6.1f} ms, '
+              f'append 1% {append / 100 * 1e3:5.2f} ms, '
+              f'ray {1 / linear_rays:8,.0f} -> {1 / tree_rays:8,.0f} queries/s, '
+              f'frustum {linear_frustum * 1e3:6.2f} -> {tree_frustum * 1e3:6.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
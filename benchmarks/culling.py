@@ -0,0 +1,95 @@
+'''
+Frame time of a large scene of cubes spread around the camera, with and without frustum
+culling. The vectorized bounds test is first checked against a per-shape reference that
+transforms all eight box corners with Mat4.
+
+    python -m benchmarks.culling [--count 10000] [--frames 20] [--spread 60]
+'''
+import argparse
+import itertools
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.gl import glFinish
+from pyglet.math import Mat4, Vec3, Vec4
+
+from culling import frustum_planes
+from primitives import Cube, geometry_cache
+from render import RenderWindow
+
+
+def reference_visible(renderer, planes):
+    visible = []
+    for shape, center, extent in zip(renderer.shapes, renderer.bounds.centers, renderer.bounds.extents):
+        corners = []
+        for signs in itertools.product((-1, 1), repeat=3):
+            x, y, z = center + np.array(signs) * extent
+            corner = shape.transform_mat @ Vec4(x, y, z, 1)
+            corners.append((corner.x, corner.y, corner.z))
+        corners = np.array(corners)
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        # the box corner furthest along each plane normal must be inside
+        furthest = np.where(planes[:, None, :3] >= 0, high, low)[:, 0]
+        visible.append(bool(np.all(np.sum(furthest * planes[:, :3], axis=1) + planes[:, 3] >= -1e-4)))
+    return np.array(visible)
+
+
+def build_scene(count, spread, cached):
+    renderer = RenderWindow(320, 240, 'benchmark', visible=False)
+    cube = geometry_cache.get(Cube, 1.0) if cached else Cube(1.0)
+    rng = np.random.default_rng(0)
+    for x, y, z in rng.uniform(-spread, spread, (count, 3)):
+        renderer.add_shape(Mat4.from_translation(Vec3(x, y, z)), cube.vertices, cube.indices, cube.colors)
+    return renderer
+
+
+def frame_time(renderer, frames):
+    renderer.update(1 / 60)
+    renderer.on_draw()
+    glFinish()
+    start = time.perf_counter()
+    for _ in range(frames):
+        renderer.update(1 / 60)
+        renderer.on_draw()
+    glFinish()
+    return (time.perf_counter() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--spread', type=float, default=60)
+    args = parser.parse_args()
+
+    for cached in (False, True):
+        renderer = build_scene(args.count, args.spread, cached)
+        renderer.animate = True
+        renderer.update(0.5)
+
+        planes = frustum_planes(renderer.proj_mat @ renderer.view_mat)
+        sample = slice(0, min(renderer.transforms.count, 2000))
+        visible = renderer.bounds.visible(renderer.transforms.matrices, planes)
+        assert np.array_equal(visible[sample], reference_visible(renderer, planes)[sample])
+
+        start = time.perf_counter()
+        renderer.cull()
+        cull = time.perf_counter() - start
+
+        label = 'shared lists' if cached else 'own lists   '
+        times = []
+        for enabled in (False, True):
+            renderer.frustum_culling = enabled
+            times.append(frame_time(renderer, args.frames))
+        print(f'{args.count} cubes, {label}: {renderer.visible_count:>6} visible, {renderer.culled_count:>6} culled, '
+              f'cull {cull * 1e3:.2f} ms, frame {times[0] * 1e3:.1f} ms -> {times[1] * 1e3:.1f} ms '
+              f'({times[0] / times[1]:.1f}x)')
+        renderer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''
+Headless frame benchmark: renders each scene offscreen as fast as possible and reports the
+CPU time of update and of the draw submission per frame, frames/s and triangles/s.
+
+Scenes: the scene of main.py, 100 and 10,000 cached shapes on a grid, and N copies of the
+Stanford bunny.
+
+    python -m benchmarks.frames [--frames 100] [--scenes main shapes100 shapes10k bunny]
+                                [--bunnies 100] [--size 1280 720] [--static]
+'''
+import argparse
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.math import Mat4, Vec3
+
+from main import build_scene as main_scene
+from headless import OffscreenTarget, render_frames
+from model.obj import load_obj_meshes
+from primitives import Cube, Sphere, geometry_cache
+from render import RenderWindow
+
+
+def grid_positions(count, spacing):
+    '''
+    `count` positions on a square grid in the xz plane, in front of the default camera.
+    '''
+    side = int(np.ceil(np.sqrt(count)))
+    index = np.arange(count)
+    x = (index % side - (side - 1) / 2) * spacing
+    z = -(index // side) * spacing
+    return np.stack([x, np.zeros(count), z], axis=1)
+
+
+def shapes_scene(count):
+    def build(renderer):
+        meshes = [geometry_cache.get(Cube, 1.0), geometry_cache.get(Sphere, 16, 16)]
+        for i, (x, y, z) in enumerate(grid_positions(count, 2.0)):
+            mesh = meshes[i % 2]
+            renderer.add_shape(Mat4.from_translation(Vec3(x, y, z)), mesh.vertices, mesh.indices, mesh.colors)
+    return build
+
+
+def bunny_scene(count):
+    def build(renderer):
+        mesh = load_obj_meshes('model/bunny.obj')[0]
+        # read-only arrays, so all bunnies share one uploaded vertex list
+        vertices = np.array(mesh.vertices, dtype=np.float32)
+        indices = np.array(mesh.indices, dtype=np.uint32)
+        colors = np.full((len(vertices) // 3, 4), 255, dtype=np.uint8)
+        colors[:, :3] = np.reshape(mesh.normals, (-1, 3)) * 127.5 + 127.5
+        colors = colors.ravel()
+        for array in (vertices, indices, colors):
+            array.flags.writeable = False
+        for x, y, z in grid_positions(count, 0.25):
+            transform = Mat4.from_translation(Vec3(x, y, z)) @ Mat4.from_scale(Vec3(2, 2, 2))
+            renderer.add_shape(transform, vertices, indices, colors)
+    return build
+
+
+def build_scenes(bunnies):
+    return {
+        'main': main_scene,
+        'shapes100': shapes_scene(100),
+        'shapes10k': shapes_scene(10000),
+        'bunny': bunny_scene(bunnies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--scenes', nargs='+', default=['main', 'shapes100', 'shapes10k', 'bunny'])
+    parser.add_argument('--bunnies', type=int, default=100)
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--static', action='store_true', help='do not animate the shapes')
+    args = parser.parse_args()
+
+    scenes = build_scenes(args.bunnies)
+    for name in args.scenes:
+        renderer = RenderWindow(*args.size, 'benchmark', visible=False)
+        scenes[name](renderer)
+        renderer.animate = not args.static
+        target = OffscreenTarget(*args.size)
+        stats = render_frames(renderer, args.frames, target)
+        assert target.read_pixels()[..., :3].any(), f'{name}: nothing was rendered'
+        print(f'{name:>10} ({len(renderer.shapes):>5} shapes, {renderer.triangle_count:>9,} triangles/frame): {stats}')
+        renderer.close()
+
+
+if __name__ == '__main__':
+    main()
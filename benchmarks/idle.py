@@ -0,0 +1,135 @@
+'''
+Idle CPU usage and input-to-frame latency of RenderWindow.run with the scene of main.py,
+redrawing at a fixed 60 Hz (the previous loop) and on demand (redraw_on_demand).
+
+Each loop runs for --seconds idle, then for --seconds with synthetic mouse drags arriving
+at --event-rate per second. Reported are the CPU time used (as a share of one core), the
+frames drawn, the camera updates the drag events were coalesced into, and the time from
+the first input event behind a frame to the end of its draw.
+
+Before measuring, the camera's cached matrices are checked against matrices built from
+its parameters, and the on-demand loop is checked to draw nothing while idle and to
+coalesce drag events into at most one camera update per frame.
+
+    python -m benchmarks.idle [--seconds 3] [--event-rate 250]
+'''
+import argparse
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.math import Mat4, Vec3
+from pyglet.window import mouse
+
+from camera import Camera
+from control import Control
+from main import build_scene
+from render import RenderWindow
+
+
+def check_camera():
+    camera = Camera(aspect=16 / 9)
+    view_proj = camera.view_proj
+    rebuilds, version = camera.rebuilds, camera.version
+    for _ in range(10):
+        assert camera.view_proj is view_proj
+    camera.eye = Vec3(0, 2, 4)
+    assert camera.version == version and camera.rebuilds == rebuilds, 'an unchanged value invalidated the camera'
+
+    camera.orbit(0.5, 0.2)
+    camera.pan(0.1, -0.1)
+    camera.zoom(0.5)
+    camera.fov = 45
+    expected = Mat4.perspective_projection(aspect=16 / 9, z_near=0.1, z_far=100, fov=45) @ \
+        Mat4.look_at(camera.eye, target=camera.target, up=camera.up)
+    assert np.allclose(camera.view_proj, expected)
+    assert np.isclose(abs(camera.eye - camera.target), 0.5 * np.sqrt(20))
+
+
+def run_loop(on_demand, seconds, event_rate):
+    '''
+    Run a window's event loop for `seconds` idle and `seconds` with mouse drags. Returns the
+    CPU time, draws and camera updates of both phases, and the drag latencies.
+    '''
+    window = RenderWindow(640, 480, 'benchmark', visible=False)
+    window.redraw_on_demand = on_demand
+    controller = Control(window)
+    build_scene(window)
+
+    draws = [0]
+    on_draw = window.on_draw
+
+    def counted_draw():
+        draws[0] += 1
+        on_draw()
+    window.on_draw = counted_draw
+
+    phases = []
+
+    def measure(dt):
+        phases.append((time.process_time(), draws[0], controller.updates, controller.events))
+
+    def drag(dt):
+        # several events per frame, like a high-rate mouse
+        window.dispatch_event('on_mouse_drag', 320, 240, 2, 1, mouse.LEFT, 0)
+
+    def start_drag(dt):
+        measure(dt)
+        window.input_latencies.clear()
+        pyglet.clock.schedule_interval(drag, 1 / event_rate)
+
+    def stop(dt):
+        pyglet.clock.unschedule(drag)
+        measure(dt)
+        pyglet.app.exit()
+
+    # the idle phase starts once the first frames are drawn
+    pyglet.clock.schedule_once(measure, 0.5)
+    pyglet.clock.schedule_once(start_drag, 0.5 + seconds)
+    pyglet.clock.schedule_once(stop, 0.5 + 2 * seconds)
+    window.run()
+    # the fixed loop's timers outlive it
+    for function in (window.update, window.frame, pyglet.app.event_loop._redraw_windows):
+        pyglet.clock.unschedule(function)
+    # run dispatches window events immediately from then on, including the on_resize of
+    # the next window while it is being created
+    pyglet.window.Window._enable_event_queue = True
+    latencies = np.array(window.input_latencies) * 1e3
+    window.close()
+
+    (idle_cpu, idle_draws, _, _), (drag_cpu, drag_draws, updates, events), (end_cpu, end_draws, end_updates,
+                                                                            end_events) = phases
+    return ((drag_cpu - idle_cpu, drag_draws - idle_draws),
+            (end_cpu - drag_cpu, end_draws - drag_draws, end_updates - updates, end_events - events),
+            latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--event-rate', type=float, default=250.0, help='mouse drag events per second')
+    args = parser.parse_args()
+
+    check_camera()
+    results = {}
+    for label, on_demand in (('fixed 60 Hz', False), ('on demand', True)):
+        (idle_cpu, idle_draws), (drag_cpu, drag_draws, updates, events), latencies = \
+            run_loop(on_demand, args.seconds, args.event_rate)
+        results[label] = idle_cpu
+        print(f'{label:>11}: idle {idle_cpu / args.seconds:6.1%} CPU, {idle_draws:4} frames drawn; '
+              f'dragging {drag_cpu / args.seconds:6.1%} CPU, {drag_draws:4} frames, '
+              f'{events} events in {updates} camera updates, latency {np.mean(latencies):5.1f} ms '
+              f'(p95 {np.percentile(latencies, 95):5.1f} ms)')
+        if on_demand:
+            assert idle_draws == 0, f'{idle_draws} frames drawn while idle'
+            assert updates <= drag_draws and events > 2 * updates, (events, updates, drag_draws)
+            assert drag_draws <= 1.1 * 60 * args.seconds, drag_draws
+            assert np.percentile(latencies, 95) < 3 * 1000 / 60, 'input waits more than a few frames'
+    assert results['on demand'] < 0.2 * results['fixed 60 Hz'], results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+Vertex cache and overdraw efficiency of the bundled models and the primitives in their
+source order and after model.optimize (Tipsy triangle order, overdraw clustering and
+vertex fetch order): ACMR (vertex shader runs per triangle) and ATVR (runs per vertex)
+for FIFO caches of 16 and 32 entries, the optimization time, and, drawn with OpenGL from
+--views directions, overdraw (fragments passing the depth test per covered pixel) and
+draw time.
+
+Before measuring, the ACMR/ATVR calculator is checked on small index lists, optimized
+meshes against their source (the same triangles, drawn to the same pixels), and the
+models returned by load_obj_meshes to be optimized (benchmarks.obj_cache checks that the
+mesh cache holds them as they were optimized).
+
+    python -m benchmarks.mesh_optimize [--views 8] [--frames 50]
+'''
+import argparse
+import ctypes
+import os
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet import gl
+from pyglet.gl import GL_TRIANGLES
+from pyglet.math import Mat4, Vec3
+
+import shader
+from headless import OffscreenTarget
+from model.normals import add_mesh_normals
+from model.obj import load_obj_meshes, parse_obj_file
+from model.optimize import acmr, atvr, optimize_indices
+from primitives import Icosphere, Plane, Sphere
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+
+
+def check_metrics():
+    # a lone triangle misses on every vertex, two sharing an edge on four
+    assert acmr([0, 1, 2]) == 3 and acmr([0, 1, 2, 2, 1, 3]) == 2 and atvr([0, 1, 2, 2, 1, 3]) == 1
+    # with 3 entries, vertex 0 is evicted by 3, 4 and 5 before it is used again
+    assert acmr([0, 1, 2, 3, 4, 5, 0, 1, 2], cache_size=3) == 3
+    assert acmr([0, 1, 2, 3, 4, 5, 0, 1, 2], cache_size=6) == 2
+
+
+def triangle_set(points, indices, *attributes):
+    # every triangle as the sorted rows of its corners' attributes, independent of order
+    rows = np.concatenate([np.reshape(array, (len(points) // 3, -1)) for array in (points,) + attributes], axis=1)
+    corners = rows[np.reshape(indices, (-1, 3))]
+    keys = [tuple(map(tuple, triangle)) for triangle in corners.tolist()]
+    # rotated to start at the smallest corner, keeping the winding
+    keys = [min(key[i:] + key[:i] for i in range(3)) for key in keys]
+    return sorted(keys)
+
+
+def source_meshes():
+    '''
+    (name, vertices, indices, normals, optimized indices, vertex order, optimization time)
+    of the bundled models, in their source order, and of a few primitives.
+    '''
+    meshes = []
+    for filename in MODELS:
+        source = add_mesh_normals(parse_obj_file(filename, indexed=True)[0])
+        points, indices, normals = source.vertices, np.asarray(source.indices), source.normals
+        start = time.perf_counter()
+        optimized, order = optimize_indices(points, indices)
+        elapsed = time.perf_counter() - start
+        assert triangle_set(points, indices, normals) == \
+            triangle_set(np.reshape(points, (-1, 3))[order].ravel(), optimized, np.reshape(normals, (-1, 3))[order])
+        loaded = load_obj_meshes(filename)[0]
+        assert np.array_equal(loaded.indices, optimized), f'{filename}: the loaded mesh is not optimized'
+        assert np.array_equal(loaded.vertices, np.reshape(points, (-1, 3))[order].ravel())
+        meshes.append((os.path.basename(filename), points, indices, normals, optimized, order, elapsed))
+
+    for name, primitive in (('sphere 30x30', Sphere(30, 30)), ('icosphere 4', Icosphere(4)),
+                            ('plane 100', Plane(100))):
+        start = time.perf_counter()
+        optimized, order = optimize_indices(primitive.vertices, primitive.indices)
+        elapsed = time.perf_counter() - start
+        meshes.append((name, primitive.vertices, primitive.indices, primitive.normals, optimized, order, elapsed))
+    return meshes
+
+
+def view_directions(count):
+    # evenly spread over the sphere
+    k = np.arange(count) + 0.5
+    y = 1 - 2 * k / count
+    angle = np.pi * (1 + 5 ** 0.5) * k
+    radius = np.sqrt(1 - y * y)
+    return np.stack([radius * np.cos(angle), y, radius * np.sin(angle)], axis=1)
+
+
+def draw(program, target, points, indices, normals, views, frames):
+    '''
+    Draw the mesh from every view. Returns the images, the overdraw (fragments passing the
+    depth test per covered pixel, summed over the views) and the draw time per view.
+    '''
+    points = np.asarray(points, dtype=np.float32)
+    colors = np.full((len(points) // 3, 4), 255, dtype=np.uint8)
+    colors[:, :3] = np.reshape(normals, (-1, 3)) * 127.5 + 127.5
+    batch = pyglet.graphics.Batch()
+    vertex_list = program.vertex_list_indexed(len(points) // 3, GL_TRIANGLES, np.asarray(indices).tolist(), batch,
+                                              vertices=('f', points), colors=('Bn', colors.ravel()))
+    positions = points.reshape(-1, 3)
+    lower, upper = positions.min(axis=0), positions.max(axis=0)
+    center, radius = (lower + upper) / 2, float(np.linalg.norm(upper - lower) / 2)
+    projection = Mat4.perspective_projection(target.width / target.height, 0.1 * radius, 10 * radius, 60)
+
+    query = gl.GLuint()
+    gl.glGenQueries(1, ctypes.byref(query))
+    images, fragments, covered, elapsed = [], 0, 0, 0.0
+    program.use()
+    program['model'] = Mat4()
+    target.bind()
+    gl.glEnable(gl.GL_DEPTH_TEST)
+    gl.glEnable(gl.GL_CULL_FACE)
+    for direction in views:
+        eye = center + direction * 2.2 * radius
+        program['view_proj'] = projection @ Mat4.look_at(Vec3(*eye), Vec3(*center), Vec3(0, 1, 0))
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        gl.glBeginQuery(gl.GL_SAMPLES_PASSED, query)
+        vertex_list.draw(GL_TRIANGLES)
+        gl.glEndQuery(gl.GL_SAMPLES_PASSED)
+        passed = gl.GLuint()
+        gl.glGetQueryObjectuiv(query, gl.GL_QUERY_RESULT, ctypes.byref(passed))
+        image = target.read_pixels()
+        images.append(image)
+        fragments += passed.value
+        covered += np.count_nonzero(image[..., 3])
+
+        target.bind()
+        gl.glFinish()
+        start = time.perf_counter()
+        for _ in range(frames):
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+            vertex_list.draw(GL_TRIANGLES)
+        gl.glFinish()
+        elapsed += (time.perf_counter() - start) / frames
+    target.unbind()
+    gl.glDeleteQueries(1, ctypes.byref(query))
+    vertex_list.delete()
+    return images, fragments / max(covered, 1), elapsed / len(views)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--views', type=int, default=8)
+    parser.add_argument('--frames', type=int, default=50)
+    args = parser.parse_args()
+
+    check_metrics()
+
+    window = pyglet.window.Window(640, 480, visible=False)
+    target = OffscreenTarget(640, 480)
+    program = shader.get_program(shader.vertex_source_default, shader.fragment_source_default)
+    views = view_directions(args.views)
+    for name, points, indices, normals, optimized, order, elapsed in source_meshes():
+        print(f'{name} ({len(indices) // 3:,} triangles, optimized in {elapsed * 1e3:.1f} ms):')
+        results = []
+        for label, (mesh_points, mesh_indices, mesh_normals) in (
+                ('source', (points, indices, normals)),
+                ('optimized', (np.reshape(points, (-1, 3))[order].ravel(), optimized,
+                               np.reshape(normals, (-1, 3))[order]))):
+            images, overdraw, draw_time = draw(program, target, mesh_points, mesh_indices, mesh_normals, views,
+                                               args.frames)
+            results.append((images, acmr(mesh_indices)))
+            print(f'    {label:>9}: ACMR {acmr(mesh_indices):5.3f} (32 entries {acmr(mesh_indices, 32):5.3f}), '
+                  f'ATVR {atvr(mesh_indices):5.3f}, overdraw {overdraw:5.3f}, {draw_time * 1e3:6.2f} ms/view')
+
+        (source_images, source_acmr), (optimized_images, optimized_acmr) = results
+        for before, after in zip(source_images, optimized_images):
+            # only pixels where depths tie within a rounding step may differ
+            assert np.count_nonzero(np.any(before != after, axis=2)) <= 0.001 * before[..., 0].size, \
+                f'{name}: the optimized mesh draws a different image'
+        if name in map(os.path.basename, MODELS):
+            assert optimized_acmr < 0.9 and optimized_acmr < source_acmr, f'{name}: ACMR {optimized_acmr}'
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+'''
+Normal and tangent generation (model.normals) on bunny.obj, which has no `vn` records,
+and on a large sphere, in triangles per second.
+
+Before timing, generated normals are checked against the analytic normals of the Sphere
+and Icosphere primitives (the error must fall with the resolution), hard edges against a
+cube made of shared corners, and tangents against the analytic sphere tangents.
+
+    python -m benchmarks.normals [--repeat 5] [--sphere 500]
+'''
+import argparse
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from model.normals import compute_normals, compute_tangents
+from model.obj import load_obj_meshes, parse_obj_file
+from primitives import Cube, Icosphere, Sphere
+
+
+def angle_errors(normals, expected):
+    normals, expected = np.reshape(normals, (-1, 3)), np.reshape(expected, (-1, 3))
+    expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+    return np.degrees(np.arccos(np.clip(np.einsum('ij,ij->i', normals, expected), -1, 1)))
+
+
+def check_spheres():
+    for weighting in ('angle', 'area'):
+        errors = []
+        for size in (8, 16, 32, 64):
+            sphere = Sphere(size, size)
+            vertices, _, normals = compute_normals(sphere.vertices, sphere.indices, weighting=weighting)
+            # on a unit sphere the normal is the position
+            errors.append(angle_errors(normals, vertices).max())
+        # halving the edge length quarters the error with angle weights; area weights lean
+        # towards the larger triangles of a latitude band and only halve it
+        ratio = 3 if weighting == 'angle' else 1.8
+        assert errors[-1] < 0.5 and np.all(np.array(errors[:-1]) / errors[1:] > ratio), (weighting, errors)
+        print(f'sphere normals ({weighting} weighted), max error by resolution: '
+              + ', '.join(f'{size}: {error:.3f} deg' for size, error in zip((8, 16, 32, 64), errors)))
+
+    sphere = Icosphere(4)
+    vertices, indices, normals = compute_normals(sphere.vertices, sphere.indices, smoothing_angle=None)
+    assert len(vertices) == len(sphere.vertices) and angle_errors(normals, sphere.normals).max() < 0.1
+
+    # tangents follow increasing u, around the y axis; the seam columns only see the faces
+    # on one side and the poles have no u direction, so they are left out
+    size = 64
+    sphere = Sphere(size, size)
+    tangents = compute_tangents(sphere.vertices, sphere.normals, sphere.tex_coords, sphere.indices).reshape(-1, 4)
+    theta = np.tile(np.arange(size + 1) * 2 * np.pi / size, size + 1)
+    column = np.tile(np.arange(size + 1), size + 1)
+    interior = (np.abs(np.reshape(sphere.normals, (-1, 3))[:, 1]) < 0.9) & (column > 0) & (column < size)
+    expected = np.stack([-np.sin(theta), np.zeros_like(theta), -np.cos(theta)], axis=1)
+    error = angle_errors(tangents[interior, :3], expected[interior]).max()
+    assert error < 0.2 and np.all(tangents[:, 3] == 1), error
+    assert np.allclose(np.linalg.norm(tangents[:, :3], axis=1), 1, atol=1e-5)
+    assert np.abs(np.einsum('ij,ij->i', tangents[:, :3], np.reshape(sphere.normals, (-1, 3)))).max() < 1e-5
+    print(f'sphere tangents, max error {error:.3f} deg')
+
+
+def check_hard_edges():
+    # a cube with eight shared corners splits into four vertices per face
+    quads = Cube.faces
+    triangles = np.concatenate([quads[:, [0, 1, 2]], quads[:, [2, 3, 0]]])
+    vertices, indices, normals = compute_normals(Cube.corners, triangles)
+    assert len(vertices) == 24 * 3 and len(indices) == len(triangles) * 3
+    face_normals = np.repeat(np.concatenate([Cube.face_normals, Cube.face_normals]), 3, axis=0)
+    assert np.allclose(np.reshape(normals, (-1, 3))[indices], face_normals, atol=1e-6)
+    # without a smoothing angle the corners stay shared and average their three faces
+    vertices, _, normals = compute_normals(Cube.corners, triangles, smoothing_angle=None)
+    assert len(vertices) == 8 * 3 and angle_errors(normals, Cube.corners).max() < 0.05
+
+
+def best_time(repeat, function, *args, **kwargs):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def report(label, mesh, repeat):
+    triangles = len(mesh.indices) // 3
+    for smoothing_angle in (None, 60.0):
+        (vertices, indices, normals, tex_coords), elapsed = best_time(
+            repeat, compute_normals, mesh.vertices, mesh.indices, smoothing_angle, attributes=(mesh.tex_coords,))
+        print(f'{label}: normals, smoothing angle {smoothing_angle}: {elapsed * 1e3:7.1f} ms, '
+              f'{triangles / elapsed:12,.0f} triangles/s, {len(mesh.vertices) // 3} -> {len(vertices) // 3} vertices')
+    _, elapsed = best_time(repeat, compute_tangents, vertices, normals, tex_coords, indices)
+    print(f'{label}: tangents: {elapsed * 1e3:7.1f} ms, {triangles / elapsed:12,.0f} triangles/s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sphere', type=int, default=500, help='stacks and slices of the large sphere')
+    args = parser.parse_args()
+
+    check_spheres()
+    check_hard_edges()
+
+    mesh = parse_obj_file('model/bunny.obj', indexed=True)[0]
+    assert not np.any(mesh.normals), 'bunny.obj was expected to have no normals'
+    loaded = load_obj_meshes('model/bunny.obj')[0]
+    points = np.reshape(loaded.vertices, (-1, 3))[np.reshape(loaded.indices, (-1, 3))]
+    face_normals = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    corner_normals = np.reshape(loaded.normals, (-1, 3))[np.reshape(loaded.indices, (-1, 3))]
+    # generated normals lean the same way as the faces around them
+    assert np.all(np.einsum('ti,tci->tc', face_normals, corner_normals) > 0)
+    assert len(loaded.tangents) == len(loaded.vertices) // 3 * 4
+    report('bunny.obj', mesh, args.repeat)
+
+    sphere = Sphere(args.sphere, args.sphere)
+    sphere.normals = np.zeros_like(sphere.normals)
+    report(f'sphere {args.sphere}x{args.sphere}', sphere, max(1, args.repeat // 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+'''
+Cold (parse and write cache) vs. warm (memory-mapped cache) OBJ load times.
+The models are copied to a temporary directory, so no cache is left next to model/.
+Stale cache detection is checked by touching the source after the warm load.
+
+    python -m benchmarks.obj_cache [--runs N]
+'''
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from model.normals import add_mesh_normals
+from model.obj import CACHE_SUFFIX, load_obj_meshes, parse_obj_file
+from model.optimize import optimize_mesh
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for source in MODELS:
+            filename = os.path.join(directory, os.path.basename(source))
+            shutil.copy(source, filename)
+            cache_filename = filename + CACHE_SUFFIX
+
+            cold = warm = float('inf')
+            for _ in range(args.runs):
+                if os.path.exists(cache_filename):
+                    os.remove(cache_filename)
+                _, elapsed = timed(load_obj_meshes, filename)
+                cold = min(cold, elapsed)
+            for _ in range(args.runs):
+                mesh_list, elapsed = timed(load_obj_meshes, filename)
+                warm = min(warm, elapsed)
+
+            assert isinstance(mesh_list[0].vertices, np.memmap), 'warm load did not use the cache'
+            # the cache holds the meshes with their generated normals and tangents, optimized
+            for cached, parsed in zip(mesh_list, parse_obj_file(filename, indexed=True)):
+                optimize_mesh(add_mesh_normals(parsed))
+                for name in ('vertices', 'normals', 'tex_coords', 'tangents', 'indices'):
+                    assert np.array_equal(getattr(cached, name), getattr(parsed, name)), name
+
+            # A newer source must invalidate the cache
+            stat = os.stat(filename)
+            os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            assert not isinstance(load_obj_meshes(filename)[0].vertices, np.memmap), 'stale cache was used'
+            del mesh_list
+
+            print(f'{source}: cold {cold * 1e3:.2f} ms, warm {warm * 1e3:.2f} ms, '
+                  f'speedup {cold / warm:.0f}x, cache {os.path.getsize(cache_filename):,} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Scaling of the multi-process OBJ parser (parse_obj_file with `workers`) on a generated
+large mesh: a grid of --grid x --grid vertices with vt/vn records and quads, split into
+objects, where odd objects use negative indices.
+
+Before timing, the output for 1, 2, 3 and 8 workers is checked to be identical to the
+serial parser for the models, a small generated mesh and the synthetic file of
+benchmarks.obj_stream.
+
+Worker counts default to 1, 2, 4 and 8 up to the number of CPUs. With a single CPU the
+worker processes can only take turns, so no speedup is expected and the timings are
+skipped unless --workers is given: the scaling has not been measured on such machines.
+
+    python -m benchmarks.obj_parallel [--grid 1000] [--workers 1 2 4 8] [--runs 3]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from benchmarks.obj_stream import check_same_meshes, write_synthetic_obj
+from model.obj import parse_obj_file
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+
+
+def write_grid_obj(filename, size, objects=8):
+    x, y = np.meshgrid(np.arange(size), np.arange(size))
+    points = np.stack([x.ravel(), y.ravel(), np.sin(x.ravel() * 0.1) * np.cos(y.ravel() * 0.1)], axis=1) / size
+    quads = np.stack([x[:-1, :-1], x[:-1, :-1] + 1, x[:-1, :-1] + 1 + size, x[:-1, :-1] + size], axis=2)
+    quads = (quads + y[:-1, :-1, None] * size).reshape(-1, 4) + 1
+
+    with open(filename, 'w') as f:
+        f.write('\n'.join(map('v {:.6f} {:.6f} {:.6f}'.format, *points.T)) + '\n')
+        f.write('\n'.join(map('vt {:.6f} {:.6f}'.format, *points[:, :2].T)) + '\n')
+        f.write('\n'.join(map('vn {:.6f} {:.6f} {:.6f}'.format, *points.T)) + '\n')
+        for i, rows in enumerate(np.array_split(quads, objects)):
+            # negative indices count back from the end of the vertex records
+            corners = rows - len(points) - 1 if i % 2 else rows
+            f.write(f'o grid{i}\n')
+            f.write('\n'.join(map('f {0}/{0}/{0} {1}/{1}/{1} {2}/{2}/{2} {3}/{3}/{3}'.format, *corners.T)) + '\n')
+    return os.path.getsize(filename)
+
+
+def check_parallel(directory):
+    grid = os.path.join(directory, 'grid.obj')
+    write_grid_obj(grid, 40)
+    synthetic = os.path.join(directory, 'synthetic.obj')
+    write_synthetic_obj(synthetic, 200_000, grid=8)
+    for source in MODELS + [grid, synthetic]:
+        for indexed in (False, True):
+            expected = parse_obj_file(source, indexed=indexed)
+            for workers in (1, 2, 3, 8):
+                result = parse_obj_file(source, indexed=indexed, workers=workers)
+                check_same_meshes(expected, result, (source, indexed, workers))
+
+
+def best_time(runs, function, *args, **kwargs):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', type=int, default=1000)
+    cpus = os.cpu_count() or 1
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[workers for workers in (1, 2, 4, 8) if workers <= cpus] if cpus > 1 else [])
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        check_parallel(directory)
+
+        filename = os.path.join(directory, 'large.obj')
+        size = write_grid_obj(filename, args.grid)
+        print(f'{args.grid}x{args.grid} grid: {size / 2 ** 20:.0f} MiB, {os.cpu_count()} CPUs')
+        serial = best_time(args.runs, parse_obj_file, filename, indexed=True)
+        print(f'  serial     {serial * 1e3:8.0f} ms')
+        if not args.workers:
+            print('  one CPU: worker processes cannot run in parallel, timings skipped (see --workers)')
+        for workers in args.workers:
+            elapsed = best_time(args.runs, parse_obj_file, filename, indexed=True, workers=workers)
+            print(f'  {workers} workers  {elapsed * 1e3:8.0f} ms, speedup {serial / elapsed:4.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+OBJ parsing throughput of the per-line parser and the vectorized parser, in lines/sec.
+Before timing, the vectorized output is checked against the per-line parser, and the
+indexed output against the triangle soup.
+
+    python -m benchmarks.obj_parse [--repeat N]
+'''
+import argparse
+import io
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from model.obj import parse_obj_file
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+
+
+def check_same_meshes(filename):
+    expected = parse_obj_file(filename, vectorized=False)
+    result = parse_obj_file(filename, vectorized=True)
+
+    assert len(expected) == len(result), filename
+    for old, new in zip(expected, result):
+        assert old.name == new.name and old.material.name == new.material.name, filename
+        for attribute in ('vertices', 'normals', 'tex_coords'):
+            old_values = np.asarray(getattr(old, attribute), dtype=np.float32)
+            new_values = getattr(new, attribute)
+            assert new_values.dtype == np.float32 and new_values.flags.c_contiguous, attribute
+            assert np.allclose(old_values, new_values), (filename, attribute)
+
+    # The welded meshes must expand back to the same triangle soup
+    for soup, mesh in zip(result, parse_obj_file(filename, indexed=True)):
+        assert mesh.indices.dtype == np.uint32 and mesh.emitted_count == len(mesh.indices), filename
+        for attribute, width in (('vertices', 3), ('normals', 3), ('tex_coords', 2)):
+            expanded = getattr(mesh, attribute).reshape(-1, width)[mesh.indices]
+            assert np.array_equal(getattr(soup, attribute).reshape(-1, width), expanded), (filename, attribute)
+
+
+def lines_per_second(filename, contents, vectorized, runs):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse_obj_file(filename, file=io.BytesIO(contents), vectorized=vectorized)
+        best = min(best, time.perf_counter() - start)
+    return contents.count(b'\n') / best, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=1, help='concatenate each model N times')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    for filename in MODELS:
+        check_same_meshes(filename)
+        with open(filename, 'rb') as f:
+            contents = f.read() * args.repeat
+
+        loop_rate, loop_time = lines_per_second(filename, contents, False, args.runs)
+        fast_rate, fast_time = lines_per_second(filename, contents, True, args.runs)
+        print(f'{filename} x{args.repeat}: '
+              f'per-line {loop_rate:,.0f} lines/s ({loop_time * 1e3:.1f} ms), '
+              f'vectorized {fast_rate:,.0f} lines/s ({fast_time * 1e3:.1f} ms), '
+              f'speedup {loop_time / fast_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
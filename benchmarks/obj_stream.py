@@ -0,0 +1,149 @@
+'''
+Peak memory (tracemalloc) and throughput of streaming a large synthetic OBJ file with
+iter_obj_meshes, against reading it whole with parse_obj_file. The file holds many small
+grid objects with vt/vn records, quads, negative indices and materials.
+
+Before measuring, the streamed meshes are checked against parse_obj_file for the models
+and a small synthetic file, at chunk sizes that split lines and objects. The streamed peak
+must stay below a bound set by the chunk size, independent of the file size.
+
+    python -m benchmarks.obj_stream [--size-mb 2048] [--chunk-mb 4] [--compare-mb 64]
+'''
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from model.obj import iter_obj_meshes, parse_obj_file
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+
+MATERIALS = '''newmtl red
+Kd 1 0 0
+newmtl blue
+Kd 0 0 1
+'''
+
+
+def grid_object(size):
+    '''
+    OBJ records of a size x size vertex grid with quads, using negative indices only,
+    so the same text is valid wherever it appears in the file.
+    '''
+    x, y = np.meshgrid(np.arange(size), np.arange(size))
+    points = np.stack([x.ravel(), y.ravel(), np.sin(x.ravel() + y.ravel())], axis=1) / size
+    lines = [f'v {px:.6f} {py:.6f} {pz:.6f}' for px, py, pz in points]
+    lines += [f'vt {px:.6f} {py:.6f}' for px, py, _ in points]
+    lines += ['vn 0 0 1'] * len(points)
+    count = len(points)
+    for row in range(size - 1):
+        for column in range(size - 1):
+            corners = [row * size + column, row * size + column + 1,
+                       (row + 1) * size + column + 1, (row + 1) * size + column]
+            lines.append('f ' + ' '.join(f'{i - count}/{i - count}/{i - count}' for i in corners))
+    return '\n'.join(lines) + '\n'
+
+
+def write_synthetic_obj(filename, size_bytes, grid=32):
+    with open(os.path.join(os.path.dirname(filename), 'synthetic.mtl'), 'w') as f:
+        f.write(MATERIALS)
+    block = grid_object(grid).encode()
+    written = 0
+    with open(filename, 'wb') as f:
+        # the first block has no `o` record and becomes an unnamed mesh
+        header = b'# synthetic\nmtllib synthetic.mtl\nusemtl red\n'
+        f.write(header + block)
+        written += len(header) + len(block)
+        i = 0
+        while written < size_bytes:
+            record = f'o part{i}\nusemtl {("red", "blue")[i % 2]}\n'.encode()
+            f.write(record + block)
+            written += len(record) + len(block)
+            i += 1
+    return written
+
+
+def check_same_meshes(expected, result, label):
+    assert len(expected) == len(result), label
+    for old, new in zip(expected, result):
+        assert old.name == new.name and old.material.name == new.material.name, label
+        assert old.emitted_count == new.emitted_count and old.aabb == new.aabb, label
+        for attribute in ('vertices', 'normals', 'tex_coords', 'indices'):
+            assert np.array_equal(getattr(old, attribute), getattr(new, attribute)), (label, attribute)
+
+
+def check_streaming(directory):
+    filename = os.path.join(directory, 'small.obj')
+    write_synthetic_obj(filename, 200_000, grid=8)
+    for source in MODELS + [filename]:
+        for indexed in (False, True):
+            expected = parse_obj_file(source, indexed=indexed)
+            for chunk_size in (1000, 65536):
+                result = list(iter_obj_meshes(source, chunk_size=chunk_size, indexed=indexed))
+                check_same_meshes(expected, result, (source, indexed, chunk_size))
+    # the synthetic objects only refer to their own vertices
+    result = list(iter_obj_meshes(filename, chunk_size=1000, indexed=True, keep_vertices=False))
+    check_same_meshes(parse_obj_file(filename, indexed=True), result, 'keep_vertices=False')
+    assert [mesh.material.name for mesh in result[:3]] == ['red', 'red', 'blue']
+
+
+def traced(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def stream(filename, chunk_size, keep_vertices):
+    # stand-in for uploading each mesh as it arrives and letting it go
+    triangles = 0
+    for mesh in iter_obj_meshes(filename, chunk_size=chunk_size, indexed=True, keep_vertices=keep_vertices):
+        triangles += len(mesh.indices) // 3
+    return triangles
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=2048)
+    parser.add_argument('--chunk-mb', type=float, default=4)
+    parser.add_argument('--compare-mb', type=int, default=64, help='size of the file also read whole')
+    args = parser.parse_args()
+    chunk_size = int(args.chunk_mb * 2 ** 20)
+    mb = 2 ** 20
+
+    with tempfile.TemporaryDirectory() as directory:
+        check_streaming(directory)
+
+        filename = os.path.join(directory, 'compare.obj')
+        size = write_synthetic_obj(filename, args.compare_mb * mb)
+        whole, whole_peak, whole_time = traced(lambda: parse_obj_file(filename, indexed=True))
+        triangles = sum(len(mesh.indices) // 3 for mesh in whole)
+        del whole
+        for keep_vertices in (True, False):
+            streamed, peak, elapsed = traced(lambda: stream(filename, chunk_size, keep_vertices))
+            assert streamed == triangles
+            print(f'{size / mb:7.0f} MiB, keep_vertices={keep_vertices!s:<5}: streamed peak {peak / mb:7.1f} MiB '
+                  f'({elapsed:5.1f} s), whole file peak {whole_peak / mb:7.1f} MiB ({whole_time:5.1f} s)')
+        os.remove(filename)
+
+        filename = os.path.join(directory, 'large.obj')
+        size = write_synthetic_obj(filename, args.size_mb * mb)
+        triangles, peak, elapsed = traced(lambda: stream(filename, chunk_size, False))
+        print(f'{size / mb:7.0f} MiB, keep_vertices=False: streamed peak {peak / mb:7.1f} MiB, '
+              f'{triangles:,} triangles in {elapsed:.1f} s ({size / mb / elapsed:.1f} MiB/s)')
+        bound = 16 * chunk_size
+        assert peak < bound, f'streaming peak {peak / mb:.1f} MiB is above {bound / mb:.1f} MiB'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Procedural mesh generation time: the previous nested-loop Sphere against the vectorized
+generators. The loop version grows tuples quadratically, so it is only run up to
+--legacy-limit stacks.
+
+    python -m benchmarks.primitives [--sizes 30 100 300 1000] [--legacy-limit 200]
+'''
+import argparse
+import math
+import time
+
+import pyglet
+
+pyglet.options['headless'] = True
+
+from primitives import Cube, Cylinder, Icosphere, Plane, Sphere
+
+
+def loop_sphere(stacks, slices, scale=1.0):
+    '''
+    The previous Sphere.__init__: one vertex per triangle corner, colors grown with tuple +=.
+    '''
+    vertices = []
+    colors = ()
+    for i in range(stacks):
+        phi0 = 0.5 * math.pi - (i * math.pi) / stacks
+        phi1 = 0.5 * math.pi - ((i + 1) * math.pi) / stacks
+        y0, r0 = scale * math.sin(phi0), scale * math.cos(phi0)
+        y1, r1 = scale * math.sin(phi1), scale * math.cos(phi1)
+        for j in range(slices):
+            theta0 = (j * 2 * math.pi) / slices
+            theta1 = ((j + 1) * 2 * math.pi) / slices
+            p0 = (r0 * math.cos(theta0), y0, r0 * math.sin(-theta0))
+            p1 = (r1 * math.cos(theta0), y1, r1 * math.sin(-theta0))
+            p2 = (r1 * math.cos(theta1), y1, r1 * math.sin(-theta1))
+            p3 = (r0 * math.cos(theta1), y0, r0 * math.sin(-theta1))
+            color = (int(math.cos(phi0) * 255), int(math.cos(theta0) * 255), int(math.sin(phi0) * 255), 255)
+            if i != stacks - 1:
+                vertices.extend(p0 + p1 + p2)
+                colors += color * 3
+            if i != 0:
+                vertices.extend(p2 + p3 + p0)
+                colors += color * 3
+    return vertices, list(range(len(vertices) // 3)), colors
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 100, 300, 1000])
+    parser.add_argument('--legacy-limit', type=int, default=200)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        sphere, elapsed = timed(Sphere, size, size)
+        line = (f'Sphere({size}, {size}): {elapsed * 1e3:8.1f} ms, {len(sphere.vertices) // 3:>8} vertices, '
+                f'{len(sphere.indices) // 3:>8} triangles')
+        if size <= args.legacy_limit:
+            (vertices, _, _), loop_elapsed = timed(loop_sphere, size, size)
+            line += f' | nested loop {loop_elapsed * 1e3:9.1f} ms, {len(vertices) // 3:>8} vertices'
+        print(line)
+
+    for shape, shape_args in ((Icosphere, (6,)), (Cylinder, (4096,)), (Plane, (1000,)), (Cube, ())):
+        mesh, elapsed = timed(shape, *shape_args)
+        print(f'{shape.__name__}{shape_args}: {elapsed * 1e3:.1f} ms, {len(mesh.vertices) // 3} vertices, '
+              f'{len(mesh.indices) // 3} triangles')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+'''
+Vertex sizes and buffer footprints of bunny.obj and monkey.obj uploaded by OBJModelDecoder
+in the float layout (position, normal, per-vertex RGBA color, UV if textured: 40 or 48
+bytes) and in the packed layout of model.quantize (16-bit positions, octahedral normals,
+half float UVs, color as a uniform: 10 or 14 bytes), and the draw time of each.
+
+Before measuring, quantized positions are checked to be within half a quantization step
+of the originals (on the models and on random meshes, with a flat axis), decoded normals
+and UVs against their error bounds, the packed models drawn with OpenGL against the
+float models, and models loaded by AssetManager.load_model(packed=True) to be packed.
+
+    python -m benchmarks.quantize [--frames 100]
+'''
+import argparse
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.gl import GL_COLOR_BUFFER_BIT, GL_DEPTH_BUFFER_BIT, GL_DEPTH_TEST, glClear, glClearColor, glEnable, \
+    glFinish
+from pyglet.math import Mat4, Vec3
+
+from headless import OffscreenTarget
+from assets import AssetManager
+from model.obj import OBJModelDecoder, load_obj_meshes
+from model.quantize import PACKED_VERTEX_SIZE, PackedMaterialGroup, dequantize_positions, half_tex_coords, \
+    octahedral_decode, octahedral_encode, quantize_positions
+
+
+MODELS = ['model/bunny.obj', 'model/monkey.obj']
+
+
+def check_positions(vertices, aabb=None):
+    '''
+    Check that quantized positions decode within half a step of the originals, allowing
+    for the float32 rounding of the decode. Returns the largest error in steps.
+    '''
+    vertices = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+    quantized, offset, extent = quantize_positions(vertices, aabb)
+    error = np.abs(dequantize_positions(quantized, offset, extent) - vertices)
+    step = extent / 65535
+    rounding = 4 * np.finfo(np.float32).eps * np.abs(vertices).max(axis=0)
+    assert np.all(error <= step / 2 + rounding), f'position error {error.max(axis=0)} over {step / 2}'
+    return (error / np.where(step > 0, step, 1)).max()
+
+
+def check_normals(normals):
+    '''
+    Check decoded octahedral normals against the originals. Returns the largest angle
+    between them in degrees.
+    '''
+    normals = np.reshape(np.asarray(normals, dtype=np.float32), (-1, 3))
+    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    decoded = octahedral_decode(octahedral_encode(normals)).astype(np.float64)
+    # arccos of the dot product is too coarse for angles this small
+    normals = normals.astype(np.float64)
+    angle = np.degrees(np.arctan2(np.linalg.norm(np.cross(normals, decoded), axis=1),
+                                  (normals * decoded).sum(axis=1))).max()
+    assert angle < 0.01, f'normal error {angle} degrees'
+    return angle
+
+
+def check_encodings(rng):
+    for _ in range(20):
+        vertices = rng.normal(size=(1000, 3)) * rng.uniform(0.01, 100) + rng.uniform(-100, 100, 3)
+        check_positions(vertices)
+    # a flat mesh decodes to its plane exactly
+    flat = rng.uniform(-1, 1, (100, 3)).astype(np.float32)
+    flat[:, 1] = 0.25
+    quantized, offset, extent = quantize_positions(flat)
+    assert np.all(dequantize_positions(quantized, offset, extent)[:, 1] == 0.25)
+    check_positions(flat)
+
+    # both hemispheres, the axes and the octahedron's edges
+    normals = np.concatenate([rng.normal(size=(100000, 3)), np.eye(3), -np.eye(3),
+                              [[1, 1, 0], [1, -1, 0], [-1, 1, 0], [-1, -1, 0], [1, 0, -1], [0, -1, -1]]])
+    check_normals(normals)
+
+    tex_coords = rng.uniform(-4, 4, (1000, 2)).astype(np.float32)
+    decoded = half_tex_coords(tex_coords).view(np.float16).astype(np.float32)
+    assert np.all(np.abs(decoded - tex_coords) <= np.abs(tex_coords) * 2.0 ** -11)
+
+
+def check_asset_manager(filename, expected):
+    '''
+    Load the model through the AssetManager in the packed layout and check it against the
+    model OBJModelDecoder(packed=True) uploaded.
+    '''
+    manager = AssetManager()
+    handle = manager.load_model(filename, batch=pyglet.graphics.Batch(), packed=True)
+    manager.finish()
+    model = handle.value
+    assert handle.ready and all(isinstance(group, PackedMaterialGroup) for group in model.groups), \
+        f'{filename}: AssetManager did not pack the model'
+    assert repr(model.vertex_stats) == repr(expected.vertex_stats)
+    for vertex_list in model.vertex_lists:
+        attributes = vertex_list.domain.attribute_names
+        assert sum(attribute.count * attribute.element_size for attribute in attributes.values()) == \
+            PACKED_VERTEX_SIZE, f'{filename}: AssetManager vertices are not in the packed format'
+    manager.shutdown()
+
+
+def draw_model(window, filename, packed, frames, target):
+    '''
+    Load and draw the model; returns the pixels, the model and the draw time.
+    '''
+    batch = pyglet.graphics.Batch()
+    model = pyglet.model.load(filename, decoder=OBJModelDecoder(packed=packed), batch=batch)
+    target.bind()
+    glClearColor(0, 0, 0, 1)
+    glEnable(GL_DEPTH_TEST)
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    batch.draw()
+    pixels = target.read_pixels()
+
+    target.bind()
+    start = time.perf_counter()
+    for _ in range(frames):
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        batch.draw()
+    glFinish()
+    elapsed = (time.perf_counter() - start) / frames
+    target.unbind()
+    return pixels, model, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=100)
+    args = parser.parse_args()
+
+    check_encodings(np.random.default_rng(1))
+
+    window = pyglet.window.Window(640, 480, visible=False)
+    window.projection = Mat4.perspective_projection(window.aspect_ratio, 0.01, 100, 60)
+    target = OffscreenTarget(640, 480)
+    for filename in MODELS:
+        mesh_list = load_obj_meshes(filename)
+        steps = max(check_positions(mesh.vertices, mesh.aabb) for mesh in mesh_list)
+        angle = max(check_normals(mesh.normals) for mesh in mesh_list)
+        extent = max(np.max(np.subtract(mesh.aabb[1], mesh.aabb[0])) for mesh in mesh_list)
+        print(f'{filename}: position error at most {steps:.3f} steps ({steps * extent / 65535:.2e} units), '
+              f'normal error at most {angle:.4f} degrees')
+
+        lower = np.min([mesh.aabb[0] for mesh in mesh_list], axis=0)
+        upper = np.max([mesh.aabb[1] for mesh in mesh_list], axis=0)
+        center, radius = Vec3(*(lower + upper) / 2), float(np.linalg.norm(upper - lower) / 2)
+        window.view = Mat4.look_at(center + Vec3(0.3, 0.4, 2.2) * radius, center, Vec3(0, 1, 0))
+
+        results = []
+        for packed in (False, True):
+            pixels, model, elapsed = draw_model(window, filename, packed, args.frames, target)
+            stats = model.vertex_stats
+            vertex_bytes = stats.indexed_bytes - 4 * sum(len(mesh.indices) for mesh in mesh_list)
+            label = 'packed' if packed else 'float'
+            print(f'    {label:>6}: {vertex_bytes / stats.unique_vertices:4.1f} bytes/vertex, '
+                  f'{stats.unique_vertices:,} vertices: {vertex_bytes / 1024:8.1f} KiB vertices, '
+                  f'{stats.indexed_bytes / 1024:8.1f} KiB with indices, {elapsed * 1e3:6.2f} ms/frame')
+            results.append(pixels)
+            if packed:
+                check_asset_manager(filename, model)
+
+        before, after = results
+        covered = before[..., :3].any(axis=2)
+        assert covered.sum() > 0.05 * covered.size, f'{filename}: nothing was drawn'
+        coverage = np.count_nonzero(covered != after[..., :3].any(axis=2))
+        difference = np.abs(before.astype(int) - after.astype(int))[..., :3]
+        # quantization moves edges by sub-pixel amounts only
+        assert coverage <= 0.002 * covered.sum(), f'{filename}: coverage differs in {coverage} pixels'
+        assert difference.mean() < 0.5, f'{filename}: mean difference {difference.mean():.2f}'
+        print(f'    image difference: {coverage} pixels of coverage, mean {difference.mean():.3f}, '
+              f'max {difference.max()}')
+    window.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Draw calls, shader binds, uniform uploads and group state changes per frame, and frame
+time, for the main.py scene and a 10,000-shape scene, drawn one group at a time (the
+previous behavior) and through the sorted render queue. Both must render the same image.
+
+    python -m benchmarks.render_queue [--frames 20] [--size 640 480]
+'''
+import argparse
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from benchmarks.frames import shapes_scene
+from headless import OffscreenTarget, render_frames
+from main import build_scene as main_scene
+from render import RenderWindow
+
+
+def run(build, queue, frames, size):
+    renderer = RenderWindow(*size, 'benchmark', visible=False)
+    build(renderer)
+    renderer.render_queue_enabled = queue
+    target = OffscreenTarget(*size)
+    renderer.toggle_profiler()
+    stats = render_frames(renderer, frames, target)
+    _, counts = renderer.profiler.summary(frames)
+    renderer.toggle_profiler()
+    # compare a frame without the overlay
+    render_frames(renderer, 1, target)
+    pixels = target.read_pixels()
+    renderer.close()
+    return stats, counts, pixels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480])
+    args = parser.parse_args()
+
+    for name, build in (('main', main_scene), ('shapes10k', shapes_scene(10000))):
+        images = []
+        for queue in (False, True):
+            stats, counts, pixels = run(build, queue, args.frames, args.size)
+            images.append(pixels)
+            label = 'render queue' if queue else 'per group   '
+            print(f'{name:>9}, {label}: ' + ', '.join(f'{counts.get(key, 0):7.0f} {key}' for key in
+                  ('draw calls', 'shader binds', 'uniform uploads', 'state changes')) +
+                  f', draw submit {np.mean(stats.draw_times) * 1e3:7.2f} ms')
+        assert np.array_equal(*images), f'{name}: the render queue changed the image'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+'''
+Load time of scene files (see scene.py) against the number of objects: reading the binary
+(.scene) and JSON variants, adding the objects with RenderWindow.load_scene (one
+add_shapes call) and, up to --imperative objects, with one add_shape call per object as
+main.py used to. The objects draw a cube, a sphere and the Stanford bunny, so the layouts
+share three meshes. Then the largest scene is streamed in with load_scene(stream=True)
+while frames are drawn, placed behind the camera so that only loading shows in the frame
+times next to those of the loaded scene. Loading must keep within the asset manager's
+budget, and no frame may stall for a BVH build (see RenderWindow.update_bvh) or a long
+full garbage collection (a shape adds one object for the collector to walk, see
+CustomGroup): the slowest frame takes at most three frames of the loaded scene plus 25 ms.
+
+Before measuring, scenes are checked to read back the same from both variants, TOML
+files to match JSON ones, composed matrices against pyglet's Mat4, bulk loading against
+add_shape (same transforms, bounds and image, one vertex list per mesh), streamed loading
+against bulk loading, and scenes/main.json against the scene main.py used to build.
+
+    python -m benchmarks.scene [--counts 1000 10000 100000] [--imperative 10000]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.gl import glFinish
+from pyglet.math import Mat4, Vec3
+
+from main import build_scene
+from benchmarks.frames import grid_positions
+from headless import OffscreenTarget
+from primitives import Cube, Sphere, geometry_cache
+from render import RenderWindow
+from scene import Scene, compose_matrices, read_scene, resolve_mesh, write_scene
+
+
+MESHES = {
+    'cube': {'primitive': 'Cube', 'args': [1.0]},
+    'sphere': {'primitive': 'Sphere', 'args': [16, 16]},
+    'bunny': {'obj': os.path.abspath('model/bunny.obj')},
+}
+
+
+def make_scene(count, behind=False):
+    '''
+    `count` objects on a grid in front of the camera (or behind it), with random rotations
+    and angular velocities; the bunnies are scaled up.
+    '''
+    rng = np.random.default_rng(count)
+    positions = grid_positions(count, 2.0)
+    if behind:
+        positions = positions * (1, 1, -1) + (0, 0, 10)
+    mesh_ids = np.arange(count) % len(MESHES)
+    scale = np.where(mesh_ids == 2, 8.0, 1.0)[:, None].repeat(3, axis=1)
+    matrices = compose_matrices(positions, rng.uniform(0, 360, (count, 3)), scale)
+    return Scene(MESHES, mesh_ids, matrices, rng.uniform(-1, 1, (count, 3)))
+
+
+def check_formats(directory):
+    layout = make_scene(1000)
+    for suffix in ('.scene', '.json'):
+        filename = os.path.join(directory, 'check' + suffix)
+        write_scene(filename, layout)
+        loaded = read_scene(filename)
+        assert loaded.meshes == layout.meshes, suffix
+        for name in ('mesh_ids', 'matrices', 'angular_velocity'):
+            assert np.array_equal(getattr(loaded, name), getattr(layout, name)), (suffix, name)
+    empty = os.path.join(directory, 'empty.scene')
+    write_scene(empty, Scene(MESHES, [], np.zeros((0, 16))))
+    assert len(read_scene(empty)) == 0
+
+    # hand-written text files, in either syntax
+    text = os.path.join(directory, 'check.toml')
+    with open(text, 'w') as f:
+        f.write('[meshes.cube]\nprimitive = "Cube"\nargs = [1.0]\n\n'
+                '[[objects]]\nmesh = "cube"\ntranslation = [1, 2, 3]\nrotation = [30, 45, 60]\nscale = [1, 2, 3]\n\n'
+                '[[objects]]\nmesh = "cube"\nmatrix = [2, 0, 0, 0, 0, 2, 0, 0, 0, 0, 2, 0, 4, 5, 6, 1]\n'
+                'angular_velocity = [0, 1, 0]\n')
+    toml_scene = read_scene(text)
+    with open(text[:-5] + '.json', 'w') as f:
+        f.write('{"meshes": {"cube": {"primitive": "Cube", "args": [1.0]}}, "objects": ['
+                '{"mesh": "cube", "translation": [1, 2, 3], "rotation": [30, 45, 60], "scale": [1, 2, 3]},'
+                '{"mesh": "cube", "matrix": [2, 0, 0, 0, 0, 2, 0, 0, 0, 0, 2, 0, 4, 5, 6, 1],'
+                ' "angular_velocity": [0, 1, 0]}]}')
+    json_scene = read_scene(text[:-5] + '.json')
+    assert np.array_equal(toml_scene.matrices, json_scene.matrices)
+    assert np.array_equal(toml_scene.angular_velocity, [[0, 0, 1], [0, 1, 0]])
+
+    # T @ Rz @ Ry @ Rx @ S, as pyglet composes it
+    radians = np.radians([30, 45, 60])
+    expected = (Mat4.from_translation(Vec3(1, 2, 3)) @ Mat4.from_rotation(radians[2], Vec3(0, 0, 1)) @
+                Mat4.from_rotation(radians[1], Vec3(0, 1, 0)) @ Mat4.from_rotation(radians[0], Vec3(1, 0, 0)) @
+                Mat4.from_scale(Vec3(1, 2, 3)))
+    assert np.allclose(toml_scene.matrices[0].ravel(), expected, atol=1e-6)
+    assert np.allclose(toml_scene.matrices[1].ravel(), Mat4.from_translation(Vec3(4, 5, 6)) @ Mat4.from_scale(
+        Vec3(2, 2, 2)))
+
+
+def draw(renderer, target):
+    renderer.switch_to()
+    target.bind()
+    renderer.update(0)
+    renderer.on_draw()
+    pixels = target.read_pixels()
+    target.unbind()
+    return pixels
+
+
+def check_loading(directory):
+    filename = os.path.join(directory, 'check.scene')
+    layout = read_scene(filename)
+    bulk = RenderWindow(320, 240, 'benchmark', visible=False)
+    indices = bulk.load_scene(filename)
+    assert indices.tolist() == list(range(len(layout)))
+
+    single = RenderWindow(320, 240, 'benchmark', visible=False)
+    meshes = [resolve_mesh(reference) for reference in layout.meshes.values()]
+    for mesh_id, matrix, angular_velocity in zip(layout.mesh_ids, layout.matrices, layout.angular_velocity):
+        single.add_shape(Mat4(matrix.ravel().tolist()), *meshes[mesh_id], angular_velocity=Vec3(*angular_velocity))
+
+    for name in ('transforms', 'bounds'):
+        for array in ('matrices', 'angular_velocity') if name == 'transforms' else ('centers', 'extents'):
+            assert np.array_equal(getattr(getattr(bulk, name), array), getattr(getattr(single, name), array)), array
+    assert np.array_equal(bulk.shape_triangles, single.shape_triangles)
+    assert len({id(shape.indexed_vertices_list) for shape in bulk.shapes}) == len(layout.meshes)
+    target = OffscreenTarget(320, 240)
+    assert np.array_equal(draw(bulk, target), draw(single, target)), 'bulk and single loading draw differently'
+    single.close()
+
+    streamed = RenderWindow(320, 240, 'benchmark', visible=False)
+    handle = streamed.load_scene(filename, stream=True)
+    assert len(handle.value) == 0
+    streamed.assets.finish()
+    assert handle.ready and np.array_equal(handle.value, indices)
+    assert np.array_equal(streamed.transforms.matrices, bulk.transforms.matrices)
+    assert np.array_equal(streamed.bounds.centers, bulk.bounds.centers)
+    assert np.array_equal(draw(streamed, target), draw(bulk, target)), 'streamed and bulk loading draw differently'
+    streamed.close()
+    bulk.close()
+
+    # the scene main.py used to build
+    renderer = RenderWindow(320, 240, 'benchmark', visible=False)
+    build_scene(renderer)
+    cube, sphere = geometry_cache.get(Cube, Vec3(1, 1, 1)), geometry_cache.get(Sphere, 30, 30)
+    large_cube = geometry_cache.get(Cube, Vec3(1.5, 1.5, 1.5))
+    assert all(mesh[0] is expected.vertices for mesh, expected in zip(renderer.meshes, (cube, sphere, large_cube)))
+    for matrix, x in zip(renderer.transforms.matrices, (-2, 0, 2)):
+        assert np.array_equal(matrix.ravel(), Mat4.from_translation(Vec3(x, 0, 0)))
+    assert np.array_equal(renderer.transforms.angular_velocity, [[0, 0, 1]] * 3)
+    renderer.close()
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def measure_loads(directory, count, imperative):
+    '''
+    Seconds to read the binary and JSON files, to load the binary file with load_scene
+    and, up to `imperative` objects, to read it and add its objects with one add_shape
+    call per object (None above). The meshes are resolved and uploaded by both loads.
+    '''
+    layout = make_scene(count)
+    binary, text = os.path.join(directory, f'{count}.scene'), os.path.join(directory, f'{count}.json')
+    write_scene(binary, layout)
+    write_scene(text, layout)
+    binary_read, _ = timed(lambda: read_scene(binary).matrices.sum())
+    text_read, _ = timed(lambda: read_scene(text))
+
+    renderer = RenderWindow(320, 240, 'benchmark', visible=False)
+    bulk, _ = timed(lambda: renderer.load_scene(binary))
+    renderer.close()
+
+    single = None
+    if count <= imperative:
+        renderer = RenderWindow(320, 240, 'benchmark', visible=False)
+
+        def add():
+            layout = read_scene(binary)
+            meshes = [resolve_mesh(reference) for reference in layout.meshes.values()]
+            for mesh_id, matrix, angular_velocity in zip(layout.mesh_ids.tolist(), layout.matrices,
+                                                         layout.angular_velocity):
+                renderer.add_shape(Mat4(matrix.ravel().tolist()), *meshes[mesh_id],
+                                   angular_velocity=Vec3(*angular_velocity))
+        single, _ = timed(add)
+        renderer.close()
+    return binary_read, text_read, bulk, single, os.path.getsize(binary), os.path.getsize(text)
+
+
+def stream_frames(filename):
+    renderer = RenderWindow(640, 480, 'benchmark', visible=False)
+    build_scene(renderer)
+    target = OffscreenTarget(*renderer.get_framebuffer_size())
+    renderer.switch_to()
+    target.bind()
+    for _ in range(3):
+        renderer.update(1 / 60)
+        renderer.on_draw()
+    glFinish()
+
+    def frame():
+        start = time.perf_counter()
+        renderer.update(1 / 60)
+        renderer.on_draw()
+        glFinish()
+        return time.perf_counter() - start
+
+    handle = renderer.load_scene(filename, stream=True)
+    frame_times, asset_times = [], []
+    while not handle.ready:
+        frame_times.append(frame())
+        asset_times.append(renderer.assets.update_time)
+        assert handle.error is None, handle.error
+    loaded_times = [frame() for _ in range(20)]
+    target.unbind()
+    count = len(handle.value)
+    budget = renderer.assets.budget
+    renderer.close()
+    return np.array(frame_times), np.array(asset_times), np.array(loaded_times), count, budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--imperative', type=int, default=10000,
+                        help='largest object count loaded with one add_shape call per object')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        check_formats(directory)
+        check_loading(directory)
+
+        print(f'{"objects":>9} {".scene":>9} {".json":>9} {"read .scene":>12} {"read .json":>11} '
+              f'{"load_scene":>11} {"add_shape":>10}')
+        for count in args.counts:
+            binary_read, text_read, bulk, single, binary_size, text_size = measure_loads(directory, count,
+                                                                                         args.imperative)
+            single = f'{single * 1e3:8.0f} ms' if single is not None else f'{"-":>10}'
+            print(f'{count:9,} {binary_size / 2 ** 20:5.1f} MiB {text_size / 2 ** 20:5.1f} MiB '
+                  f'{binary_read * 1e3:9.1f} ms {text_read * 1e3:8.0f} ms {bulk * 1e3:8.0f} ms {single}')
+
+        filename = os.path.join(directory, 'behind.scene')
+        write_scene(filename, make_scene(max(args.counts), behind=True))
+        frame_times, asset_times, loaded_times, count, budget = stream_frames(filename)
+        print(f'streaming {count:,} objects: {len(frame_times)} frames, frame time median '
+              f'{np.median(frame_times) * 1e3:.1f} ms, 95% {np.percentile(frame_times, 95) * 1e3:.1f} ms, '
+              f'max {frame_times.max() * 1e3:.1f} ms; loading median {np.median(asset_times) * 1e3:.1f} ms/frame, '
+              f'95% {np.percentile(asset_times, 95) * 1e3:.1f} ms; loaded scene {np.median(loaded_times) * 1e3:.1f} '
+              f'ms/frame')
+        # a step may start just before the budget runs out
+        assert np.median(asset_times) < 2 * budget, 'loading went over budget while streaming'
+        # frames share the CPU with BVH builds on a worker thread, but never wait for one
+        assert frame_times.max() < 3 * np.median(loaded_times) + 0.025, 'a frame stalled while streaming'
+
+
+if __name__ == '__main__':
+    main()
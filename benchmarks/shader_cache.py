@@ -0,0 +1,84 @@
+'''
+Scene startup time and per-frame uniform uploads for 1, 100 and 10,000 shapes, with the
+shared program registry and with one compiled program per shape (the previous behavior).
+
+    python -m benchmarks.shader_cache [--counts 1 100 10000] [--legacy-limit N]
+'''
+import argparse
+import time
+
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.graphics.shader import ShaderProgram
+from pyglet.math import Mat4, Vec3
+
+import shader
+from primitives import Cube
+from render import RenderWindow
+
+
+class UniformCounter:
+    '''
+    Counts uniform uploads by wrapping ShaderProgram.__setitem__.
+    '''
+    def __init__(self):
+        self.calls = 0
+        self._setitem = ShaderProgram.__setitem__
+
+    def __enter__(self):
+        def setitem(program, key, value):
+            self.calls += 1
+            self._setitem(program, key, value)
+        ShaderProgram.__setitem__ = setitem
+        return self
+
+    def __exit__(self, *exc_info):
+        ShaderProgram.__setitem__ = self._setitem
+
+
+def build_scene(count, shared):
+    shader._programs.clear()
+    get_program = shader.get_program
+    if not shared:
+        shader.get_program = shader.create_program
+
+    renderer = RenderWindow(320, 240, 'benchmark', visible=False)
+    cube = Cube(Vec3(1, 1, 1))
+    try:
+        start = time.perf_counter()
+        for i in range(count):
+            transform = Mat4.from_translation(Vec3(i % 100 - 50, 0, -(i // 100)))
+            renderer.add_shape(transform, cube.vertices, cube.indices, cube.colors)
+        startup = time.perf_counter() - start
+    finally:
+        shader.get_program = get_program
+    return renderer, startup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--legacy-limit', type=int, default=1000,
+                        help='skip the per-shape program path above this many shapes')
+    args = parser.parse_args()
+
+    for count in args.counts:
+        for shared in (False, True):
+            if not shared and count > args.legacy_limit:
+                continue
+            renderer, startup = build_scene(count, shared)
+            with UniformCounter() as counter:
+                start = time.perf_counter()
+                renderer.update(1 / 60)
+                update = time.perf_counter() - start
+            programs = len({shape.shader_program for shape in renderer.shapes})
+            label = 'shared   ' if shared else 'per-shape'
+            print(f'{count:>6} shapes, {label}: startup {startup * 1e3:9.1f} ms, {programs:>5} programs, '
+                  f'{counter.calls:>5} view_proj uploads/frame, update {update * 1e3:.2f} ms')
+            renderer.close()
+
+
+if __name__ == '__main__':
+    main()
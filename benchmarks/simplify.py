@@ -0,0 +1,130 @@
+'''
+Quadric error simplification of bunny.obj: speed per LOD ratio, LOD cache load times, and
+triangles per frame of a field of bunnies with and without per-frame LOD selection.
+
+Each level is checked first: it must hit its triangle target (at most the target, at least
+90% of it), keep the bounding box within 5% of the diagonal, and render a silhouette close
+to the full mesh: an IoU above 0.95 for the LOD chain ratios, and above 0.85 for the extra
+ratio 0.05 (0.867 on bunny.obj). LOD levels must not get finer with distance.
+
+    python -m benchmarks.simplify [--repeat 3] [--bunnies 100]
+'''
+import argparse
+import os
+import tempfile
+import shutil
+import time
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.math import Mat4, Vec3
+
+from benchmarks.frames import grid_positions
+from headless import OffscreenTarget, render_frames
+from model.obj import load_obj_meshes
+from model.simplify import LOD_RATIOS, load_obj_lods, simplify_obj_mesh
+from render import RenderWindow
+
+
+def shape_arrays(mesh):
+    # read-only arrays, so every bunny shares one uploaded vertex list per level
+    vertices = np.array(mesh.vertices, dtype=np.float32)
+    indices = np.array(mesh.indices, dtype=np.uint32)
+    colors = np.full((len(vertices) // 3, 4), 255, dtype=np.uint8)
+    colors[:, :3] = np.reshape(mesh.normals, (-1, 3)) * 127.5 + 127.5
+    colors = colors.ravel()
+    for array in (vertices, indices, colors):
+        array.flags.writeable = False
+    return vertices, indices, colors
+
+
+def silhouette(mesh, size=(320, 240)):
+    renderer = RenderWindow(*size, 'benchmark', visible=False)
+    renderer.add_shape(Mat4.from_translation(Vec3(0.3, -1.6, 2)) @ Mat4.from_scale(Vec3(15, 15, 15)),
+                       *shape_arrays(mesh), angular_velocity=Vec3(0, 0, 0))
+    target = OffscreenTarget(*size)
+    render_frames(renderer, 1, target)
+    mask = target.read_pixels()[..., :3].any(axis=2)
+    renderer.close()
+    return mask
+
+
+def check_levels(mesh):
+    base_low, base_high = np.reshape(mesh.vertices, (-1, 3)).min(axis=0), np.reshape(mesh.vertices, (-1, 3)).max(axis=0)
+    diagonal = np.linalg.norm(base_high - base_low)
+    base_mask = silhouette(mesh)
+    assert base_mask.any()
+    for ratio in LOD_RATIOS[1:] + (0.05,):
+        target = int(len(mesh.indices) // 3 * ratio)
+        level = simplify_obj_mesh(mesh, ratio)
+        triangles = len(level.indices) // 3
+        assert 0.9 * target <= triangles <= target, (ratio, triangles, target)
+        points = np.reshape(level.vertices, (-1, 3))
+        assert np.abs(points.min(axis=0) - base_low).max() < 0.05 * diagonal
+        assert np.abs(points.max(axis=0) - base_high).max() < 0.05 * diagonal
+        mask = silhouette(level)
+        iou = np.count_nonzero(mask & base_mask) / np.count_nonzero(mask | base_mask)
+        print(f'  ratio {ratio:<6g} {triangles:>5} / {target:>5} triangles, silhouette IoU {iou:.3f}')
+        assert iou > (0.95 if ratio in LOD_RATIOS else 0.85), (ratio, iou)
+
+
+def lod_field(bunnies, lods):
+    renderer = RenderWindow(640, 480, 'benchmark', visible=False)
+    levels = [shape_arrays(level[0]) for level in lods]
+    for x, y, z in grid_positions(bunnies, 0.4):
+        transform = Mat4.from_translation(Vec3(x, y, z)) @ Mat4.from_scale(Vec3(2, 2, 2))
+        renderer.add_shape(transform, *levels[0], lods=levels[1:] if len(levels) > 1 else None)
+    return renderer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--bunnies', type=int, default=100)
+    args = parser.parse_args()
+
+    mesh = load_obj_meshes('model/bunny.obj')[0]
+    print(f'bunny.obj: {len(mesh.indices) // 3} triangles')
+    check_levels(mesh)
+
+    for ratio in LOD_RATIOS[1:]:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            simplify_obj_mesh(mesh, ratio)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f'simplify to {ratio:g}: {elapsed * 1e3:7.1f} ms, '
+              f'{(len(mesh.indices) // 3) / elapsed:10,.0f} input triangles/s')
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'bunny.obj')
+        shutil.copy('model/bunny.obj', filename)
+        start = time.perf_counter()
+        lods = load_obj_lods(filename)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        load_obj_lods(filename)
+        warm = time.perf_counter() - start
+    print(f'LOD chain {LOD_RATIOS}: cold {cold * 1e3:.1f} ms, warm (cached) {warm * 1e3:.2f} ms')
+
+    renderer = lod_field(args.bunnies, lods)
+    render_frames(renderer, 1)
+    distances = np.linalg.norm(renderer.bounds.world(renderer.transforms.matrices)[0] -
+                               np.array(renderer.cam_eye), axis=1)
+    order = np.argsort(distances)
+    assert np.all(np.diff(renderer.lod_levels[order]) >= 0), 'LOD levels must not get finer with distance'
+    counts = np.bincount(renderer.lod_levels, minlength=len(lods))
+    with_lod = renderer.triangle_count
+    renderer.close()
+
+    renderer = lod_field(args.bunnies, lods[:1])
+    render_frames(renderer, 1)
+    print(f'{args.bunnies} bunnies: {renderer.triangle_count:,} -> {with_lod:,} triangles/frame with LOD '
+          f'(shapes per level {counts.tolist()})')
+    renderer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+'''
+Software rasterizer (software.SoftwareRenderer) throughput on the scene of main.py and on
+N copies of the Stanford bunny, in frames/s, triangles/s and written pixels/s, with 1, 2,
+4 and one worker thread per CPU.
+
+Before timing, single triangles are checked for the fill rule and face culling, frames
+with any number of workers against one worker, and the scenes, plus views with the camera
+close enough to clip shapes at the near plane, against RenderWindow rendering them with
+OpenGL (skipped with --no-reference, e.g. on nodes without a GPU).
+
+    python -m benchmarks.software [--frames 20] [--bunnies 16] [--size 1280 720] [--no-reference]
+'''
+import argparse
+import os
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.math import Mat4, Vec3
+
+from benchmarks.frames import bunny_scene
+from main import build_scene as main_scene
+from software import SoftwareRenderer, render_frames
+
+
+def check_triangles():
+    renderer = SoftwareRenderer(8, 8, workers=1)
+    renderer.view_mat, renderer.proj_mat = Mat4(), Mat4()
+    # two counter-clockwise triangles splitting the viewport along its diagonal, in
+    # clip space, then the first again clockwise
+    vertices = np.array([-1, -1, 0, 1, -1, 0, 1, 1, 0, -1, 1, 0], dtype=np.float32)
+    colors = np.array([255, 0, 0, 255] * 4, dtype=np.uint8)
+    renderer.add_shape(Mat4(), vertices, np.array([0, 1, 2, 0, 2, 3], dtype=np.uint32), colors, Vec3(0, 0, 0))
+    pixels = renderer.render()
+    # the shared edge runs through pixel centers: every pixel is covered exactly once
+    assert np.all(pixels == (255, 0, 0, 255)) and renderer.fragment_count == 64, renderer.fragment_count
+
+    renderer.meshes[0] = (vertices, np.array([0, 2, 1], dtype=np.uint32), colors)
+    assert not renderer.render().any() and renderer.raster_triangles == 0, 'back face was drawn'
+
+
+def gl_reference(build, size, views):
+    '''
+    Frames of the scene built by `build` rendered by RenderWindow with OpenGL from every
+    (eye, target) of `views`, each with the SoftwareRenderer's frame of the same scene.
+    '''
+    from headless import OffscreenTarget
+    from headless import render_frames as render_gl_frames
+    from render import RenderWindow
+
+    window = RenderWindow(*size, 'benchmark', visible=False)
+    build(window)
+    target = OffscreenTarget(*size)
+    frames = []
+    for eye, camera_target in views:
+        window.cam_eye, window.cam_target = eye, camera_target
+        window.setup()
+        render_gl_frames(window, 1, target, dt=0)
+        renderer = SoftwareRenderer.from_window(window)
+        frames.append((target.read_pixels(), renderer.render().copy(), renderer))
+    window.close()
+    return frames
+
+
+def check_reference(name, build, size, views):
+    for gl, software, renderer in gl_reference(build, size, views):
+        covered = gl[..., 3] > 0
+        assert covered.sum() > 0.001 * covered.size, f'{name}: nothing was rendered'
+        # the same pixels are covered, and colors differ at most by rounding except
+        # where depths within a rounding step of each other are resolved differently
+        assert np.array_equal(covered, software[..., 3] > 0), f'{name}: coverage differs'
+        difference = np.abs(gl.astype(int) - software.astype(int)).max(axis=2)
+        different = np.count_nonzero(difference > 2)
+        assert different <= 0.001 * covered.sum(), f'{name}: {different} pixels differ'
+        print(f'{name}: {renderer.triangle_count} triangles, {renderer.fragment_count} pixels match OpenGL '
+              f'({different} differ by more than 2, max difference {difference.max()})')
+
+
+def check_workers(build, size):
+    images = []
+    for workers in (1, 3):
+        renderer = SoftwareRenderer(*size, workers=workers)
+        build(renderer)
+        images.append(renderer.render().copy())
+        renderer.close()
+    assert np.array_equal(*images), 'frames depend on the number of workers'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--bunnies', type=int, default=16)
+    parser.add_argument('--size', type=int, nargs=2, default=[1280, 720])
+    parser.add_argument('--no-reference', action='store_true', help='skip the comparison with OpenGL')
+    args = parser.parse_args()
+
+    scenes = {'main': main_scene, 'bunny': bunny_scene(args.bunnies)}
+    check_triangles()
+    check_workers(main_scene, args.size)
+    if not args.no_reference:
+        check_reference('main', main_scene, args.size,
+                        [(Vec3(0, 2, 4), Vec3(0, 0, 0)), (Vec3(0.2, 0.1, 1.02), Vec3(0, 0, 0)),
+                         (Vec3(-2, 0.5, 0.6), Vec3(2, 0, 0))])
+        check_reference('bunny', scenes['bunny'], args.size, [(Vec3(0, 2, 4), Vec3(0, 0, 0))])
+
+    cpus = os.cpu_count()
+    print(f'{cpus} CPUs')
+    for name, build in scenes.items():
+        for workers in sorted({1, 2, 4, cpus}):
+            renderer = SoftwareRenderer(*args.size, workers=workers)
+            build(renderer)
+            renderer.animate = True
+            stats = render_frames(renderer, args.frames)
+            print(f'{name:>6}, {workers:2} workers ({renderer.triangle_count:>7,} triangles/frame): '
+                  f'{stats.fps:6.1f} fps, {stats.triangles_per_second / 1e6:6.2f} Mtris/s, '
+                  f'{renderer.fragment_count * stats.fps / 1e6:6.1f} Mpixels/s')
+            renderer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+GPU memory and frame time of a static scene of 10,000 cubes, drawn per shape (one vertex
+list per cube, or one shared cached mesh) and frozen into a single world-space mesh with
+RenderWindow.freeze_static. Culling is off so all paths draw every cube; the frozen mesh
+must render the same image as the per-shape path.
+
+    python -m benchmarks.static [--count 10000] [--frames 20] [--size 640 480]
+'''
+import argparse
+
+import numpy as np
+import pyglet
+
+pyglet.options['headless'] = True
+
+from pyglet.math import Mat4, Vec3
+
+from benchmarks.frames import grid_positions
+from headless import OffscreenTarget, render_frames
+from primitives import Cube, geometry_cache
+from render import RenderWindow
+
+
+def vertex_list_bytes(renderer):
+    # float32 positions, four normalized bytes of color and uint32 indices per list
+    lists = {id(shape.indexed_vertices_list): shape.indexed_vertices_list for shape in renderer.shapes}
+    return sum(vertex_list.count * 16 + vertex_list.index_count * 4 for vertex_list in lists.values())
+
+
+def run(count, cached, frozen, frames, size):
+    renderer = RenderWindow(*size, 'benchmark', visible=False)
+    renderer.frustum_culling = False
+    cube = geometry_cache.get(Cube, 1.0) if cached else Cube(1.0)
+    for x, y, z in grid_positions(count, 2.0):
+        renderer.add_shape(Mat4.from_translation(Vec3(x, y, z)), cube.vertices, cube.indices, cube.colors)
+    if frozen:
+        renderer.freeze_static()
+        nbytes = renderer.static_mesh.nbytes
+    else:
+        nbytes = vertex_list_bytes(renderer)
+    target = OffscreenTarget(*size)
+    stats = render_frames(renderer, frames, target)
+    pixels = target.read_pixels()
+    renderer.close()
+    return nbytes, stats, pixels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--size', type=int, nargs=2, default=[640, 480])
+    args = parser.parse_args()
+
+    images = []
+    for label, cached, frozen in (('per shape, own lists  ', False, False),
+                                  ('per shape, shared mesh', True, False),
+                                  ('frozen static mesh    ', True, True)):
+        nbytes, stats, pixels = run(args.count, cached, frozen, args.frames, args.size)
+        images.append(pixels)
+        print(f'{args.count} cubes, {label}: {nbytes / 1024:9,.1f} KiB, '
+              f'draw submit {np.mean(stats.draw_times) * 1e3:7.2f} ms, frame {1e3 / stats.fps:7.2f} ms')
+    assert np.array_equal(images[0], images[2]), 'the frozen mesh changed the image'
+
+
+if __name__ == '__main__':
+    main()
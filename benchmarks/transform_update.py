@@ -0,0 +1,48 @@
+'''
+Cost of one animation tick versus shape count: the previous per-shape Mat4 loop of
+RenderWindow.update against TransformStore.step. Needs no display or GL context.
+
+    python -m benchmarks.transform_update [--counts 100 1000 10000 100000]
+'''
+import argparse
+import time
+
+from pyglet.math import Mat4, Vec3
+
+from transforms import TransformStore
+
+
+def per_shape_update(matrices, dt):
+    for i in range(len(matrices)):
+        rotate_mat = Mat4.from_rotation(angle=dt, vector=Vec3(0, 0, 1))
+        matrices[i] @= rotate_mat
+
+
+def best_time(function, *args, runs=5):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    args = parser.parse_args()
+
+    for count in args.counts:
+        transforms = [Mat4.from_translation(Vec3(i % 100, 0, -(i // 100))) for i in range(count)]
+        store = TransformStore()
+        for transform in transforms:
+            store.add(transform)
+
+        loop = best_time(per_shape_update, transforms, 1 / 60)
+        batched = best_time(store.step, 1 / 60)
+        print(f'{count:>7} shapes: per-shape loop {loop * 1e3:8.2f} ms, '
+              f'TransformStore.step {batched * 1e3:6.2f} ms, speedup {loop / batched:.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import numpy as np
+
+from culling import aabbs_in_frustum
+
+
+def _spread_bits(values):
+    '''
+    Insert two zero bits between each of the low 10 bits, for 30-bit 3D Morton codes.
+    '''
+    v = values.astype(np.uint64)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x030000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x0300F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x030C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x09249249)
+    return v
+
+
+def morton_codes(points):
+    '''
+    Morton (Z-order) codes of (N, 3) points, quantized to 1024 steps over their bounding box.
+    '''
+    low, high = points.min(axis=0), points.max(axis=0)
+    scale = np.where(high > low, high - low, 1)
+    cells = np.clip((points - low) / scale * 1023, 0, 1023)
+    x, y, z = _spread_bits(cells).T
+    return (x << np.uint64(2)) | (y << np.uint64(1)) | z
+
+
+def ray_aabbs(origin, direction, lo, hi):
+    '''
+    Slab test of one ray against (N, 3) boxes. Returns the hit mask and the entry distance
+    along the ray (0 when the origin is inside the box).
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = 1 / direction
+        t1 = (lo - origin) * inv
+        t2 = (hi - origin) * inv
+    t_near = np.maximum(np.fmin(t1, t2).max(axis=1), 0)
+    t_far = np.fmax(t1, t2).min(axis=1)
+    return t_far >= t_near, t_near
+
+
+def ray_triangles(origin, direction, triangles):
+    '''
+    Möller-Trumbore test of one ray against (N, 3, 3) triangles, both faces.
+    Returns the distance to the nearest hit along the ray, or None.
+    '''
+    edge1 = triangles[:, 1] - triangles[:, 0]
+    edge2 = triangles[:, 2] - triangles[:, 0]
+    p = np.cross(direction, edge2)
+    det = np.einsum('ij,ij->i', edge1, p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_det = 1 / det
+        s = origin - triangles[:, 0]
+        u = np.einsum('ij,ij->i', s, p) * inv_det
+        q = np.cross(s, edge1)
+        v = (q @ direction) * inv_det
+        t = np.einsum('ij,ij->i', edge2, q) * inv_det
+        hit = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    if not hit.any():
+        return None
+    return float(t[hit].min())
+
+
+class BVH:
+    '''
+    Bounding volume hierarchy over N axis-aligned boxes, for ray and frustum queries.
+
+    Boxes are sorted along a Morton curve and grouped into leaves of `leaf_size`; each
+    level above pairs up the nodes of the level below, so the tree is implicit: node i
+    has children 2i and 2i + 1, and covers a contiguous range of the sorted boxes.
+    Every level is one (lo, hi) array pair, so building, refitting and querying all
+    work a whole level at a time with NumPy.
+    '''
+    def __init__(self, lo, hi, leaf_size=4):
+        self.leaf_size = leaf_size
+        self.build(lo, hi)
+
+    @property
+    def count(self):
+        return len(self.order)
+
+    def build(self, lo, hi):
+        lo = np.asarray(lo, dtype=np.float32)
+        hi = np.asarray(hi, dtype=np.float32)
+        self.order = np.argsort(morton_codes((lo + hi) / 2), kind='stable') if len(lo) else np.zeros(0, np.int64)
+        self.slots = np.empty_like(self.order)
+        self.slots[self.order] = np.arange(len(self.order))
+
+        # Sorted boxes, padded with empty boxes up to whole leaves
+        leaves = max(1, -(-len(lo) // self.leaf_size))
+        self._lo = np.full((leaves * self.leaf_size, 3), np.inf, dtype=np.float32)
+        self._hi = np.full((leaves * self.leaf_size, 3), -np.inf, dtype=np.float32)
+        self._lo[:len(lo)] = lo[self.order]
+        self._hi[:len(hi)] = hi[self.order]
+        self.sorted_count = len(lo)
+        self._build_levels(leaves)
+
+    def append(self, lo, hi):
+        '''
+        Add boxes after the last sorted one, in their given order, so only the nodes above
+        them are built. Like refit, this keeps queries correct but makes them looser the more
+        boxes are appended; build again once they outnumber the sorted ones.
+        '''
+        lo = np.asarray(lo, dtype=np.float32)
+        hi = np.asarray(hi, dtype=np.float32)
+        start = self.count
+        added = np.arange(start, start + len(lo))
+        self.order = np.concatenate([self.order, added])
+        self.slots = np.concatenate([self.slots, added])
+
+        leaves = max(1, -(-self.count // self.leaf_size))
+        old_lo, old_hi = self._lo, self._hi
+        self._lo = np.full((leaves * self.leaf_size, 3), np.inf, dtype=np.float32)
+        self._hi = np.full((leaves * self.leaf_size, 3), -np.inf, dtype=np.float32)
+        self._lo[:start], self._hi[:start] = old_lo[:start], old_hi[:start]
+        self._lo[start:self.count], self._hi[start:self.count] = lo, hi
+        # only the nodes above the leaf holding the first new box change
+        self._build_levels(leaves, start // self.leaf_size)
+
+    def _build_levels(self, leaves, first=0):
+        # levels[0] holds the leaves and levels[-1] the root; every level but the root is
+        # padded to an even length with empty boxes. The nodes over leaves before `first`
+        # are unchanged and copied from the previous levels.
+        previous = self.levels if first else []
+        self.levels = []
+        self.sizes = []
+        level_lo = np.empty((leaves, 3), dtype=np.float32)
+        level_hi = np.empty((leaves, 3), dtype=np.float32)
+        level_lo[first:] = self._lo[first * self.leaf_size:].reshape(-1, self.leaf_size, 3).min(axis=1)
+        level_hi[first:] = self._hi[first * self.leaf_size:].reshape(-1, self.leaf_size, 3).max(axis=1)
+        while True:
+            if first:
+                old_lo, old_hi = previous[len(self.levels)]
+                level_lo[:first], level_hi[:first] = old_lo[:first], old_hi[:first]
+            size = len(level_lo)
+            if size > 1 and size % 2:
+                level_lo = np.vstack([level_lo, np.full((1, 3), np.inf, np.float32)])
+                level_hi = np.vstack([level_hi, np.full((1, 3), -np.inf, np.float32)])
+            self.levels.append((level_lo, level_hi))
+            self.sizes.append(size)
+            if size == 1:
+                break
+            first //= 2
+            child_lo, child_hi = level_lo, level_hi
+            level_lo = np.empty((len(child_lo) // 2, 3), dtype=np.float32)
+            level_hi = np.empty((len(child_hi) // 2, 3), dtype=np.float32)
+            level_lo[first:] = child_lo[2 * first:].reshape(-1, 2, 3).min(axis=1)
+            level_hi[first:] = child_hi[2 * first:].reshape(-1, 2, 3).max(axis=1)
+
+    def refit(self, indices, lo, hi):
+        '''
+        Move the boxes `indices` to new bounds and update the nodes above them only.
+        The tree topology is kept, so queries stay correct but get looser as boxes travel;
+        build again after large movements.
+        '''
+        slots = self.slots[indices]
+        self._lo[slots] = lo
+        self._hi[slots] = hi
+        dirty = np.unique(slots // self.leaf_size)
+        leaf_lo = self._lo.reshape(-1, self.leaf_size, 3)
+        leaf_hi = self._hi.reshape(-1, self.leaf_size, 3)
+        self.levels[0][0][dirty] = leaf_lo[dirty].min(axis=1)
+        self.levels[0][1][dirty] = leaf_hi[dirty].max(axis=1)
+        for (child_lo, child_hi), (level_lo, level_hi) in zip(self.levels, self.levels[1:]):
+            dirty = np.unique(dirty // 2)
+            level_lo[dirty] = np.minimum(child_lo[2 * dirty], child_lo[2 * dirty + 1])
+            level_hi[dirty] = np.maximum(child_hi[2 * dirty], child_hi[2 * dirty + 1])
+
+    def _children(self, nodes, level):
+        children = (2 * nodes[:, None] + np.arange(2)).ravel()
+        return children[children < self.sizes[level]]
+
+    def _boxes(self, nodes):
+        boxes = (nodes[:, None] * self.leaf_size + np.arange(self.leaf_size)).ravel()
+        return boxes[boxes < self.count]
+
+    def ray_query(self, origin, direction):
+        '''
+        Indices of the boxes hit by the ray, nearest entry first, with their entry distances.
+        '''
+        origin = np.asarray(origin, dtype=np.float32)
+        direction = np.asarray(direction, dtype=np.float32)
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(len(self.levels) - 1, -1, -1):
+            if level < len(self.levels) - 1:
+                nodes = self._children(nodes, level)
+            hit, _ = ray_aabbs(origin, direction, *(bounds[nodes] for bounds in self.levels[level]))
+            nodes = nodes[hit]
+        boxes = self._boxes(nodes)
+        hit, t_near = ray_aabbs(origin, direction, self._lo[boxes], self._hi[boxes])
+        boxes, t_near = boxes[hit], t_near[hit]
+        nearest = np.argsort(t_near, kind='stable')
+        return self.order[boxes[nearest]], t_near[nearest]
+
+    def frustum_query(self, planes):
+        '''
+        Boolean mask of the boxes at least partly inside the frustum `planes` (see
+        culling.frustum_planes). Subtrees entirely inside are accepted without descending.
+        '''
+        visible = np.zeros(self.count, dtype=bool)
+        if not self.count:
+            # the root of an empty tree is an empty (inf, -inf) box
+            return visible
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(len(self.levels) - 1, -1, -1):
+            if level < len(self.levels) - 1:
+                nodes = self._children(nodes, level)
+            lo, hi = (bounds[nodes] for bounds in self.levels[level])
+            centers, extents = (lo + hi) / 2, (hi - lo) / 2
+            distances = centers @ planes[:, :3].T + planes[:, 3]
+            radii = extents @ np.abs(planes[:, :3]).T
+            inside = np.all(distances - radii >= 0, axis=1)
+            span = self.leaf_size << level
+            for node in nodes[inside]:
+                visible[self.order[node * span:(node + 1) * span]] = True
+            nodes = nodes[~inside & np.all(distances + radii >= 0, axis=1)]
+        boxes = self._boxes(nodes)
+        lo, hi = self._lo[boxes], self._hi[boxes]
+        visible[self.order[boxes]] = aabbs_in_frustum((lo + hi) / 2, (hi - lo) / 2, planes)
+        return visible
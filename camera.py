@@ -0,0 +1,148 @@
+import numpy as np
+from pyglet.math import Mat4, Vec3
+
+
+# Orbiting stops this far (radians) from looking straight up or down along `up`
+PITCH_LIMIT = 0.01
+
+# The eye never zooms closer to the target than this
+MIN_DISTANCE = 1e-3
+
+
+def _array(vector):
+    return np.array(vector, dtype=np.float64)
+
+
+def _vec3(array):
+    return Vec3(*(float(value) for value in array))
+
+
+def _normalized(vector):
+    length = np.linalg.norm(vector)
+    return vector / length if length > 0 else vector
+
+
+class _Parameter:
+    '''
+    A camera parameter; setting it to a new value marks the view or the projection matrix
+    (`matrix`) as stale.
+    '''
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __set_name__(self, owner, name):
+        self.name = '_' + name
+
+    def __get__(self, camera, owner=None):
+        return self if camera is None else getattr(camera, self.name)
+
+    def __set__(self, camera, value):
+        if getattr(camera, self.name) != value:
+            setattr(camera, self.name, value)
+            camera.invalidate(self.matrix)
+
+
+class Camera:
+    '''
+    Perspective camera looking from `eye` at `target`. The view, projection and view-proj
+    matrices are cached: they are rebuilt on first use after a parameter they depend on
+    changed, so a camera that holds still costs nothing per frame. `version` is bumped on
+    every change, which lets consumers (shader uniforms, culling) skip work as long as it
+    stays the same; `rebuilds` counts the matrices actually rebuilt.
+    '''
+    eye = _Parameter('view')
+    target = _Parameter('view')
+    up = _Parameter('view')
+    fov = _Parameter('projection')
+    aspect = _Parameter('projection')
+    z_near = _Parameter('projection')
+    z_far = _Parameter('projection')
+
+    def __init__(self, eye=Vec3(0, 2, 4), target=Vec3(0, 0, 0), up=Vec3(0, 1, 0),
+                 fov=60, aspect=1.0, z_near=0.1, z_far=100):
+        self._eye, self._target, self._up = eye, target, up
+        self._fov, self._aspect, self._z_near, self._z_far = fov, aspect, z_near, z_far
+        self._view = self._projection = self._view_proj = None
+        self.version = 0
+        self.rebuilds = 0
+
+    def invalidate(self, matrix='view'):
+        if matrix == 'view':
+            self._view = None
+        else:
+            self._projection = None
+        self._view_proj = None
+        self.version += 1
+
+    @property
+    def view(self) -> Mat4:
+        if self._view is None:
+            self._view = Mat4.look_at(self._eye, target=self._target, up=self._up)
+            self.rebuilds += 1
+        return self._view
+
+    @property
+    def projection(self) -> Mat4:
+        if self._projection is None:
+            self._projection = Mat4.perspective_projection(
+                aspect=self._aspect, z_near=self._z_near, z_far=self._z_far, fov=self._fov)
+            self.rebuilds += 1
+        return self._projection
+
+    @property
+    def view_proj(self) -> Mat4:
+        if self._view_proj is None:
+            self._view_proj = self.projection @ self.view
+            self.rebuilds += 1
+        return self._view_proj
+
+    def look_at(self, eye, target, up=None) -> None:
+        self.eye, self.target = eye, target
+        if up is not None:
+            self.up = up
+
+    def orbit(self, yaw, pitch) -> None:
+        '''
+        Turn the eye about the target by `yaw` radians around `up` and `pitch` radians
+        towards it, keeping the distance and stopping short of the poles.
+        '''
+        eye, target, up = _array(self._eye), _array(self._target), _normalized(_array(self._up))
+        offset = eye - target
+        distance = np.linalg.norm(offset)
+        if distance == 0 or (yaw == 0 and pitch == 0):
+            return
+        direction = offset / distance
+        # angle from the up axis, and the horizontal direction around it
+        polar = np.arccos(np.clip(direction @ up, -1, 1))
+        polar = np.clip(polar - pitch, PITCH_LIMIT, np.pi - PITCH_LIMIT)
+        horizontal = _normalized(direction - (direction @ up) * up)
+        if not horizontal.any():
+            horizontal = _normalized(np.cross(up, [1.0, 0.0, 0.0] if abs(up[0]) < 0.9 else [0.0, 0.0, 1.0]))
+        side = np.cross(up, horizontal)
+        horizontal = horizontal * np.cos(yaw) + side * np.sin(yaw)
+        direction = up * np.cos(polar) + horizontal * np.sin(polar)
+        self.eye = _vec3(target + direction * distance)
+
+    def pan(self, right, up) -> None:
+        '''
+        Move the eye and the target together by `right` and `up`, in fractions of the
+        view height at the target's distance.
+        '''
+        eye, target = _array(self._eye), _array(self._target)
+        forward = target - eye
+        height = 2 * np.linalg.norm(forward) * np.tan(np.radians(self._fov) / 2)
+        side = _normalized(np.cross(forward, _array(self._up)))
+        vertical = _normalized(np.cross(side, forward))
+        offset = (side * right + vertical * up) * height
+        self.look_at(_vec3(eye + offset), _vec3(target + offset))
+
+    def zoom(self, factor) -> None:
+        '''
+        Scale the distance between the eye and the target by `factor`.
+        '''
+        eye, target = _array(self._eye), _array(self._target)
+        offset = eye - target
+        distance = np.linalg.norm(offset)
+        if distance == 0 or factor == 1:
+            return
+        self.eye = _vec3(target + offset * max(factor, MIN_DISTANCE / distance))
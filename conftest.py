@@ -0,0 +1,4 @@
+import pyglet
+
+# the tests run without a display, like the benchmarks
+pyglet.options['headless'] = True
@@ -4,10 +4,20 @@ from pyglet.window import mouse,key
 from pyglet.math import Mat4, Vec3
 
 
+# Camera orbit in radians per pixel of mouse drag, and per arrow key press
+ORBIT_SPEED = 0.01
+ORBIT_STEP = 0.1
+
+# Camera distance factor per scroll wheel step
+ZOOM_STEP = 0.9
+
 
 class Control:
     """
     Control class controls keyboard & mouse inputs.
+    Camera input is accumulated while events arrive and applied to the window's camera
+    once per frame (update), so a burst of mouse-drag events costs one camera update and
+    one redraw.
     """
     def __init__(self, window):
         window.on_key_press = self.on_key_press
@@ -17,43 +27,84 @@ class Control:
         window.on_mouse_press = self.on_mouse_press
         window.on_mouse_release = self.on_mouse_release
         window.on_mouse_scroll = self.on_mouse_scroll
+        window.controller = self
         self.window = window
         self.setup()
 
     def setup(self):
-        pass
+        # input events received, and camera updates they were applied in
+        self.events = 0
+        self.updates = 0
+        self.clear_input()
 
-    def update(self, vector):
-        pass
+    def clear_input(self):
+        # pending camera input: orbit (yaw, pitch) in radians, pan in fractions of the view
+        # height, zoom as a distance factor
+        self.orbit = [0.0, 0.0]
+        self.pan = [0.0, 0.0]
+        self.zoom = 1.0
+
+    def update(self, dt):
+        '''
+        Apply the input received since the last frame to the camera.
+        '''
+        if self.orbit == [0.0, 0.0] and self.pan == [0.0, 0.0] and self.zoom == 1.0:
+            return
+        camera = self.window.camera
+        camera.orbit(*self.orbit)
+        camera.pan(*self.pan)
+        camera.zoom(self.zoom)
+        self.updates += 1
+        self.clear_input()
 
     def on_key_press(self, symbol, modifier):
-        # TODO:
-        pass
-    
+        steps = {key.LEFT: (-ORBIT_STEP, 0), key.RIGHT: (ORBIT_STEP, 0),
+                 key.UP: (0, ORBIT_STEP), key.DOWN: (0, -ORBIT_STEP)}
+        if symbol in steps:
+            self.orbit[0] += steps[symbol][0]
+            self.orbit[1] += steps[symbol][1]
+            self.events += 1
+            self.window.input_received()
+
     def on_key_release(self, symbol, modifier):
         if symbol == pyglet.window.key.ESCAPE:
             pyglet.app.exit()
         elif symbol == pyglet.window.key.SPACE:
             self.window.animate = not self.window.animate
-        # TODO:
-        pass
+            self.window.invalidate()
+        elif symbol == pyglet.window.key.P:
+            # frame profiler overlay on/off
+            self.window.toggle_profiler()
+        elif symbol == pyglet.window.key.T:
+            # save the recorded frames for chrome://tracing or Perfetto
+            self.window.profiler.dump_chrome_trace('trace.json')
 
     def on_mouse_motion(self, x, y, dx, dy):
         # TODO:
         pass
 
     def on_mouse_press(self, x, y, button, modifier):
-        # TODO:
-        pass
+        if button == mouse.LEFT:
+            self.window.selected = self.window.pick(x, y)
 
     def on_mouse_release(self, x, y, button, modifier):
         # TODO:
         pass
 
     def on_mouse_drag(self, x, y, dx, dy, button, modifier):
-        # TODO:
-        pass
+        # left button orbits about the target, right (or middle) button pans
+        if button & mouse.LEFT:
+            self.orbit[0] -= dx * ORBIT_SPEED
+            self.orbit[1] -= dy * ORBIT_SPEED
+        elif button & (mouse.RIGHT | mouse.MIDDLE):
+            self.pan[0] -= dx / self.window.height
+            self.pan[1] -= dy / self.window.height
+        else:
+            return
+        self.events += 1
+        self.window.input_received()
 
     def on_mouse_scroll(self, x, y, scroll_x, scroll_y):
-        # TODO:
-        pass
\ No newline at end of file
+        self.zoom *= ZOOM_STEP ** scroll_y
+        self.events += 1
+        self.window.input_received()
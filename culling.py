@@ -0,0 +1,87 @@
+import numpy as np
+
+from store import ArrayStore, array_property
+
+
+def frustum_planes(view_proj):
+    '''
+    The six clip planes (a, b, c, d) of a view-projection Mat4, normalized and pointing
+    inwards (Gribb & Hartmann): a point is inside when a*x + b*y + c*z + d >= 0 for all six.
+    '''
+    m = np.array(view_proj, dtype=np.float64).reshape(4, 4).T    # Mat4 is column-major
+    planes = np.array([m[3] + m[0], m[3] - m[0],     # left, right
+                       m[3] + m[1], m[3] - m[1],     # bottom, top
+                       m[3] + m[2], m[3] - m[2]])    # near, far
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def aabb_from_vertices(vertices):
+    '''
+    Axis-aligned bounding box (min, max) of a flat x, y, z vertex sequence.
+    '''
+    points = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+    if not len(points):
+        return np.zeros(3, dtype=np.float32), np.zeros(3, dtype=np.float32)
+    return points.min(axis=0), points.max(axis=0)
+
+
+def transform_aabbs(centers, extents, matrices):
+    '''
+    World-space (center, half extent) of local AABBs under column-major model matrices
+    (N, 4, 4), i.e. matrices[i] holds M^T so a row vector p transforms as p @ matrices[i].
+    '''
+    world_centers = np.einsum('ni,nij->nj', centers, matrices[:, :3, :3]) + matrices[:, 3, :3]
+    world_extents = np.einsum('ni,nij->nj', extents, np.abs(matrices[:, :3, :3]))
+    return world_centers, world_extents
+
+
+def aabbs_in_frustum(centers, extents, planes):
+    '''
+    True for every world-space box that is at least partly inside all six planes.
+    '''
+    distances = centers @ planes[:, :3].T + planes[:, 3]
+    radii = extents @ np.abs(planes[:, :3]).T
+    return np.all(distances + radii >= 0, axis=1)
+
+
+class BoundsStore:
+    '''
+    Local-space bounding boxes of all shapes, indexed like the TransformStore that holds their
+    model matrices, so the whole scene is tested against the view frustum in one step.
+    '''
+    centers = array_property('rows', 'centers')
+    extents = array_property('rows', 'extents')
+
+    def __init__(self, capacity=64):
+        self.rows = ArrayStore(capacity, centers=(np.float32, (3,)), extents=(np.float32, (3,)))
+
+    @property
+    def count(self):
+        return self.rows.count
+
+    @property
+    def radii(self):
+        '''
+        Radius of the bounding sphere around each box center.
+        '''
+        return np.linalg.norm(self.extents, axis=1)
+
+    def add(self, aabb_min, aabb_max) -> int:
+        return int(self.extend([aabb_min], [aabb_max])[0])
+
+    def extend(self, aabb_min, aabb_max) -> np.ndarray:
+        '''
+        Add the (N, 3) boxes from `aabb_min` to `aabb_max`. Returns their indices.
+        '''
+        aabb_min, aabb_max = np.asarray(aabb_min), np.asarray(aabb_max)
+        return self.rows.extend(len(aabb_min), centers=(aabb_min + aabb_max) / 2, extents=(aabb_max - aabb_min) / 2)
+
+    def set(self, index, aabb_min, aabb_max) -> None:
+        self.centers[index] = (np.asarray(aabb_min) + aabb_max) / 2
+        self.extents[index] = (np.asarray(aabb_max) - aabb_min) / 2
+
+    def world(self, matrices):
+        return transform_aabbs(self.centers, self.extents, matrices)
+
+    def visible(self, matrices, planes):
+        return aabbs_in_frustum(*self.world(matrices), planes)
@@ -0,0 +1,106 @@
+import ctypes
+import time
+
+import numpy as np
+from pyglet.gl import *
+from pyglet.image.buffer import Framebuffer, Renderbuffer
+
+
+class OffscreenTarget:
+    '''
+    Color and depth renderbuffers of a fixed size. While bound, the renderer draws into
+    them instead of the window surface, so frames can be rendered without a display
+    (run with pyglet.options['headless'] = True).
+    '''
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.color = Renderbuffer(width, height, GL_RGBA8)
+        self.depth = Renderbuffer(width, height, GL_DEPTH_COMPONENT24)
+        self.framebuffer = Framebuffer()
+        self.framebuffer.attach_renderbuffer(self.color)
+        self.framebuffer.attach_renderbuffer(self.depth, attachment=GL_DEPTH_ATTACHMENT)
+        self.framebuffer.bind()
+        assert self.framebuffer.is_complete, self.framebuffer.get_status()
+        self.framebuffer.unbind()
+
+    def bind(self):
+        self.framebuffer.bind()
+        glViewport(0, 0, self.width, self.height)
+
+    def unbind(self):
+        self.framebuffer.unbind()
+
+    def read_pixels(self) -> np.ndarray:
+        '''
+        The color buffer as an (height, width, 4) uint8 array, bottom row first.
+        '''
+        pixels = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        self.bind()
+        glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE,
+                     pixels.ctypes.data_as(ctypes.c_void_p))
+        self.unbind()
+        return pixels
+
+
+class FrameStats:
+    '''
+    Per-frame CPU times of RenderWindow.update and of the draw submission (on_draw without
+    waiting for the GPU), plus the wall time of the whole run including the final glFinish.
+    '''
+    def __init__(self):
+        self.update_times = []
+        self.draw_times = []
+        self.triangles = 0
+        self.wall_time = 0.0
+
+    @property
+    def frames(self):
+        return len(self.draw_times)
+
+    @property
+    def fps(self):
+        return self.frames / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def triangles_per_second(self):
+        return self.triangles / self.wall_time if self.wall_time else 0.0
+
+    def __repr__(self):
+        update = np.array(self.update_times) * 1e3
+        draw = np.array(self.draw_times) * 1e3
+        return (f'{self.frames} frames: update {update.mean():.3f} ms (p95 {np.percentile(update, 95):.3f}), '
+                f'draw submit {draw.mean():.3f} ms (p95 {np.percentile(draw, 95):.3f}), '
+                f'{self.fps:,.1f} fps, {self.triangles_per_second / 1e6:,.2f} Mtris/s')
+
+
+def render_frames(renderer, frames, target=None, dt=1/60) -> FrameStats:
+    '''
+    Render `frames` frames of the renderer's scene into `target` (an OffscreenTarget of
+    the window size by default) as fast as possible, with a fixed time step `dt`.
+    '''
+    if target is None:
+        target = OffscreenTarget(*renderer.get_framebuffer_size())
+    renderer.switch_to()
+    target.bind()
+
+    # warm up: first uploads, culling state and program binds are not part of the run
+    renderer.update(dt)
+    renderer.on_draw()
+    glFinish()
+
+    stats = FrameStats()
+    start = time.perf_counter()
+    for _ in range(frames):
+        frame_start = time.perf_counter()
+        renderer.update(dt)
+        update_end = time.perf_counter()
+        renderer.on_draw()
+        stats.update_times.append(update_end - frame_start)
+        stats.draw_times.append(time.perf_counter() - update_end)
+        stats.triangles += renderer.triangle_count
+    glFinish()
+    stats.wall_time = time.perf_counter() - start
+
+    target.unbind()
+    return stats
@@ -1,34 +1,75 @@
+import argparse
+import os
+import sys
+
 import pyglet
-from pyglet.math import Mat4, Vec3
+
+if '--headless' in sys.argv:
+    # must be set before pyglet.window is imported (by render below)
+    pyglet.options['headless'] = True
+elif '--software' in sys.argv:
+    # no GL context at all: the scene is rendered on the CPU
+    pyglet.options['shadow_window'] = False
 
 from render import RenderWindow
-from primitives import Cube,Sphere
+from scene import load_scene
 from control import Control
 
 
+# the scene layout; its meshes come from the geometry cache, generated and uploaded once
+SCENE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenes', 'main.json')
+
+
+def build_scene(renderer):
+    load_scene(renderer, SCENE_FILE)
+
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true',
+                        help='render frames offscreen as fast as possible and print frame timings')
+    parser.add_argument('--software', action='store_true',
+                        help='render frames with the CPU rasterizer (no GPU needed) and print frame timings')
+    parser.add_argument('--workers', type=int, help='with --software, rasterizer threads (default: one per CPU)')
+    parser.add_argument('--frames', type=int, default=300,
+                        help='number of frames to render with --headless or --software')
+    parser.add_argument('--trace', metavar='FILE', help='with --headless, profile the frames into a Chrome trace file')
+    args = parser.parse_args()
+
     width = 1280
     height = 720
 
+    if args.headless:
+        from headless import render_frames
+
+        renderer = RenderWindow(width, height, "Hello Pyglet", visible = False)
+        build_scene(renderer)
+        renderer.animate = True
+        if args.trace:
+            renderer.toggle_profiler()
+        print(render_frames(renderer, args.frames))
+        if args.trace:
+            renderer.profiler.dump_chrome_trace(args.trace)
+        sys.exit()
+
+    if args.software:
+        from software import SoftwareRenderer, render_frames
+
+        renderer = SoftwareRenderer(width, height, workers=args.workers)
+        build_scene(renderer)
+        renderer.animate = True
+        print(render_frames(renderer, args.frames))
+        sys.exit()
+
     # Render window.
-    renderer = RenderWindow(width, height, "Hello Pyglet", resizable = True)   
+    renderer = RenderWindow(width, height, "Hello Pyglet", resizable = True)
     renderer.set_location(200, 200)
 
-    # Keyboard/Mouse control. Not implemented yet.
+    # Keyboard/mouse control: drag or arrow keys to orbit, right drag to pan, scroll to zoom,
+    # click to pick a shape; space pauses the animation, P shows the profiler (see control.py)
     controller = Control(renderer)
 
-    translate_mat1 = Mat4.from_translation(vector=Vec3(x=-2, y=0, z=0))
-    translate_mat2 = Mat4.from_translation(vector=Vec3(x=0, y=0, z=0))
-    translate_mat3 = Mat4.from_translation(vector=Vec3(x=2, y=0, z=0))
-
-    scale_vec = Vec3(x=1, y=1, z=1)
-
-    cube1 = Cube(scale_vec)
-    cube2 = Cube(Vec3(x=1.5, y=1.5, z=1.5))
-    sphere = Sphere(30,30)
-    renderer.add_shape(translate_mat1, cube1.vertices, cube1.indices, cube1.colors)
-    renderer.add_shape(translate_mat2, sphere.vertices, sphere.indices, sphere.colors)
-    renderer.add_shape(translate_mat3, cube2.vertices, cube1.indices, cube1.colors)
+    build_scene(renderer)
 
     #draw shapes
     renderer.run()
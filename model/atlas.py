@@ -0,0 +1,205 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pyglet
+
+from pyglet.model import Material
+
+from model.obj import CACHE_PREAMBLE, align_offset, atomic_write, source_key
+
+
+# Margin around every image in an atlas, filled with copies of the image's edge pixels,
+# so that filtering at the edge of one image never samples its neighbour
+ATLAS_PADDING = 2
+
+ATLAS_CACHE_SUFFIX = '.atlascache'
+
+_ATLAS_MAGIC = b'TEXATLAS'
+_ATLAS_VERSION = 1
+
+
+def pack_rectangles(sizes, padding=0):
+    '''
+    Shelf packer: place rectangles of (width, height) `sizes`, each with `padding` pixels of
+    margin on every side, tallest first in rows of an atlas about as wide as it is high.
+    Returns the lower left corners of the rectangles (inside their margins) and the atlas
+    (width, height).
+    '''
+    sizes = np.reshape(np.asarray(sizes, dtype=np.int64), (-1, 2))
+    padded = sizes + 2 * padding
+    width = int(max(padded[:, 0].max(initial=1), np.ceil(np.sqrt(np.prod(padded, axis=1).sum()))))
+
+    positions = np.zeros_like(padded)
+    x = y = shelf_height = 0
+    for i in np.argsort(-padded[:, 1], kind='stable'):
+        w, h = padded[i]
+        if x + w > width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions[i] = x + padding, y + padding
+        x += w
+        shelf_height = max(shelf_height, h)
+    return positions, (width, int(y + shelf_height))
+
+
+def texture_file(name):
+    '''
+    The image file of material texture `name`, found through pyglet.resource like the
+    textures upload_meshes and AssetManager.load_model load themselves, or `name` as a path
+    if pyglet.resource has no such file.
+    '''
+    try:
+        location = pyglet.resource.location(name)
+    except pyglet.resource.ResourceNotFoundException:
+        return name
+    if isinstance(location, pyglet.resource.FileLocation):
+        return os.path.join(location.path, name)
+    return name
+
+
+def _image_pixels(name):
+    # rows bottom to top, like pyglet's ImageData and texture coordinates
+    image = pyglet.image.load(texture_file(name)).get_image_data()
+    data = image.get_data('RGBA', image.width * 4)
+    return np.frombuffer(data, dtype=np.uint8).reshape(image.height, image.width, 4)
+
+
+class TextureAtlas:
+    '''
+    Images packed into one RGBA texture. `regions` maps material texture names (see
+    texture_file) to their (x, y, width, height) rectangle in `pixels`, an array of
+    (height, width, 4) bytes with its bottom row first.
+
+    All meshes textured with images of one atlas can share a single material group, so
+    they are drawn with one texture bind (see model.obj.upload_meshes).
+    '''
+    def __init__(self, pixels, regions, padding=ATLAS_PADDING):
+        self.pixels = pixels
+        self.regions = regions
+        self.padding = padding
+        # the material of the shared group; colors are vertex attributes, so it is only a key
+        self.material = Material('atlas', [1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0], [1.0, 1.0, 1.0, 1.0],
+                                 [0.0, 0.0, 0.0, 1.0], 100.0, texture_name=None)
+        self._texture = None
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    @property
+    def texture(self):
+        if self._texture is None:
+            image = pyglet.image.ImageData(self.width, self.height, 'RGBA', self.pixels.tobytes())
+            self._texture = image.get_texture()
+        return self._texture
+
+    def map_tex_coords(self, name, tex_coords):
+        '''
+        Texture coordinates of image `name` moved into its atlas region, as float32. Returns
+        None if the image is not in the atlas, or if the coordinates leave [0, 1] (the image
+        is repeated), which an atlas region cannot do.
+        '''
+        region = self.regions.get(name)
+        uv = np.reshape(np.asarray(tex_coords, dtype=np.float32), (-1, 2))
+        if region is None or (len(uv) and (uv.min() < 0 or uv.max() > 1)):
+            return None
+        x, y, w, h = region
+        scale = np.float32([w / self.width, h / self.height])
+        offset = np.float32([x / self.width, y / self.height])
+        return (uv * scale + offset).ravel()
+
+
+def build_texture_atlas(filenames, padding=ATLAS_PADDING):
+    '''
+    Pack the images of `filenames` (material texture names, see texture_file) into a
+    TextureAtlas, with `padding` pixels of their edges repeated around each of them.
+    '''
+    filenames = list(dict.fromkeys(filenames))
+    images = [_image_pixels(filename) for filename in filenames]
+    positions, (width, height) = pack_rectangles([(image.shape[1], image.shape[0]) for image in images], padding)
+
+    pixels = np.zeros((height, width, 4), dtype=np.uint8)
+    regions = {}
+    for filename, image, (x, y) in zip(filenames, images, positions.tolist()):
+        h, w = image.shape[:2]
+        pixels[y - padding:y + h + padding, x - padding:x + w + padding] = \
+            np.pad(image, ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+        regions[filename] = (x, y, w, h)
+    return TextureAtlas(pixels, regions, padding)
+
+
+def write_atlas_cache(cache_filename, atlas):
+    '''
+    Write an atlas into a cache file: a JSON header with the regions (the UV map) and the
+    image files it is keyed on, followed by the raw pixels.
+    '''
+    header = {
+        'sources': [source_key(texture_file(name)) for name in atlas.regions],
+        'names': list(atlas.regions),
+        'regions': list(atlas.regions.values()),
+        'padding': atlas.padding,
+        'size': [atlas.width, atlas.height],
+    }
+    header_bytes = json.dumps(header).encode()
+
+    with atomic_write(cache_filename) as f:
+        f.write(CACHE_PREAMBLE.pack(_ATLAS_MAGIC, _ATLAS_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.seek(align_offset(CACHE_PREAMBLE.size + len(header_bytes)))
+        f.write(np.ascontiguousarray(atlas.pixels).tobytes())
+
+
+def load_atlas_cache(cache_filename, filenames=None, padding=ATLAS_PADDING):
+    '''
+    Load an atlas from a cache file, its pixels memory-mapped. Returns None if the cache
+    is missing, unreadable, older than any of its images, or packs other `filenames` or
+    another `padding` than requested.
+    '''
+    try:
+        with open(cache_filename, 'rb') as f:
+            magic, version, header_size = CACHE_PREAMBLE.unpack(f.read(CACHE_PREAMBLE.size))
+            if magic != _ATLAS_MAGIC or version != _ATLAS_VERSION:
+                return None
+            header = json.loads(f.read(header_size))
+        if any(source_key(source['path']) != source for source in header['sources']):
+            return None
+        data = np.memmap(cache_filename, dtype=np.uint8, mode='r')
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if header['padding'] != padding or (filenames is not None and
+                                        set(header['names']) != set(filenames)):
+        return None
+    width, height = header['size']
+    start = align_offset(CACHE_PREAMBLE.size + header_size)
+    pixels = data[start:start + width * height * 4].reshape(height, width, 4)
+    regions = {name: tuple(region) for name, region in zip(header['names'], header['regions'])}
+    return TextureAtlas(pixels, regions, padding)
+
+
+def load_texture_atlas(filenames, cache_filename, padding=ATLAS_PADDING):
+    '''
+    The TextureAtlas of `filenames` from its cache file, building and caching it when the
+    cache is missing or stale.
+    '''
+    filenames = list(dict.fromkeys(filenames))
+    atlas = load_atlas_cache(cache_filename, filenames, padding)
+    if atlas is None:
+        atlas = build_texture_atlas(filenames, padding)
+        try:
+            write_atlas_cache(cache_filename, atlas)
+        except OSError:
+            pass
+    return atlas
+
+
+def texture_names(mesh_list):
+    '''
+    The texture names of the materials of OBJ meshes, in order of first use.
+    '''
+    return list(dict.fromkeys(mesh.material.texture_name for mesh in mesh_list if mesh.material.texture_name))
@@ -0,0 +1,164 @@
+import numpy as np
+
+
+# Faces meeting at a larger angle than this (in degrees) get separate vertex normals
+SMOOTHING_ANGLE = 60.0
+
+# Relative distance below which vertices count as one position for smoothing
+WELD_TOLERANCE = 1e-6
+
+
+def _face_frames(points, triangles):
+    # unit face normals, and the (parallelogram) area and interior angle at every corner
+    corners = points[triangles]
+    cross = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(cross, axis=1)
+    normals = cross / np.where(areas > 0, areas, 1)[:, None]
+
+    after = np.roll(corners, -1, axis=1) - corners
+    before = np.roll(corners, 1, axis=1) - corners
+    angles = np.arctan2(np.linalg.norm(np.cross(after, before), axis=2), np.einsum('tci,tci->tc', after, before))
+    return normals, areas, angles
+
+
+def _accumulate(targets, values, count):
+    # row sums of `values` grouped by `targets`, with bincount instead of a slow np.add.at
+    return np.stack([np.bincount(targets, values[:, k], minlength=count) for k in range(values.shape[1])], axis=1)
+
+
+def _normalized(vectors):
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(lengths > 0, lengths, 1)
+
+
+def _unique_rows(rows):
+    '''
+    np.unique(rows, axis=0, return_index=True, return_inverse=True) without the slow sort
+    of rows as opaque records: the index of the first of every distinct row, in row order,
+    and the rank of every row's distinct row.
+    '''
+    if not len(rows):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.lexsort(rows.T[::-1])
+    ordered = rows[order]
+    new = np.concatenate([[True], np.any(ordered[1:] != ordered[:-1], axis=1)])
+    group = np.cumsum(new) - 1
+    # lexsort is stable, so a run of equal rows starts with the first of them
+    first = order[new]
+    inverse = np.empty(len(rows), dtype=np.int64)
+    inverse[order] = group
+    # number the distinct rows in order of first appearance
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return np.sort(first), rank[inverse]
+
+
+def _corner_pairs(groups):
+    '''
+    All (i, j) pairs of corners in the same group, i included: sum of group size squared.
+    '''
+    order = np.argsort(groups, kind='stable')
+    sizes = np.bincount(groups)
+    starts = np.cumsum(sizes) - sizes
+    size_of = sizes[groups[order]]
+    first = np.repeat(starts[groups[order]], size_of)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(size_of) - size_of, size_of)
+    return np.repeat(order, size_of), order[first + offsets]
+
+
+def compute_normals(vertices, indices, smoothing_angle=SMOOTHING_ANGLE, weighting='angle', attributes=()):
+    '''
+    Vertex normals of an indexed triangle mesh: the sum of the normals of the faces around
+    each position, weighted by the face's corner angle (`weighting='angle'`) or its area
+    (`'area'`). Vertices at the same position (within WELD_TOLERANCE of the mesh size) share
+    their normal, so UV seams stay smooth.
+
+    With a `smoothing_angle` (degrees), each corner only sums the faces within that angle of
+    its own face, and a vertex whose corners end up with different normals is split, so
+    hard edges stay sharp. `attributes` are per-vertex arrays (tex_coords, ...) that are
+    copied to split vertices. Returns the flat vertices (float32), indices (uint32) and
+    normals (float32), then the attributes.
+    '''
+    points = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+    triangles = np.reshape(np.asarray(indices, dtype=np.int64), (-1, 3))
+    attributes = [np.reshape(np.asarray(a, dtype=np.float32), (len(points), -1)) for a in attributes]
+    face_normals, areas, angles = _face_frames(points.astype(np.float64), triangles)
+    weights = angles if weighting == 'angle' else np.repeat(areas[:, None], 3, axis=1)
+
+    # positions closer than about a millionth of the mesh size are the same, e.g. across a
+    # seam computed with sin(0) and sin(2 pi)
+    tolerance = max(float(np.ptp(points, axis=0).max(initial=0)), 1e-30) * WELD_TOLERANCE
+    _, position = _unique_rows(np.round(points / tolerance).astype(np.int64))
+    corner_position = position[triangles].ravel()
+    corner_face = np.repeat(np.arange(len(triangles)), 3)
+    weighted = face_normals[corner_face] * weights.ravel()[:, None]
+
+    if smoothing_angle is None:
+        normals = _normalized(_accumulate(corner_position, weighted, position.max(initial=-1) + 1))[position]
+        return (points.ravel(), triangles.astype(np.uint32).ravel(), normals.astype(np.float32).ravel(),
+                *(attribute.ravel() for attribute in attributes))
+
+    # (take gathers rows faster than fancy indexing)
+    i, j = _corner_pairs(corner_position)
+    corner_face_normals = face_normals[corner_face]
+    similar = np.einsum('ij,ij->i', corner_face_normals.take(i, axis=0), corner_face_normals.take(j, axis=0)) >= \
+        np.cos(np.radians(smoothing_angle)) - 1e-6
+    corner_normals = _normalized(_accumulate(i[similar], weighted.take(j[similar], axis=0), len(corner_face)))
+    corner_normals = corner_normals.astype(np.float32)
+
+    # weld corners with the same source vertex and normal, in order of first use
+    keys = np.concatenate([triangles.reshape(-1, 1), corner_normals.view(np.int32)], axis=1)
+    first, inverse = _unique_rows(keys)
+    source = triangles.ravel()[first]
+    return (points[source].ravel(), inverse.astype(np.uint32), corner_normals[first].ravel(),
+            *(attribute[source].ravel() for attribute in attributes))
+
+
+def compute_tangents(vertices, normals, tex_coords, indices):
+    '''
+    Per-vertex tangents (x, y, z, handedness) along the direction of increasing u, from the
+    texture coordinate derivatives of the faces around each vertex (Lengyel), made
+    orthogonal to the normal. The bitangent is cross(normal, tangent.xyz) * tangent.w.
+    Vertices without usable texture coordinates get an arbitrary unit tangent orthogonal to
+    their normal. Returns flat float32 tangents.
+    '''
+    points = np.reshape(np.asarray(vertices, dtype=np.float64), (-1, 3))
+    normals = np.reshape(np.asarray(normals, dtype=np.float64), (-1, 3))
+    uv = np.reshape(np.asarray(tex_coords, dtype=np.float64), (-1, 2))
+    triangles = np.reshape(np.asarray(indices, dtype=np.int64), (-1, 3))
+
+    edges = points[triangles[:, 1:]] - points[triangles[:, :1]]
+    deltas = uv[triangles[:, 1:]] - uv[triangles[:, :1]]
+    determinant = deltas[:, 0, 0] * deltas[:, 1, 1] - deltas[:, 1, 0] * deltas[:, 0, 1]
+    scale = np.where(np.abs(determinant) > 1e-12, 1 / np.where(determinant == 0, 1, determinant), 0)
+    u_directions = (edges[:, 0] * deltas[:, 1, 1, None] - edges[:, 1] * deltas[:, 0, 1, None]) * scale[:, None]
+    v_directions = (edges[:, 1] * deltas[:, 0, 0, None] - edges[:, 0] * deltas[:, 1, 0, None]) * scale[:, None]
+
+    corners = triangles.ravel()
+    u_sum = _accumulate(corners, np.repeat(u_directions, 3, axis=0), len(points))
+    v_sum = _accumulate(corners, np.repeat(v_directions, 3, axis=0), len(points))
+
+    tangents = u_sum - normals * np.einsum('ij,ij->i', normals, u_sum)[:, None]
+    lengths = np.linalg.norm(tangents, axis=1)
+    missing = lengths <= 1e-8 * np.maximum(np.linalg.norm(u_sum, axis=1), 1e-30)
+    # fall back on any direction orthogonal to the normal
+    axis = np.where((np.abs(normals[:, 0]) < 0.9)[:, None], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0])
+    fallback = np.cross(normals, axis)
+    tangents[missing] = fallback[missing]
+    tangents = _normalized(tangents)
+
+    handedness = np.where(np.einsum('ij,ij->i', np.cross(normals, tangents), v_sum) < 0, -1.0, 1.0)
+    return np.concatenate([tangents, handedness[:, None]], axis=1).astype(np.float32).ravel()
+
+
+def add_mesh_normals(mesh, smoothing_angle=SMOOTHING_ANGLE):
+    '''
+    Fill in the normals of an indexed OBJ Mesh whose corners lack them (`vn` records; the
+    parser gives those a zero normal), splitting vertices at hard edges, and its tangents.
+    '''
+    normals = np.reshape(mesh.normals, (-1, 3))
+    if len(normals) and not np.all(np.any(normals != 0, axis=1)):
+        mesh.vertices, mesh.indices, mesh.normals, mesh.tex_coords = compute_normals(
+            mesh.vertices, mesh.indices, smoothing_angle, attributes=(mesh.tex_coords,))
+    mesh.tangents = compute_tangents(mesh.vertices, mesh.normals, mesh.tex_coords, mesh.indices)
+    return mesh
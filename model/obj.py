@@ -1,12 +1,27 @@
+import json
+import mmap
 import os
+import re
+import struct
+import tempfile
 
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
 import pyglet
 
 from pyglet.gl import GL_TRIANGLES
 from pyglet.util import asstr
 
-from .. import Model, Material, MaterialGroup, TexturedMaterialGroup
-from . import ModelDecodeException, ModelDecoder
+from pyglet.model import Model, Material, MaterialGroup, TexturedMaterialGroup
+from pyglet.model.codecs import ModelDecodeException, ModelDecoder
+
+from model.normals import add_mesh_normals
+from model.optimize import optimize_mesh
+from model.quantize import PACKED_TEXTURED_VERTEX_SIZE, PACKED_VERTEX_SIZE, PackedMaterialGroup, \
+    PackedTexturedMaterialGroup, get_packed_program, packed_attributes
 
 
 class Mesh:
@@ -19,6 +34,14 @@ class Mesh:
         self.normals = []
         self.tex_coords = []
         self.colors = []
+        # Per-vertex (x, y, z, handedness), see model.normals.compute_tangents
+        self.tangents = []
+
+        # Number of face corners before identical v/vt/vn corners were welded
+        self.emitted_count = 0
+
+        # Object-space bounding box ([min x, y, z], [max x, y, z]), used for culling
+        self.aabb = None
 
 
 def load_material_library(filename):
@@ -83,35 +106,73 @@ def load_material_library(filename):
     return matlib
 
 
-def parse_obj_file(filename, file=None):
-    materials = {}
-    mesh_list = []
-
-    location = os.path.dirname(filename)
-
+def _read_obj_file(filename, file=None):
     try:
         if file is None:
             with open(filename, 'r') as f:
-                file_contents = f.read()
-        else:
-            file_contents = asstr(file.read())
+                return f.read()
+        return asstr(file.read())
     except (UnicodeDecodeError, OSError):
         raise ModelDecodeException
 
-    material = None
-    mesh = None
-
-    vertices = [[0., 0., 0.]]
-    normals = [[0., 0., 0.]]
-    tex_coords = [[0., 0.]]
 
+def _default_material():
     diffuse = [1.0, 1.0, 1.0, 1.0]
     ambient = [1.0, 1.0, 1.0, 1.0]
     specular = [1.0, 1.0, 1.0, 1.0]
     emission = [0.0, 0.0, 0.0, 1.0]
     shininess = 100.0
 
-    default_material = Material("Default", diffuse, ambient, specular, emission, shininess)
+    return Material("Default", diffuse, ambient, specular, emission, shininess)
+
+
+def parse_obj_file(filename, file=None, vectorized=True, indexed=False, chunk_size=None, workers=None):
+    '''
+    Parse an OBJ file into a list of Mesh objects with flattened (triangle soup) attributes.
+
+    With `vectorized` the file is tokenized in bulk with NumPy and the meshes hold contiguous
+    float32 arrays; otherwise the original per-line loop is used and the meshes hold lists.
+    With `indexed` (vectorized only) corners sharing the same v/vt/vn triple are welded into
+    one vertex and `mesh.indices` holds a uint32 index buffer into the unique vertices.
+    With `chunk_size` (vectorized only) the file is streamed in chunks of that many bytes
+    instead of being read whole, see iter_obj_meshes. With `workers` (vectorized only) the
+    file is split into that many runs of lines that are parsed in separate processes; the
+    output is identical to the serial parser's.
+    '''
+    if (indexed or chunk_size or workers) and not vectorized:
+        raise ValueError('Indexed, chunked and multi-process output require the vectorized parser.')
+    if chunk_size:
+        return list(iter_obj_meshes(filename, file, chunk_size, indexed))
+    if workers:
+        return _parse_obj_parallel(filename, file, indexed, workers)
+
+    file_contents = _read_obj_file(filename, file)
+    location = os.path.dirname(filename)
+
+    if vectorized:
+        return _parse_obj_arrays(file_contents, location, indexed)
+    return _parse_obj_lines(file_contents, location)
+
+
+def _mesh_aabb(vertices):
+    points = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+    if not len(points):
+        return [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+    return points.min(axis=0).tolist(), points.max(axis=0).tolist()
+
+
+def _parse_obj_lines(file_contents, location):
+    materials = {}
+    mesh_list = []
+
+    material = None
+    mesh = None
+
+    vertices = [[0., 0., 0.]]
+    normals = [[0., 0., 0.]]
+    tex_coords = [[0., 0.]]
+
+    default_material = _default_material()
 
     for line in file_contents.splitlines():
 
@@ -161,12 +222,13 @@ def parse_obj_file(filename, file=None):
 
             for i, v in enumerate(values[1:]):
                 v_i, t_i, n_i = (list(map(int, [j or 0 for j in v.split('/')])) + [0, 0])[:3]
+                # Negative indices are relative to the end, index 0 is the dummy entry
                 if v_i < 0:
-                    v_i += len(vertices) - 1
+                    v_i += len(vertices)
                 if t_i < 0:
-                    t_i += len(tex_coords) - 1
+                    t_i += len(tex_coords)
                 if n_i < 0:
-                    n_i += len(normals) - 1
+                    n_i += len(normals)
 
                 mesh.normals += normals[n_i]
                 mesh.tex_coords += tex_coords[t_i]
@@ -186,6 +248,699 @@ def parse_obj_file(filename, file=None):
                 tlast = tex_coords[t_i]
                 vlast = vertices[v_i]
 
+    for mesh in mesh_list:
+        mesh.aabb = _mesh_aabb(mesh.vertices)
+    return mesh_list
+
+
+# Record types recognised by the vectorized parser
+_V, _VT, _VN, _F, _O, _USEMTL, _MTLLIB = range(1, 8)
+_CONTROL_KINDS = {'o': _O, 'usemtl': _USEMTL, 'usemat': _USEMTL, 'mtllib': _MTLLIB}
+_RECORD_PATTERNS = {kind: re.compile(rf'\n{keyword} (.*)')
+                    for kind, keyword in ((_V, 'v'), (_VT, 'vt'), (_VN, 'vn'), (_F, 'f'))}
+
+
+def _normalize_obj_text(text):
+    '''
+    Use "\\n" line endings and single spaces between tokens, without leading or trailing
+    whitespace, so lines can be classified and counted on the raw bytes.
+    '''
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if '\t' in text or '  ' in text or ' \n' in text or '\n ' in text or text[:1] == ' ':
+        text = re.sub(r'[ \t]+', ' ', text)
+        text = re.sub(r'^ | $', '', text, flags=re.MULTILINE)
+    return text
+
+
+def _classify_lines(text):
+    '''
+    Return the record kind and the number of tokens after the keyword for every line.
+    '''
+    data = np.frombuffer(text.encode() + b'\n\n\n', dtype=np.uint8)
+    ends = np.flatnonzero(data[:-2] == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    first, second, third = data[starts], data[starts + 1], data[starts + 2]
+    space = ord(' ')
+    kinds = np.zeros(len(starts), dtype=np.int8)
+    kinds[(first == ord('v')) & (second == space)] = _V
+    kinds[(first == ord('v')) & (second == ord('t')) & (third == space)] = _VT
+    kinds[(first == ord('v')) & (second == ord('n')) & (third == space)] = _VN
+    kinds[(first == ord('f')) & (second == space)] = _F
+
+    # Control records are rare, so they are identified in Python
+    for i in np.flatnonzero(np.isin(first, (ord('o'), ord('u'), ord('m')))):
+        keyword = bytes(data[starts[i]:ends[i]]).split(b' ', 1)[0].decode()
+        kinds[i] = _CONTROL_KINDS.get(keyword, 0)
+
+    spaces = np.concatenate(([0], np.cumsum(data == space)))
+    token_counts = spaces[ends] - spaces[starts]
+    return kinds, token_counts, data, starts, ends
+
+
+def _parse_float_records(text, kind, token_counts, width):
+    '''
+    Parse all records of one kind into a (n, width) float32 array, with a leading
+    all-zero row so that OBJ's 1-based indices can be used directly.
+    '''
+    out = np.zeros((len(token_counts) + 1, width), dtype=np.float32)
+    if not len(token_counts):
+        return out
+
+    records = _RECORD_PATTERNS[kind].findall('\n' + text)
+    flat = np.fromstring('\n'.join(records), dtype=np.float32, sep=' ')
+    if flat.size != token_counts.sum():
+        raise ModelDecodeException('Invalid number in OBJ vertex data.')
+
+    # Keep the first `width` components of every record, e.g. drop an optional w
+    rows = np.repeat(np.arange(1, len(token_counts) + 1), token_counts)
+    columns = np.arange(flat.size) - np.repeat(np.cumsum(token_counts) - token_counts, token_counts)
+    keep = columns < width
+    out[rows[keep], columns[keep]] = flat[keep]
+    return out
+
+
+def _parse_face_records(text):
+    '''
+    Parse the corners of all face records, written as `v`, `v/vt`, `v//vn` or `v/vt/vn`,
+    into an (n, 3) int64 array using 0 for missing components.
+    '''
+    joined = '\n'.join(_RECORD_PATTERNS[_F].findall('\n' + text))
+    corners = joined.split()
+    out = np.zeros((len(corners), 3), dtype=np.int64)
+    if not corners:
+        return out
+
+    # All corners share the layout of the first one when the slash count adds up,
+    # and no corner has two slashes if the first has only one
+    slashes = corners[0].count('/')
+    if joined.count('/') == slashes * len(corners) and not (slashes == 1 and re.search(r'/[^\s/]*/', joined)):
+        flat = np.fromstring(joined.replace('//', '/0/').replace('/', ' '), dtype=np.int64, sep=' ')
+        out[:, :slashes + 1] = flat.reshape(len(corners), slashes + 1)
+    else:
+        for i, corner in enumerate(corners):
+            values = [int(j or 0) for j in corner.split('/')[:3]]
+            out[i, :len(values)] = values
+    return out
+
+
+def _weld_corners(corners):
+    '''
+    Weld identical (v, vt, vn) index triples. Returns the unique triples in order of first
+    use and a uint32 index buffer into them.
+    '''
+    if not len(corners):
+        return corners, np.zeros(0, dtype=np.uint32)
+
+    extent = corners.max(axis=0) + 1
+    keys = (corners[:, 0] * extent[1] + corners[:, 1]) * extent[2] + corners[:, 2]
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return corners[first[order]], rank[inverse.ravel()].astype(np.uint32)
+
+
+def _fan_triangles(corner_counts):
+    '''
+    Fan triangulation of faces with the given corner counts, in the same corner order as the
+    per-line parser: (c0, c1, c2), (c3, c0, c2), (c4, c0, c3), ... Returns the face of every
+    triangle and its three corner indices.
+    '''
+    face_starts = np.cumsum(corner_counts) - corner_counts
+    triangle_counts = np.maximum(corner_counts - 2, 0)
+    triangle_faces = np.repeat(np.arange(len(corner_counts)), triangle_counts)
+    first = face_starts[triangle_faces]
+    fan = np.arange(len(triangle_faces)) - np.repeat(np.cumsum(triangle_counts) - triangle_counts,
+                                                     triangle_counts)
+    triangles = np.where(fan[:, None] == 0,
+                         first[:, None] + [0, 1, 2],
+                         first[:, None] + np.stack([fan + 2, np.zeros_like(fan), fan + 1], axis=1))
+    return triangle_faces, triangles
+
+
+def _fill_mesh(mesh, corners, vertices, tex_coords, normals, indexed):
+    '''
+    Gather the attributes of a mesh's (v, vt, vn) corner triples, welded when `indexed`.
+    '''
+    mesh.emitted_count = len(corners)
+    if indexed:
+        corners, mesh.indices = _weld_corners(corners)
+    mesh.vertices = vertices[corners[:, 0]].ravel()
+    mesh.tex_coords = tex_coords[corners[:, 1]].ravel()
+    mesh.normals = normals[corners[:, 2]].ravel()
+    mesh.aabb = _mesh_aabb(mesh.vertices)
+
+
+class _ObjRecords:
+    '''
+    The v/vt/vn/f records of a run of whole, normalized OBJ lines, parsed on their own:
+    vertex data without the leading zero row, face corners with negative indices resolved
+    against the records of this run only (`relative` marks them, see _merge_obj_records),
+    and the control records as (number of faces before them, kind, argument).
+    '''
+    ARRAYS = ('vertices', 'tex_coords', 'normals', 'corners', 'relative', 'corner_counts')
+
+    def __init__(self, text):
+        kinds, token_counts, data, starts, ends = _classify_lines(text)
+
+        self.vertices = _parse_float_records(text, _V, token_counts[kinds == _V], 3)[1:]
+        self.tex_coords = _parse_float_records(text, _VT, token_counts[kinds == _VT], 2)[1:]
+        self.normals = _parse_float_records(text, _VN, token_counts[kinds == _VN], 3)[1:]
+
+        face_lines = np.flatnonzero(kinds == _F)
+        self.corner_counts = token_counts[face_lines]
+        self.corners = _parse_face_records(text)
+        self.relative = self.corners < 0
+
+        # Negative indices count back from the records seen before each face
+        corner_lines = np.repeat(face_lines, self.corner_counts)
+        for column, kind in ((0, _V), (1, _VT), (2, _VN)):
+            relative = self.relative[:, column]
+            if relative.any():
+                self.corners[relative, column] += np.cumsum(kinds == kind)[corner_lines[relative]] + 1
+
+        self.events = []
+        for i in np.flatnonzero(np.isin(kinds, (_O, _USEMTL, _MTLLIB))):
+            values = bytes(data[starts[i]:ends[i]]).decode().split()
+            if len(values) >= 2:
+                self.events.append((int(np.searchsorted(face_lines, i)), int(kinds[i]), values[1]))
+
+    @property
+    def counts(self):
+        return np.array([len(self.vertices), len(self.tex_coords), len(self.normals)])
+
+    def share(self):
+        '''
+        Move the arrays into shared memory blocks, leaving (block name, shape, dtype) in
+        their place, so the records can be returned from a worker process without pickling.
+        '''
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            memory = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=memory.buf)[...] = array
+            setattr(self, name, (memory.name, array.shape, array.dtype.str))
+            memory.close()
+        return self
+
+    def attach(self):
+        '''
+        Map the shared arrays back in. Returns the blocks, to be released with detach.
+        '''
+        blocks = []
+        for name in self.ARRAYS:
+            block_name, shape, dtype = getattr(self, name)
+            memory = shared_memory.SharedMemory(name=block_name)
+            blocks.append(memory)
+            setattr(self, name, np.ndarray(shape, dtype, buffer=memory.buf))
+        return blocks
+
+    def detach(self, blocks):
+        for name in self.ARRAYS:
+            setattr(self, name, None)
+        for memory in blocks:
+            memory.close()
+            memory.unlink()
+
+
+def _with_first_face(events):
+    '''
+    Insert the start of an unnamed mesh at the first face, after the events before it.
+    '''
+    first = sum(1 for position, _, _ in events if position == 0)
+    return events[:first] + [(0, _F, None)] + events[first:]
+
+
+def _merge_obj_records(parts, location, indexed=False):
+    '''
+    Build meshes from the records of consecutive runs of lines: concatenate the vertex
+    data, offset the relative indices of every run by the records before it, then
+    triangulate and assign the faces to meshes.
+    '''
+    materials = {}
+    mesh_list = []
+
+    default_material = _default_material()
+
+    vertices = np.concatenate([np.zeros((1, 3), dtype=np.float32)] + [part.vertices for part in parts])
+    tex_coords = np.concatenate([np.zeros((1, 2), dtype=np.float32)] + [part.tex_coords for part in parts])
+    normals = np.concatenate([np.zeros((1, 3), dtype=np.float32)] + [part.normals for part in parts])
+    corners = np.concatenate([part.corners for part in parts])
+    corner_counts = np.concatenate([part.corner_counts for part in parts])
+
+    before = np.zeros(3, dtype=np.int64)
+    start = 0
+    face_count = 0
+    events = []
+    for part in parts:
+        end = start + len(part.corners)
+        if before.any() and part.relative.any():
+            corners[start:end] += part.relative * before
+        events += [(position + face_count, kind, value) for position, kind, value in part.events]
+        before += part.counts
+        start = end
+        face_count += len(part.corner_counts)
+
+    for column, table in enumerate((vertices, tex_coords, normals)):
+        index = corners[:, column]
+        if index.size and (index.min() < 0 or index.max() >= len(table)):
+            raise ModelDecodeException('Face index out of range.')
+
+    triangle_faces, triangles = _fan_triangles(corner_counts)
+    soup = corners[triangles.ravel()]
+
+    # Assign faces to meshes. Control records are few, so they are replayed in order;
+    # faces before the first `o` record start an unnamed mesh.
+    object_faces = [position for position, kind, _ in events if kind == _O]
+    implicit = face_count > 0 and (not object_faces or object_faces[0] > 0)
+    if implicit:
+        events = _with_first_face(events)
+
+    material = None
+    mesh = None
+    for _, kind, value in events:
+        if kind == _F:
+            mesh = Mesh(name='')
+            mesh.material = material or default_material
+            mesh_list.append(mesh)
+        elif kind == _MTLLIB:
+            material_abspath = os.path.join(location, value)
+            materials = load_material_library(filename=material_abspath)
+        elif kind == _USEMTL:
+            material = materials.get(value)
+            if mesh is not None:
+                mesh.material = material
+        elif kind == _O:
+            mesh = Mesh(name=value)
+            mesh.material = default_material
+            mesh_list.append(mesh)
+
+    for mesh in mesh_list:
+        if mesh.material is None:
+            mesh.material = default_material
+
+    mesh_of_face = np.searchsorted(object_faces, np.arange(face_count), side='right') - (0 if implicit else 1)
+    mesh_of_corner = np.repeat(mesh_of_face[triangle_faces], 3)
+    for i, mesh in enumerate(mesh_list):
+        _fill_mesh(mesh, soup[mesh_of_corner == i], vertices, tex_coords, normals, indexed)
+
+    return mesh_list
+
+
+def _parse_obj_arrays(file_contents, location, indexed=False):
+    return _merge_obj_records([_ObjRecords(_normalize_obj_text(file_contents))], location, indexed)
+
+
+###################################################
+#   Multi-process parser:
+###################################################
+
+def _line_ranges(data, parts):
+    '''
+    Split `data` (bytes or an mmap) into `parts` runs of whole lines of about equal size.
+    '''
+    bounds = [0]
+    for i in range(1, parts):
+        end = data.find(b'\n', max(len(data) * i // parts - 1, bounds[-1])) + 1
+        bounds.append(end or len(data))
+    bounds.append(len(data))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_obj_part(filename, start, end, contents=None):
+    if contents is None:
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            contents = f.read(end - start)
+    return _ObjRecords(_normalize_obj_text(contents.decode())).share()
+
+
+def _parse_obj_parallel(filename, file, indexed, workers):
+    '''
+    Parse the file in `workers` runs of whole lines, one per worker process. The workers
+    return their records in shared memory; the merge offsets relative indices and builds
+    the meshes as in the serial parser, so the output is identical.
+    '''
+    try:
+        if file is None:
+            with open(filename, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return _parse_obj_arrays('', os.path.dirname(filename), indexed)
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    ranges = _line_ranges(data, workers)
+            jobs = [(filename, start, end) for start, end in ranges]
+        else:
+            contents = file.read()
+            contents = contents.encode() if isinstance(contents, str) else contents
+            jobs = [(filename, start, end, contents[start:end]) for start, end in _line_ranges(contents, workers)]
+
+        # workers register their shared blocks with this process's tracker, which forgets
+        # them once they are unlinked here
+        resource_tracker.ensure_running()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_parse_obj_part, *job) for job in jobs]
+            parts, error = [], None
+            for future in futures:
+                try:
+                    parts.append(future.result())
+                except Exception as exception:
+                    error = error or exception
+    except OSError:
+        raise ModelDecodeException
+
+    blocks = [part.attach() for part in parts]
+    try:
+        if isinstance(error, UnicodeDecodeError):
+            raise ModelDecodeException
+        if error is not None:
+            raise error
+        return _merge_obj_records(parts, os.path.dirname(filename), indexed)
+    finally:
+        for part, part_blocks in zip(parts, blocks):
+            part.detach(part_blocks)
+
+
+###################################################
+#   Streaming parser:
+###################################################
+
+STREAM_CHUNK_SIZE = 1 << 22
+
+
+class _GrowableArray:
+    '''
+    A (count, width) array that rows are appended to in bulk, with the capacity doubled
+    whenever it runs out so appends are amortized O(1). Starts with `count` zero rows.
+    '''
+    def __init__(self, width, dtype=np.float32, count=0):
+        self._data = np.zeros((max(count, 1024), width), dtype=dtype)
+        self.count = count
+
+    @property
+    def array(self):
+        return self._data[:self.count]
+
+    def extend(self, rows):
+        end = self.count + len(rows)
+        if end > len(self._data):
+            data = np.zeros((max(end, 2 * len(self._data)), self._data.shape[1]), dtype=self._data.dtype)
+            data[:self.count] = self._data[:self.count]
+            self._data = data
+        self._data[self.count:end] = rows
+        self.count = end
+
+    def truncate(self, count):
+        self.count = count
+
+
+class _ObjStreamParser:
+    '''
+    Incremental state of iter_obj_meshes: the v/vt/vn pools, the number of records of each
+    kind read so far (for negative indices) and the corners of the mesh being read.
+    Text is fed in whole lines; finished meshes are returned as `o` records are crossed.
+    '''
+    def __init__(self, location, indexed, keep_vertices):
+        self.location = location
+        self.indexed = indexed
+        self.keep_vertices = keep_vertices
+        self.default_material = _default_material()
+        self.materials = {}
+        self.material = None
+        self.libraries = []
+
+        self.pools = {_V: _GrowableArray(3, count=1), _VT: _GrowableArray(2, count=1),
+                      _VN: _GrowableArray(3, count=1)}
+        self.seen = dict.fromkeys(self.pools, 0)
+        # records dropped from the front of the pools, so pool row = index - dropped
+        self.dropped = dict.fromkeys(self.pools, 0)
+
+        self.mesh = None
+        self.corners = _GrowableArray(3, dtype=np.int64)
+
+    def feed(self, text):
+        finished = []
+        # every piece after the first starts with an `o` record
+        for i, piece in enumerate(re.split(r'\n(?=o )', '\n' + _normalize_obj_text(text))):
+            if i > 0:
+                line, _, piece = piece.partition('\n')
+                finished += self.close()
+                self.mesh = Mesh(name=line.split()[1])
+                self.mesh.material = self.default_material
+            if piece:
+                self._parse_segment(piece)
+        return finished
+
+    def close(self):
+        '''
+        Finish the current mesh, returning it in a list (empty if there is none).
+        '''
+        mesh, self.mesh = self.mesh, None
+        if mesh is None:
+            return []
+        if mesh.material is None:
+            mesh.material = self.default_material
+        _fill_mesh(mesh, self.corners.array, self.pools[_V].array, self.pools[_VT].array,
+                   self.pools[_VN].array, self.indexed)
+        self.corners.truncate(0)
+
+        if not self.keep_vertices:
+            for kind, pool in self.pools.items():
+                self.dropped[kind] = self.seen[kind]
+                pool.truncate(1)
+        return [mesh]
+
+    def _parse_segment(self, text):
+        records = _ObjRecords(text)
+        for kind, array in ((_V, records.vertices), (_VT, records.tex_coords), (_VN, records.normals)):
+            self.pools[kind].extend(array)
+
+        corners = records.corners
+        for column, kind in ((0, _V), (1, _VT), (2, _VN)):
+            index = corners[:, column]
+            index[records.relative[:, column]] += self.seen[kind]
+            if self.dropped[kind]:
+                present = index != 0
+                index[present] -= self.dropped[kind]
+                if (index[present] < 1).any():
+                    raise ModelDecodeException('Face refers to a vertex of an earlier object.')
+            if index.size and (index.min() < 0 or index.max() >= self.pools[kind].count):
+                raise ModelDecodeException('Face index out of range.')
+        self.seen = {kind: self.seen[kind] + count for kind, count in zip((_V, _VT, _VN), records.counts)}
+
+        # Replay material records in order; faces before any `o` start an unnamed mesh
+        events = records.events
+        if self.mesh is None and len(records.corner_counts):
+            events = _with_first_face(events)
+        for _, kind, value in events:
+            if kind == _F:
+                self.mesh = Mesh(name='')
+                self.mesh.material = self.material or self.default_material
+            elif kind == _MTLLIB:
+                self.materials = load_material_library(filename=os.path.join(self.location, value))
+                self.libraries.append(value)
+            elif kind == _USEMTL:
+                self.material = self.materials.get(value)
+                if self.mesh is not None:
+                    self.mesh.material = self.material
+
+        if len(corners):
+            self.corners.extend(corners[_fan_triangles(records.corner_counts)[1].ravel()])
+
+
+def iter_obj_meshes(filename, file=None, chunk_size=STREAM_CHUNK_SIZE, indexed=False, keep_vertices=True):
+    '''
+    Parse an OBJ file `chunk_size` bytes at a time, yielding every mesh as soon as the next
+    `o` record (or the end of the file) is reached, so meshes can be uploaded while the rest
+    of the file is still being read. The meshes are the same as parse_obj_file's.
+
+    Parsed records are appended to growable float32 arrays, so memory is bounded by the
+    chunk size, the v/vt/vn records and the largest mesh. Without `keep_vertices` the
+    records are dropped at every `o` boundary, which bounds memory for files of any size
+    as long as no face refers to a vertex of an earlier object. Faces may not refer to
+    records further down the file than their own chunk.
+    '''
+    parser = _ObjStreamParser(os.path.dirname(filename), indexed, keep_vertices)
+    return _stream_obj_chunks(parser, filename, file, chunk_size)
+
+
+def _stream_obj_chunks(parser, filename, file, chunk_size):
+    try:
+        f = open(filename, 'rb') if file is None else file
+        try:
+            tail = b''
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                # hand over whole lines only, keeping the last partial line for the next chunk
+                chunk = tail + chunk
+                end = max(chunk.rfind(b'\n'), chunk.rfind(b'\r')) + 1
+                chunk, tail = chunk[:end], chunk[end:]
+                if chunk:
+                    yield from parser.feed(chunk.decode())
+            yield from parser.feed(tail.decode())
+            yield from parser.close()
+        finally:
+            if file is None:
+                f.close()
+    except (UnicodeDecodeError, OSError):
+        raise ModelDecodeException
+
+
+###################################################
+#   Binary mesh cache:
+###################################################
+
+CACHE_SUFFIX = '.meshcache'
+
+_CACHE_MAGIC = b'OBJMESH\0'
+_CACHE_VERSION = 4
+# Shared by the binary cache formats (meshes, atlases, scenes): a preamble of magic,
+# version and JSON header size, then sections aligned to CACHE_ALIGNMENT bytes
+CACHE_PREAMBLE = struct.Struct('<8sII')
+CACHE_ALIGNMENT = 16
+_CACHE_SECTIONS = (('vertices', np.float32), ('normals', np.float32),
+                   ('tex_coords', np.float32), ('tangents', np.float32), ('indices', np.uint32))
+
+
+def source_key(filename):
+    '''
+    What a cache is keyed on for one of its source files: path, modification time and size.
+    '''
+    stat = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def align_offset(offset):
+    return -(-offset // CACHE_ALIGNMENT) * CACHE_ALIGNMENT
+
+
+@contextmanager
+def atomic_write(filename):
+    '''
+    Open a temporary file next to `filename` for writing in binary mode, and replace
+    `filename` with it once the block completes, so a reader never sees a partially written
+    file. Every call gets its own temporary file, so processes and threads writing the
+    same file at once do not clash; the last one to finish wins.
+    '''
+    f = tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(os.path.abspath(filename)),
+                                    prefix=os.path.basename(filename) + '.', suffix='.tmp', delete=False)
+    try:
+        with f:
+            yield f
+        os.replace(f.name, filename)
+    except BaseException:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+        raise
+
+
+def write_mesh_cache(cache_filename, mesh_list, sources):
+    '''
+    Write indexed meshes into a cache file made of a JSON header followed by raw
+    float32/uint32 sections. `sources` are the files the cache is keyed on.
+    '''
+    header = {'sources': [source_key(source) for source in sources], 'meshes': []}
+    arrays = []
+    offset = 0
+    for mesh in mesh_list:
+        material = mesh.material
+        entry = {
+            'name': mesh.name,
+            'emitted_count': mesh.emitted_count,
+            'aabb': [list(mesh.aabb[0]), list(mesh.aabb[1])],
+            'material': [material.name, list(material.diffuse), list(material.ambient), list(material.specular),
+                         list(material.emission), material.shininess, material.texture_name],
+            'sections': {},
+        }
+        for name, dtype in _CACHE_SECTIONS:
+            array = np.ascontiguousarray(getattr(mesh, name), dtype=dtype)
+            entry['sections'][name] = [offset, array.size]
+            arrays.append((offset, array))
+            offset = align_offset(offset + array.nbytes)
+        header['meshes'].append(entry)
+
+    header_bytes = json.dumps(header).encode()
+    data_start = align_offset(CACHE_PREAMBLE.size + len(header_bytes))
+
+    with atomic_write(cache_filename) as f:
+        f.write(CACHE_PREAMBLE.pack(_CACHE_MAGIC, _CACHE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for array_offset, array in arrays:
+            f.seek(data_start + array_offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def load_mesh_cache(cache_filename):
+    '''
+    Load meshes from a cache file as read-only memory-mapped arrays, without parsing.
+    Returns None if the cache is missing, unreadable or older than any of its sources.
+    '''
+    try:
+        with open(cache_filename, 'rb') as f:
+            magic, version, header_size = CACHE_PREAMBLE.unpack(f.read(CACHE_PREAMBLE.size))
+            if magic != _CACHE_MAGIC or version != _CACHE_VERSION:
+                return None
+            header = json.loads(f.read(header_size))
+        if any(source_key(source['path']) != source for source in header['sources']):
+            return None
+        data = np.memmap(cache_filename, dtype=np.uint8, mode='r')
+    except (OSError, ValueError, struct.error):
+        return None
+
+    data_start = align_offset(CACHE_PREAMBLE.size + header_size)
+    mesh_list = []
+    for entry in header['meshes']:
+        mesh = Mesh(entry['name'])
+        mesh.material = Material(*entry['material'])
+        mesh.emitted_count = entry['emitted_count']
+        mesh.aabb = tuple(entry['aabb'])
+        for name, dtype in _CACHE_SECTIONS:
+            offset, size = entry['sections'][name]
+            start = data_start + offset
+            setattr(mesh, name, data[start:start + size * np.dtype(dtype).itemsize].view(dtype))
+        mesh_list.append(mesh)
+    return mesh_list
+
+
+def load_obj_meshes(filename, chunk_size=None):
+    '''
+    Return the indexed meshes of an OBJ file from its binary cache, parsing the file
+    and rebuilding the cache when it is missing or stale. Missing normals and the tangents
+    are generated once, before the meshes are cached (see model.normals), and the meshes
+    are reordered for the vertex cache and overdraw (see model.optimize). With `chunk_size` the file is
+    streamed in chunks of that many bytes (see iter_obj_meshes), which also keeps every
+    single NumPy or regex call short, e.g. so that a loader thread holds the GIL briefly.
+    '''
+    cache_filename = filename + CACHE_SUFFIX
+    mesh_list = load_mesh_cache(cache_filename)
+    if mesh_list is not None:
+        return mesh_list
+
+    location = os.path.dirname(filename)
+    if chunk_size:
+        parser = _ObjStreamParser(location, indexed=True, keep_vertices=True)
+        mesh_list = list(_stream_obj_chunks(parser, filename, None, chunk_size))
+        libraries = parser.libraries
+    else:
+        file_contents = _read_obj_file(filename)
+        mesh_list = _parse_obj_arrays(file_contents, location, indexed=True)
+        libraries = re.findall(r'^[ \t]*mtllib[ \t]+(\S+)', file_contents, re.M)
+    for mesh in mesh_list:
+        optimize_mesh(add_mesh_normals(mesh))
+
+    sources = [filename] + [os.path.join(location, name) for name in libraries]
+    try:
+        write_mesh_cache(cache_filename, mesh_list, sources)
+    except OSError:
+        pass    # The cache is only an optimization, e.g. the model directory may be read-only
     return mesh_list
 
 
@@ -193,7 +948,96 @@ def parse_obj_file(filename, file=None):
 #   Decoder definitions start here:
 ###################################################
 
+UPLOAD_BLOCK = 1 << 16
+
+
+def allocate_vertex_list(program, count, index_count, batch, group, **formats):
+    '''
+    An indexed vertex list with room for `count` vertices and `index_count` indices, not
+    filled in. pyglet would copy the indices through a Python list, so the list is created
+    in the domain found with a one-vertex probe list instead.
+    '''
+    probe = program.vertex_list_indexed(1, GL_TRIANGLES, [0], batch, group, **formats)
+    domain = probe.domain
+    probe.delete()
+    return domain.create(count, index_count)
+
+
+def set_attribute_array(vertex_list, name, array, first=0):
+    '''
+    Copy an array into a vertex list attribute from vertex `first` on, with a single block
+    copy instead of pyglet's per-element conversion of Python sequences.
+    '''
+    buffer = vertex_list.domain.attrib_name_buffers[name]
+    rows = np.reshape(array, (-1, buffer.count))
+    start = vertex_list.start + first
+    np.ctypeslib.as_array(buffer.data).reshape(-1, buffer.count)[start:start + len(rows)] = rows
+    buffer.invalidate_region(start, len(rows))
+
+
+def set_index_array(vertex_list, indices, first=0):
+    '''
+    Copy indices (relative to the vertex list) into its index buffer from index `first` on.
+    '''
+    buffer = vertex_list.domain.index_buffer
+    start = vertex_list.index_start + first
+    np.ctypeslib.as_array(buffer.data)[start:start + len(indices)] = np.asarray(indices) + vertex_list.start
+    buffer.invalidate_region(start, len(indices))
+
+
+def upload_vertex_list(program, count, indices, batch, group, block=UPLOAD_BLOCK, **attributes):
+    '''
+    Generator that creates an indexed vertex list and fills it `block` vertices or indices
+    per step, so the caller can spread a large upload over several frames. `attributes`
+    map names to (format, array of `count` rows). Vertices are filled before indices, and
+    unfilled indices are 0, so a partly uploaded list only draws complete triangles.
+    Returns the vertex list.
+    '''
+    formats = {name: fmt for name, (fmt, _) in attributes.items()}
+    vertex_list = allocate_vertex_list(program, count, len(indices), batch, group, **formats)
+    arrays = {name: np.reshape(array, (count, -1)) for name, (_, array) in attributes.items()}
+    for first in range(0, count, block):
+        for name, array in arrays.items():
+            set_attribute_array(vertex_list, name, array[first:first + block], first)
+        yield
+    for first in range(0, len(indices), block):
+        set_index_array(vertex_list, indices[first:first + block], first)
+        yield
+    return vertex_list
+
+
+class VertexStats:
+    '''
+    Vertex buffer statistics of an indexed model compared to the expanded triangle soup.
+    '''
+    def __init__(self):
+        self.unique_vertices = 0
+        self.emitted_vertices = 0
+        self.indexed_bytes = 0
+        self.soup_bytes = 0
+
+    def add(self, mesh, vertex_size):
+        self.unique_vertices += len(mesh.vertices) // 3
+        self.emitted_vertices += mesh.emitted_count
+        self.indexed_bytes += len(mesh.vertices) // 3 * vertex_size + len(mesh.indices) * 4
+        self.soup_bytes += mesh.emitted_count * vertex_size
+
+    @property
+    def bytes_saved(self):
+        return self.soup_bytes - self.indexed_bytes
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(unique_vertices={self.unique_vertices}, '
+                f'emitted_vertices={self.emitted_vertices}, bytes_saved={self.bytes_saved})')
+
+
 class OBJModelDecoder(ModelDecoder):
+    def __init__(self, atlas=None, packed=False):
+        # a model.atlas.TextureAtlas: its textured meshes share one material group
+        self.atlas = atlas
+        # upload vertices in the compact format of model.quantize
+        self.packed = packed
+
     def get_file_extensions(self):
         return ['.obj']
 
@@ -202,33 +1046,87 @@ class OBJModelDecoder(ModelDecoder):
         if not batch:
             batch = pyglet.graphics.Batch()
 
-        mesh_list = parse_obj_file(filename=filename, file=file)
+        if file is None and os.path.isfile(filename):
+            mesh_list = load_obj_meshes(filename)
+        else:
+            mesh_list = [optimize_mesh(add_mesh_normals(mesh))
+                         for mesh in parse_obj_file(filename=filename, file=file, indexed=True)]
+
+        model = Model(vertex_lists=[], groups=[], batch=batch)
+        for _ in upload_meshes(model, mesh_list, group, atlas=self.atlas, packed=self.packed):
+            pass
+        return model
 
-        vertex_lists = []
-        groups = []
 
-        for mesh in mesh_list:
-            material = mesh.material
-            count = len(mesh.vertices) // 3
-            if material.texture_name:
-                program = pyglet.model.get_default_textured_shader()
-                texture = pyglet.resource.texture(material.texture_name)
-                matgroup = TexturedMaterialGroup(material, program, texture, parent=group)
-                vertex_lists.append(program.vertex_list(count, GL_TRIANGLES, batch, matgroup,
-                                                        position=('f', mesh.vertices),
-                                                        normals=('f', mesh.normals),
-                                                        tex_coords=('f', mesh.tex_coords),
-                                                        colors=('f', material.diffuse * count)))
+def upload_meshes(model, mesh_list, group=None, textures=None, block=UPLOAD_BLOCK, atlas=None, packed=False):
+    '''
+    Generator that uploads indexed OBJ meshes into `model` (usually still empty), yielding
+    after every texture and every block of vertices or indices (see upload_vertex_list).
+    `textures` maps texture names to decoded images; the others are loaded with
+    pyglet.resource. Meshes textured with an image of `atlas` (a model.atlas.TextureAtlas)
+    get their texture coordinates moved into it and all share one material group.
+    With `packed`, vertices are uploaded in the compact format of model.quantize and the
+    material color becomes a uniform; every mesh then has a group of its own, atlas meshes
+    included, as the groups also hold the mesh's position range.
+    Returns the model, with its vertex_stats.
+    '''
+    textures = textures or {}
+    model.vertex_stats = VertexStats()
+    atlas_group = None
+
+    for mesh in mesh_list:
+        material = mesh.material
+        count = len(mesh.vertices) // 3
+        tex_coords = texture = None
+        if material.texture_name and atlas is not None:
+            tex_coords = atlas.map_tex_coords(material.texture_name, mesh.tex_coords)
+        in_atlas = tex_coords is not None
+        if in_atlas:
+            texture = atlas.texture
+        elif material.texture_name:
+            image = textures.get(material.texture_name)
+            texture = image.get_texture() if image else pyglet.resource.texture(material.texture_name)
+            yield
+            tex_coords = mesh.tex_coords
+
+        if packed:
+            program = get_packed_program(textured=texture is not None)
+            attributes, offset, extent = packed_attributes(mesh, tex_coords)
+            if texture is not None:
+                matgroup = PackedTexturedMaterialGroup(material, program, texture, offset, extent, parent=group)
+                vertex_size = PACKED_TEXTURED_VERTEX_SIZE
+            else:
+                matgroup = PackedMaterialGroup(material, program, offset, extent, parent=group)
+                vertex_size = PACKED_VERTEX_SIZE
+        elif texture is not None:
+            program = pyglet.model.get_default_textured_shader()
+            if in_atlas:
+                if atlas_group is None:
+                    atlas_group = TexturedMaterialGroup(atlas.material, program, atlas.texture, parent=group)
+                matgroup = atlas_group
             else:
-                program = pyglet.model.get_default_shader()
-                matgroup = MaterialGroup(material, program, parent=group)
-                vertex_lists.append(program.vertex_list(count, GL_TRIANGLES, batch, matgroup,
-                                                        position=('f', mesh.vertices),
-                                                        normals=('f', mesh.normals),
-                                                        colors=('f', material.diffuse * count)))
-            groups.append(matgroup)
-
-        return Model(vertex_lists=vertex_lists, groups=groups, batch=batch)
+                matgroup = TexturedMaterialGroup(material, program, texture, parent=group)
+            colors = np.broadcast_to(np.float32(material.diffuse), (count, 4))
+            attributes = dict(position=('f', mesh.vertices), normals=('f', mesh.normals),
+                              tex_coords=('f', tex_coords), colors=('f', colors))
+            vertex_size = (3 + 3 + 2 + 4) * 4
+        else:
+            program = pyglet.model.get_default_shader()
+            matgroup = MaterialGroup(material, program, parent=group)
+            colors = np.broadcast_to(np.float32(material.diffuse), (count, 4))
+            attributes = dict(position=('f', mesh.vertices), normals=('f', mesh.normals), colors=('f', colors))
+            vertex_size = (3 + 3 + 4) * 4
+        matgroup.matrix = model.matrix
+
+        vertex_list = yield from upload_vertex_list(program, count, mesh.indices, model.batch, matgroup,
+                                                    block, **attributes)
+        # the model may have moved while the mesh was uploading
+        matgroup.matrix = model.matrix
+        model.vertex_lists.append(vertex_list)
+        model.groups.append(matgroup)
+        model.vertex_stats.add(mesh, vertex_size)
+
+    return model
 
 
 def get_decoders():
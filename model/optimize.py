@@ -0,0 +1,242 @@
+import numpy as np
+
+
+# Size of the FIFO post-transform vertex cache the triangle order is tuned for; orders
+# tuned for 16 entries do well on larger caches too
+VERTEX_CACHE_SIZE = 16
+
+# Triangle clusters may be up to this much worse in cache misses per triangle than their
+# run of the cache-optimized order, in exchange for finer overdraw sorting
+OVERDRAW_THRESHOLD = 1.05
+
+# Per-vertex attributes reordered by optimize_mesh, where the mesh has them
+VERTEX_ATTRIBUTES = ('vertices', 'normals', 'tex_coords', 'tangents', 'colors')
+
+# Arrays are turned into lists this many items at a time, so that a loader thread running
+# the optimizer never holds the GIL for long (see assets.LOAD_CHUNK_SIZE)
+_LIST_BLOCK = 1 << 16
+
+
+def _as_list(array):
+    items = []
+    for start in range(0, len(array), _LIST_BLOCK):
+        items += array[start:start + _LIST_BLOCK].tolist()
+    return items
+
+
+def cache_misses(indices, cache_size=VERTEX_CACHE_SIZE):
+    '''
+    Simulate a FIFO vertex cache of `cache_size` entries over the index list. Returns the
+    number of cache misses (vertex shader runs) of every triangle.
+    '''
+    indices = np.asarray(indices).ravel()
+    if not len(indices):
+        return np.zeros(0, dtype=np.int64)
+    # a vertex is cached while fewer than cache_size vertices were inserted after it
+    inserted = [-cache_size - 1] * (int(indices.max()) + 1)
+    misses = bytearray(len(indices))
+    time = 0
+    for corner, vertex in enumerate(_as_list(indices)):
+        if time - inserted[vertex] > cache_size:
+            inserted[vertex] = time
+            time += 1
+            misses[corner] = 1
+    return np.frombuffer(misses, dtype=np.uint8).reshape(-1, 3).sum(axis=1)
+
+
+def acmr(indices, cache_size=VERTEX_CACHE_SIZE):
+    '''
+    Average cache miss ratio: vertex shader runs per triangle (0.5 at best for large
+    regular meshes, 3 at worst).
+    '''
+    triangles = len(np.asarray(indices).ravel()) // 3
+    return cache_misses(indices, cache_size).sum() / max(triangles, 1)
+
+
+def atvr(indices, cache_size=VERTEX_CACHE_SIZE):
+    '''
+    Average transform to vertex ratio: vertex shader runs per vertex used (1 at best).
+    '''
+    vertices = len(np.unique(np.asarray(indices).ravel()))
+    return cache_misses(indices, cache_size).sum() / max(vertices, 1)
+
+
+def tipsy_order(indices, vertex_count, cache_size=VERTEX_CACHE_SIZE):
+    '''
+    Triangle order for vertex cache locality by Tipsy (Sander, Nehab and Barczak, "Fast
+    Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007): emit all the
+    remaining triangles around a fanning vertex, then continue from the vertex of those
+    triangles that is still used and would stay in the cache longest, or from the most
+    recently used vertex that is still used at a dead end. Linear in the triangle count.
+    '''
+    indices = np.asarray(indices, dtype=np.int64).ravel()
+    triangle_count = len(indices) // 3
+    # triangles around every vertex
+    counts = np.bincount(indices, minlength=vertex_count)
+    offsets = _as_list(np.concatenate([[0], np.cumsum(counts)]))
+    adjacent = _as_list(np.argsort(indices, kind='stable') // 3)
+    live = _as_list(counts)
+    corners = _as_list(indices)
+
+    emitted = bytearray(triangle_count)
+    cached = [0] * vertex_count
+    order = []
+    dead_end = []
+    time = cache_size + 1
+    cursor = 0
+    fanning = corners[0] if corners else -1
+    while fanning >= 0:
+        candidates = []
+        for triangle in adjacent[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = 1
+            order.append(triangle)
+            for vertex in corners[3 * triangle:3 * triangle + 3]:
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if time - cached[vertex] > cache_size:
+                    cached[vertex] = time
+                    time += 1
+
+        # a candidate whose remaining triangles fit before it leaves the cache, oldest first
+        fanning, best = -1, -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                age = time - cached[vertex]
+                priority = age if age + 2 * live[vertex] <= cache_size else 0
+                if priority > best:
+                    fanning, best = vertex, priority
+        if fanning < 0:
+            while dead_end:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fanning = vertex
+                    break
+            else:
+                while cursor < vertex_count and live[cursor] == 0:
+                    cursor += 1
+                fanning = cursor if cursor < vertex_count else -1
+    return np.array(order, dtype=np.int64)
+
+
+def _clusters(triangles, cache_size, threshold):
+    '''
+    Start triangles of runs of a cache-optimized triangle order that can be drawn in any
+    order of runs. A run starts wherever all three vertices miss the cache (the order
+    jumped to another part of the mesh), and is split further as soon as its cache misses
+    per triangle, counted from a cold cache, are within `threshold` of those of the whole
+    run, so runs drawn in another order cost about as many misses as before.
+    '''
+    hard = np.union1d([0], np.flatnonzero(cache_misses(triangles, cache_size) == 3))
+    bounds = np.append(hard, len(triangles)).tolist()
+    corners = _as_list(triangles.ravel())
+    inserted = [-cache_size - 1] * (max(corners) + 1)
+    time = 0
+    starts = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        # misses of the whole run from a cold cache
+        time += cache_size + 1
+        total = 0
+        for vertex in corners[3 * start:3 * end]:
+            if time - inserted[vertex] > cache_size:
+                inserted[vertex] = time
+                time += 1
+                total += 1
+        limit = threshold * total / (end - start)
+
+        time += cache_size + 1
+        starts.append(start)
+        run_misses = 0
+        for triangle in range(start, end):
+            for vertex in corners[3 * triangle:3 * triangle + 3]:
+                if time - inserted[vertex] > cache_size:
+                    inserted[vertex] = time
+                    time += 1
+                    run_misses += 1
+            if triangle + 1 < end and run_misses <= limit * (triangle + 1 - starts[-1]):
+                starts.append(triangle + 1)
+                run_misses = 0
+                time += cache_size + 1
+    return np.array(starts, dtype=np.int64)
+
+
+def overdraw_order(points, indices, cache_size=VERTEX_CACHE_SIZE, threshold=OVERDRAW_THRESHOLD):
+    '''
+    Reorder the clusters of a cache-optimized triangle order (see _clusters) so that those
+    on the outside of the mesh, facing away from its center, come first: from most
+    viewpoints they are in front of the others, so later fragments fail the depth test
+    instead of being shaded again. Returns the triangle order.
+    '''
+    points = np.reshape(np.asarray(points, dtype=np.float64), (-1, 3))
+    triangles = np.reshape(np.asarray(indices, dtype=np.int64), (-1, 3))
+    if not len(triangles):
+        return np.zeros(0, dtype=np.int64)
+    starts = _clusters(triangles, cache_size, threshold)
+
+    corners = points[triangles]
+    # area weighted normals and centroids
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    normals = np.add.reduceat(normals, starts)
+    area_sums = np.add.reduceat(areas, starts)
+    centroids = np.add.reduceat(corners.mean(axis=1) * areas[:, None], starts)
+    centroids /= np.where(area_sums > 0, area_sums, 1)[:, None]
+    lengths = np.linalg.norm(normals, axis=1)
+    normals /= np.where(lengths > 0, lengths, 1)[:, None]
+
+    center = points[np.unique(triangles)].mean(axis=0)
+    keys = np.einsum('ij,ij->i', centroids - center, normals)
+    sizes = np.diff(np.append(starts, len(triangles)))
+    cluster_order = np.argsort(-keys, kind='stable')
+    # triangles of the clusters in their new order
+    first = np.repeat(starts[cluster_order], sizes[cluster_order])
+    position = np.arange(len(triangles)) - np.repeat(np.cumsum(sizes[cluster_order]) - sizes[cluster_order],
+                                                     sizes[cluster_order])
+    return first + position
+
+
+def vertex_fetch_order(indices, vertex_count):
+    '''
+    Vertex order by first use in the index list, so the vertex fetches of consecutive
+    triangles read neighbouring memory. Unused vertices go last. Returns the old index of
+    every new vertex, and the new index of every old vertex.
+    '''
+    indices = np.asarray(indices, dtype=np.int64).ravel()
+    first = np.full(vertex_count, len(indices), dtype=np.int64)
+    np.minimum.at(first, indices, np.arange(len(indices)))
+    order = np.argsort(first, kind='stable')
+    remap = np.empty(vertex_count, dtype=np.int64)
+    remap[order] = np.arange(vertex_count)
+    return order, remap
+
+
+def optimize_indices(points, indices, cache_size=VERTEX_CACHE_SIZE, threshold=OVERDRAW_THRESHOLD):
+    '''
+    Reorder the triangles of an indexed mesh for the vertex cache and against overdraw,
+    then its vertices for fetch locality. Returns the new indices and the old index of
+    every new vertex (to reorder the vertex attributes with).
+    '''
+    points = np.reshape(points, (-1, 3))
+    triangles = np.reshape(np.asarray(indices, dtype=np.int64), (-1, 3))
+    triangles = triangles[tipsy_order(triangles, len(points), cache_size)]
+    triangles = triangles[overdraw_order(points, triangles, cache_size, threshold)]
+    order, remap = vertex_fetch_order(triangles, len(points))
+    return remap[triangles].ravel(), order
+
+
+def optimize_mesh(mesh, cache_size=VERTEX_CACHE_SIZE, threshold=OVERDRAW_THRESHOLD):
+    '''
+    Optimize the draw order of a mesh with flat `vertices` and `indices` arrays in place
+    (see optimize_indices), like an indexed OBJ Mesh or a primitive of primitives.py.
+    Its VERTEX_ATTRIBUTES are reordered with the vertices, keeping their dtypes.
+    '''
+    vertex_count = len(mesh.vertices) // 3
+    indices, order = optimize_indices(mesh.vertices, mesh.indices, cache_size, threshold)
+    mesh.indices = indices.astype(np.asarray(mesh.indices).dtype)
+    for name in VERTEX_ATTRIBUTES:
+        attribute = np.asarray(getattr(mesh, name, []))
+        if attribute.size and vertex_count:
+            setattr(mesh, name, attribute.reshape(vertex_count, -1)[order].ravel())
+    return mesh
@@ -0,0 +1,141 @@
+import numpy as np
+
+from pyglet import gl
+from pyglet.model import BaseMaterialGroup
+
+import shader
+
+
+# Positions are stored as unsigned normalized shorts spanning the mesh AABB
+POSITION_BITS = 16
+_POSITION_MAX = (1 << POSITION_BITS) - 1
+
+# Octahedral normals are stored as two signed normalized shorts
+_NORMAL_MAX = (1 << 15) - 1
+
+# Packed vertex sizes in bytes: 3 x uint16 position, 2 x int16 normal, 2 x float16 UV
+PACKED_VERTEX_SIZE = 3 * 2 + 2 * 2
+PACKED_TEXTURED_VERTEX_SIZE = PACKED_VERTEX_SIZE + 2 * 2
+
+
+def quantize_positions(vertices, aabb=None):
+    '''
+    Quantize positions to POSITION_BITS-bit integers spanning `aabb` (computed from the
+    vertices if not given). Returns the (N, 3) uint16 array, the AABB minimum and its
+    extent; a position decodes as offset + q / 65535 * extent, within half a step
+    (extent / 65535 / 2) of the original on every axis.
+    '''
+    vertices = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+    if aabb is None:
+        aabb = (vertices.min(axis=0, initial=np.inf), vertices.max(axis=0, initial=-np.inf))
+    offset = np.asarray(aabb[0], dtype=np.float32)
+    extent = np.asarray(aabb[1], dtype=np.float32) - offset
+    if not len(vertices):
+        return np.zeros((0, 3), dtype=np.uint16), np.zeros(3, np.float32), np.zeros(3, np.float32)
+    # flat axes quantize to 0 and decode to the offset
+    steps = np.where(extent > 0, extent, 1) / _POSITION_MAX
+    quantized = np.rint((vertices - offset) / steps)
+    return np.clip(quantized, 0, _POSITION_MAX).astype(np.uint16), offset, extent
+
+
+def dequantize_positions(quantized, offset, extent):
+    '''
+    Decode quantize_positions output the way the packed vertex shader does.
+    '''
+    return offset + quantized.astype(np.float32) / np.float32(_POSITION_MAX) * extent
+
+
+def octahedral_encode(normals):
+    '''
+    Map unit normals onto the octahedron |x| + |y| + |z| = 1, unfold its lower half over the
+    upper one and store the (x, y) of the result as (N, 2) signed normalized shorts.
+    Zero normals encode as (0, 0), which decodes to +z.
+    '''
+    normals = np.reshape(np.asarray(normals, dtype=np.float32), (-1, 3))
+    length = np.abs(normals).sum(axis=1, keepdims=True)
+    octahedron = normals / np.where(length > 0, length, 1)
+    xy = octahedron[:, :2]
+    signs = np.where(xy >= 0, 1.0, -1.0)
+    folded = (1 - np.abs(xy[:, ::-1])) * signs
+    xy = np.where(octahedron[:, 2:] < 0, folded, xy)
+    return np.rint(np.clip(xy, -1, 1) * _NORMAL_MAX).astype(np.int16)
+
+
+def octahedral_decode(encoded):
+    '''
+    Decode octahedral_encode output to unit normals, as the packed vertex shader does.
+    '''
+    xy = np.maximum(encoded.astype(np.float32) / _NORMAL_MAX, -1)
+    normals = np.concatenate([xy, 1 - np.abs(xy).sum(axis=1, keepdims=True)], axis=1)
+    fold = np.maximum(-normals[:, 2:], 0)
+    normals[:, :2] -= np.where(normals[:, :2] >= 0, fold, -fold)
+    return normals / np.linalg.norm(normals, axis=1, keepdims=True)
+
+
+def half_tex_coords(tex_coords):
+    '''
+    Texture coordinates as the raw bits of half floats: pyglet has no half float attribute
+    format, so they are uploaded as unsigned shorts and converted in the vertex shader.
+    '''
+    return np.reshape(np.asarray(tex_coords, dtype=np.float32), (-1, 2)).astype(np.float16).view(np.uint16)
+
+
+def get_packed_program(textured=False):
+    if textured:
+        return shader.get_program(shader.vertex_source_packed_textured, shader.fragment_source_packed_textured)
+    return shader.get_program(shader.vertex_source_packed, shader.fragment_source_packed)
+
+
+def packed_attributes(mesh, tex_coords=None):
+    '''
+    The packed vertex attributes of an indexed OBJ mesh for upload_vertex_list, with the
+    position offset and extent its group decodes them with.
+    '''
+    position, offset, extent = quantize_positions(mesh.vertices, mesh.aabb)
+    attributes = dict(position=('Sn', position), normals=('sn', octahedral_encode(mesh.normals)))
+    if tex_coords is not None:
+        attributes['tex_coords'] = ('S', half_tex_coords(tex_coords))
+    return attributes, offset, extent
+
+
+class PackedMaterialGroup(BaseMaterialGroup):
+    '''
+    Material group of a mesh in the packed vertex format: the position offset and extent
+    of the mesh and the material's diffuse color are uniforms instead of vertex data, so
+    groups are only equal (and drawn together) if those match too.
+    '''
+    def __init__(self, material, program, offset, extent, order=0, parent=None):
+        super().__init__(material, program, order, parent)
+        self.offset = tuple(map(float, offset))
+        self.extent = tuple(map(float, extent))
+        self.color = tuple(map(float, material.diffuse))
+
+    def set_state(self):
+        self.program.use()
+        self.program['model'] = self.matrix
+        self.program['position_offset'] = self.offset
+        self.program['position_extent'] = self.extent
+        self.program['material_color'] = self.color
+
+    def _key(self):
+        return self.order, self.parent, self.program, self.offset, self.extent, self.color
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self._key() == other._key()
+
+
+class PackedTexturedMaterialGroup(PackedMaterialGroup):
+    def __init__(self, material, program, texture, offset, extent, order=0, parent=None):
+        super().__init__(material, program, offset, extent, order, parent)
+        self.texture = texture
+
+    def set_state(self):
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(self.texture.target, self.texture.id)
+        super().set_state()
+
+    def _key(self):
+        return super()._key() + (self.texture.target, self.texture.id)
@@ -0,0 +1,170 @@
+import numpy as np
+
+from model.normals import compute_tangents
+from model.obj import CACHE_SUFFIX, Mesh, load_mesh_cache, load_obj_meshes, write_mesh_cache
+from model.optimize import optimize_mesh
+
+
+# Boundary edges get a constraint plane with this weight (times the squared edge length),
+# so open borders such as the bottom of the bunny do not shrink
+BOUNDARY_WEIGHT = 1000.0
+
+LOD_RATIOS = (1.0, 0.5, 0.25, 0.125)
+
+
+def _plane_quadrics(planes, weights):
+    return planes[:, :, None] * planes[:, None, :] * weights[:, None, None]
+
+
+def _vertex_quadrics(points, triangles):
+    '''
+    Quadric error matrix (4x4) of every vertex: the area-weighted sum of the squared
+    distances to the planes of its faces, plus constraint planes along boundary edges.
+    '''
+    corners = points[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = np.linalg.norm(normals, axis=1)
+    normals = normals / np.where(areas > 0, areas, 1)[:, None]
+    planes = np.concatenate([normals, -np.einsum('ij,ij->i', normals, corners[:, 0])[:, None]], axis=1)
+    face_quadrics = _plane_quadrics(planes, areas / 2)
+
+    quadrics = np.zeros((len(points), 4, 4))
+    for corner in range(3):
+        np.add.at(quadrics, triangles[:, corner], face_quadrics)
+
+    # boundary edges are used by exactly one triangle
+    edges = np.stack([triangles, np.roll(triangles, -1, axis=1)], axis=2).reshape(-1, 2)
+    keys = np.sort(edges, axis=1)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    boundary = np.flatnonzero(counts[inverse.ravel()] == 1)
+    if len(boundary):
+        a, b = points[edges[boundary, 0]], points[edges[boundary, 1]]
+        directions = np.cross(b - a, normals[boundary // 3])
+        lengths = np.linalg.norm(directions, axis=1)
+        directions = directions / np.where(lengths > 0, lengths, 1)[:, None]
+        planes = np.concatenate([directions, -np.einsum('ij,ij->i', directions, a)[:, None]], axis=1)
+        edge_quadrics = _plane_quadrics(planes, BOUNDARY_WEIGHT * np.sum((b - a) ** 2, axis=1))
+        np.add.at(quadrics, edges[boundary, 0], edge_quadrics)
+        np.add.at(quadrics, edges[boundary, 1], edge_quadrics)
+    return quadrics
+
+
+def _quadric_error(quadrics, points):
+    homogeneous = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    return np.einsum('ni,nij,nj->n', homogeneous, quadrics, homogeneous)
+
+
+def simplify_mesh(vertices, indices, target_triangles, attributes=()):
+    '''
+    Reduce an indexed triangle mesh to at most `target_triangles` triangles with quadric
+    error edge collapses (Garland & Heckbert).
+
+    Collapses run in rounds instead of one at a time: every vertex picks its cheapest
+    incident edge, and the edges picked by both of their endpoints (a matching, so no two
+    collapses share a vertex) collapse together, cheapest first. Each edge collapses onto
+    the cheaper of its two endpoints and their midpoint.
+
+    `attributes` are per-vertex arrays (normals, tex_coords, ...) that follow the vertices:
+    a collapsed vertex takes the values of the endpoint it moved to, or their mean.
+    Returns the new flat vertices (float32) and indices (uint32), then the attributes.
+    '''
+    points = np.reshape(np.asarray(vertices, dtype=np.float64), (-1, 3)).copy()
+    triangles = np.reshape(np.asarray(indices, dtype=np.int64), (-1, 3))
+    attributes = [np.reshape(np.asarray(a, dtype=np.float32), (len(points), -1)).copy() for a in attributes]
+    quadrics = _vertex_quadrics(points, triangles)
+
+    while len(triangles) > target_triangles:
+        edges = np.unique(np.sort(np.stack([triangles, np.roll(triangles, -1, axis=1)], axis=2).reshape(-1, 2),
+                                  axis=1), axis=0)
+        a, b = edges.T
+        edge_quadrics = quadrics[a] + quadrics[b]
+        candidates = np.stack([points[a], points[b], (points[a] + points[b]) / 2])
+        errors = np.stack([_quadric_error(edge_quadrics, candidate) for candidate in candidates])
+        choice = np.argmin(errors, axis=0)
+        cost = errors[choice, np.arange(len(edges))]
+
+        # edges that are the cheapest for both of their endpoints
+        rank = np.empty(len(edges), dtype=np.int64)
+        rank[np.argsort(cost, kind='stable')] = np.arange(len(edges))
+        best = np.full(len(points), len(edges), dtype=np.int64)
+        np.minimum.at(best, a, rank)
+        np.minimum.at(best, b, rank)
+        selected = np.flatnonzero((best[a] == rank) & (best[b] == rank))
+        if not len(selected):
+            break
+        # a collapse removes about two triangles
+        needed = max(1, (len(triangles) - target_triangles + 1) // 2)
+        selected = selected[np.argsort(cost[selected], kind='stable')][:needed]
+
+        # move a onto the chosen position and merge b into it
+        keep, drop, choice = a[selected], b[selected], choice[selected]
+        points[keep] = candidates[choice, selected]
+        quadrics[keep] += quadrics[drop]
+        for attribute in attributes:
+            attribute[keep] = np.where((choice == 1)[:, None], attribute[drop],
+                                       np.where((choice == 2)[:, None], (attribute[keep] + attribute[drop]) / 2,
+                                                attribute[keep]))
+        remap = np.arange(len(points))
+        remap[drop] = keep
+        triangles = remap[triangles]
+
+        # drop collapsed triangles and triangles that became duplicates
+        triangles = triangles[(triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+                              (triangles[:, 2] != triangles[:, 0])]
+        _, first = np.unique(np.sort(triangles, axis=1), axis=0, return_index=True)
+        triangles = triangles[np.sort(first)]
+
+    # keep only the vertices still in use, in order of first use
+    used, inverse = np.unique(triangles, return_inverse=True)
+    indices = inverse.reshape(-1).astype(np.uint32)
+    return (points[used].astype(np.float32).ravel(), indices,
+            *(attribute[used].ravel() for attribute in attributes))
+
+
+def simplify_obj_mesh(mesh, ratio):
+    '''
+    A simplified copy of an indexed OBJ Mesh (see parse_obj_file) with about `ratio` of its
+    triangles. Normals are renormalized after averaging, and tangents (if the mesh has
+    them) are computed again for the new triangles; the result is reordered for drawing
+    like loaded meshes (see model.optimize).
+    '''
+    target = max(1, int(len(mesh.indices) // 3 * ratio))
+    vertices, indices, normals, tex_coords = simplify_mesh(
+        mesh.vertices, mesh.indices, target, attributes=(mesh.normals, mesh.tex_coords))
+    normals = normals.reshape(-1, 3)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = normals / np.where(lengths > 0, lengths, 1)
+
+    simplified = Mesh(mesh.name)
+    simplified.material = mesh.material
+    simplified.vertices, simplified.indices = vertices, indices
+    simplified.normals, simplified.tex_coords = normals.astype(np.float32).ravel(), tex_coords
+    if len(mesh.tangents):
+        simplified.tangents = compute_tangents(vertices, simplified.normals, tex_coords, indices)
+    simplified.emitted_count = len(indices)
+    simplified.aabb = mesh.aabb
+    return optimize_mesh(simplified)
+
+
+def load_obj_lods(filename, ratios=LOD_RATIOS):
+    '''
+    Level-of-detail chain of an OBJ file: for every ratio, the list of its indexed meshes
+    simplified to about that fraction of their triangles (1.0 is the original). Levels are
+    cached next to the file like load_obj_meshes, keyed on the OBJ and its mesh cache.
+    '''
+    base = load_obj_meshes(filename)
+    levels = []
+    for ratio in ratios:
+        if ratio >= 1:
+            levels.append(base)
+            continue
+        cache_filename = f'{filename}.lod{ratio:g}{CACHE_SUFFIX}'
+        mesh_list = load_mesh_cache(cache_filename)
+        if mesh_list is None:
+            mesh_list = [simplify_obj_mesh(mesh, ratio) for mesh in base]
+            try:
+                write_mesh_cache(cache_filename, mesh_list, [filename, filename + CACHE_SUFFIX])
+            except OSError:
+                pass
+        levels.append(mesh_list)
+    return levels
@@ -1,28 +1,80 @@
 import pyglet
 from pyglet import window, app, shapes
 from pyglet.math import Mat4, Vec3, Vec4
-import math
+import ctypes
+import weakref
+from collections import OrderedDict
+import numpy as np
 from pyglet.gl import *
+from pyglet.graphics.vertexarray import VertexArray
+from pyglet.graphics.vertexbuffer import BufferObject
 
 import shader
+from model.optimize import optimize_mesh
+from culling import aabb_from_vertices, aabbs_in_frustum, transform_aabbs
+from transforms import TransformStore
 
 class CustomGroup(pyglet.graphics.Group):
     '''
     To draw multiple 3D shapes in Pyglet, you should make a group for an object.
     '''
-    def __init__(self, transform_mat: Mat4, order):
+    def __init__(self, transform_mat: Mat4, order, transforms=None, transform_index=None, shader_program=None):
         super().__init__(order)
 
         '''
-        Create shader program for each shape
+        Shapes with the same shader sources share one compiled program; callers adding many
+        shapes look it up once and pass it in (the program is then not bound here)
         '''
-        self.shader_program = shader.create_program(
-            shader.vertex_source_default, shader.fragment_source_default
-        )
+        bind = shader_program is None
+        if shader_program is None:
+            shader_program = shader.get_program(shader.vertex_source_default, shader.fragment_source_default)
+        self.shader_program = shader_program
+
+        '''
+        The model matrix lives in a TransformStore shared by all shapes of a window; with
+        transform_index, in a row already added to it (transform_mat is then unused)
+        '''
+        self.transforms = transforms if transforms is not None else TransformStore(1)
+        if transform_index is None:
+            transform_index = self.transforms.add(transform_mat)
+        self.transform_index = transform_index
+        self._transform_mat = None
+        self._transform_version = -1
 
-        self.transform_mat = transform_mat
         self.indexed_vertices_list = None
-        self.shader_program.use()
+        # bound to texture unit 0 by the render queue, shapes are sorted by it
+        self.texture = None
+        if bind:
+            self.shader_program.use()
+
+    @property
+    def transform_mat(self) -> Mat4:
+        # Only rebuild the Mat4 when the stored matrix changed
+        version = self.transforms.versions[self.transform_index]
+        if version != self._transform_version:
+            self._transform_mat = self.transforms.get(self.transform_index)
+            self._transform_version = version
+        return self._transform_mat
+
+    @transform_mat.setter
+    def transform_mat(self, transform_mat: Mat4):
+        self.transforms.set(self.transform_index, transform_mat)
+
+    @property
+    def _assigned_batches(self):
+        '''
+        pyglet gives every group a WeakSet of the batches using it, six objects per shape for
+        the garbage collector to walk in every full collection. Shapes are drawn by the render
+        queue rather than through a batch, so the set is only made once a batch asks for it.
+        '''
+        if self._batches is None:
+            self._batches = weakref.WeakSet()
+        return self._batches
+
+    @_assigned_batches.setter
+    def _assigned_batches(self, batches):
+        # Group.__init__ sets an empty one
+        self._batches = batches or None
 
     def set_state(self):
         self.shader_program.use()
@@ -41,118 +93,456 @@ class CustomGroup(pyglet.graphics.Group):
         return hash((self.order)) 
     
 
+def as_matrix_array(transforms):
+    '''
+    Convert Mat4s (or anything holding 16 floats per matrix) into an (N, 4, 4) float32 array.
+    Each matrix keeps pyglet's column-major layout, so arr[i][c] is column c of matrix i.
+    '''
+    return np.array(transforms, dtype=np.float32).reshape(-1, 4, 4)
+
+
+class InstancedShape:
+    '''
+    Draws one mesh many times with a single glDrawElementsInstanced call.
+    The mesh is uploaded once, and the per-instance model matrices in `transforms` (a
+    TransformStore, so instances rotate by their angular velocity like shapes do) are
+    written to the GPU with one bulk buffer update per frame when they changed. After
+    cull, only the instances whose bounding box is in the view frustum are uploaded and
+    drawn.
+    '''
+    def __init__(self, vertices, indices, colors, transforms, angular_velocity=Vec3(0, 0, 1)):
+        self.shader_program = shader.get_program(
+            shader.vertex_source_instanced, shader.fragment_source_default
+        )
+
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        colors = np.ascontiguousarray(colors, dtype=np.uint8)
+        indices = np.ascontiguousarray(indices, dtype=np.uint32)
+        self.index_count = len(indices)
+        matrices = as_matrix_array(transforms)
+        self.transforms = TransformStore(max(len(matrices), 1))
+        self.transforms.extend(matrices, angular_velocity)
+        aabb_min, aabb_max = aabb_from_vertices(vertices)
+        self.center, self.extent = (aabb_min + aabb_max) / 2, (aabb_max - aabb_min) / 2
+        # instances drawn by the last draw, all of them until cull says otherwise
+        self.visible = None
+        self.visibility = 0     # bumped when the visible set changes
+        self.drawn_count = 0
+        self._uploaded = None
+
+        self.vertex_array = VertexArray()
+        self.vertex_array.bind()
+
+        self.vertex_buffer = self._create_buffer(vertices, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, 0)
+
+        self.color_buffer = self._create_buffer(colors, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 4, GL_UNSIGNED_BYTE, GL_TRUE, 0, 0)
+
+        # model matrix: four vec4 columns advancing once per instance
+        self.instance_buffer = self._create_buffer(self.transforms.matrices, GL_DYNAMIC_DRAW)
+        for column in range(4):
+            glEnableVertexAttribArray(2 + column)
+            glVertexAttribPointer(2 + column, 4, GL_FLOAT, GL_FALSE, 64, 16 * column)
+            glVertexAttribDivisor(2 + column, 1)
+
+        self.index_buffer = self._create_buffer(indices, GL_STATIC_DRAW)
+        self.index_buffer.bind_to_index_buffer()
+
+        self.vertex_array.unbind()
+
+    @staticmethod
+    def _create_buffer(array, usage):
+        buffer = BufferObject(max(array.nbytes, 1), usage)
+        buffer.set_data(array.ctypes.data_as(ctypes.c_void_p))
+        return buffer
+
+    @property
+    def count(self):
+        return self.transforms.count
+
+    def set_transforms(self, transforms):
+        '''
+        Replace the model matrices; instances keep their angular velocity if the count stays.
+        '''
+        matrices = as_matrix_array(transforms)
+        velocity = self.transforms.angular_velocity if len(matrices) == self.count else Vec3(0, 0, 1)
+        store = TransformStore(max(len(matrices), 1))
+        store.extend(matrices, velocity)
+        self.transforms = store
+        self.visible = None
+        self.visibility += 1
+
+    def cull(self, planes):
+        '''
+        Keep the instances whose world-space bounding box is in the frustum `planes` (see
+        culling.frustum_planes) for the next draws, or all of them with planes None.
+        '''
+        visible = None
+        if planes is not None:
+            count = self.count
+            centers, extents = transform_aabbs(np.broadcast_to(self.center, (count, 3)),
+                                               np.broadcast_to(self.extent, (count, 3)), self.transforms.matrices)
+            visible = np.flatnonzero(aabbs_in_frustum(centers, extents, planes))
+        if visible is None or self.visible is None:
+            changed = visible is not self.visible
+        else:
+            changed = not np.array_equal(visible, self.visible)
+        if changed:
+            self.visible = visible
+            self.visibility += 1
+
+    def upload(self):
+        '''
+        Write the matrices of all visible instances with one buffer update.
+        '''
+        matrices = self.transforms.matrices
+        if self.visible is not None and len(self.visible) < self.count:
+            matrices = matrices[self.visible]
+        matrices = np.ascontiguousarray(matrices)
+        data = matrices.ctypes.data_as(ctypes.c_void_p)
+        if matrices.nbytes > self.instance_buffer.size:
+            self.instance_buffer.size = matrices.nbytes
+            self.instance_buffer.set_data(data)
+        elif matrices.nbytes:
+            self.instance_buffer.set_data_region(data, 0, matrices.nbytes)
+        self.drawn_count = len(matrices)
+
+    def draw(self):
+        # upload again only after the matrices or the visible set changed
+        state = (self.transforms, self.transforms.version, self.visibility)
+        if state != self._uploaded:
+            self.upload()
+            self._uploaded = state
+        if not self.drawn_count:
+            return
+        self.shader_program.use()
+        self.vertex_array.bind()
+        glDrawElementsInstanced(GL_TRIANGLES, self.index_count, GL_UNSIGNED_INT, None, self.drawn_count)
+        self.vertex_array.unbind()
+        self.shader_program.stop()
+
+
+def merge_meshes(meshes, matrices):
+    '''
+    Transform meshes into world space and concatenate them into one indexed mesh.
+    `meshes` holds (vertices, indices, colors) per shape and `matrices` the shapes' model
+    matrices in TransformStore layout. Shapes sharing the same arrays are transformed
+    together. Returns float32 vertices, uint8 colors and uint32 indices (all flat).
+    '''
+    groups = OrderedDict()
+    for i, mesh in enumerate(meshes):
+        groups.setdefault(tuple(id(array) for array in mesh), (mesh, []))[1].append(i)
+
+    vertex_parts, color_parts, index_parts = [], [], []
+    offset = 0
+    for (vertices, indices, colors), shape_indices in groups.values():
+        local = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+        indices = np.asarray(indices, dtype=np.int64)
+        colors = np.asarray(colors, dtype=np.uint8)
+        group_matrices = matrices[shape_indices]
+        # column-major storage holds M^T, so a row vector transforms as p @ M^T
+        world = np.einsum('vi,kij->kvj', local, group_matrices[:, :3, :3]) + group_matrices[:, None, 3, :3]
+        vertex_parts.append(world.reshape(-1))
+        color_parts.append(np.tile(colors, len(shape_indices)))
+        offsets = offset + len(local) * np.arange(len(shape_indices))
+        index_parts.append((indices[None, :] + offsets[:, None]).reshape(-1))
+        offset += len(local) * len(shape_indices)
+
+    return (np.concatenate(vertex_parts).astype(np.float32), np.concatenate(color_parts),
+            np.concatenate(index_parts).astype(np.uint32))
+
+
+class StaticMesh:
+    '''
+    Static geometry already in world space (see merge_meshes), drawn with one glDrawElements
+    call. Indices are stored as 16-bit when there are fewer than 65536 vertices, 32-bit
+    otherwise.
+    '''
+    def __init__(self, vertices, indices, colors):
+        self.shader_program = shader.get_program(
+            shader.vertex_source_default, shader.fragment_source_default
+        )
+
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        colors = np.ascontiguousarray(colors, dtype=np.uint8)
+        if len(vertices) // 3 <= 0xFFFF:
+            indices, self.index_type = np.ascontiguousarray(indices, dtype=np.uint16), GL_UNSIGNED_SHORT
+        else:
+            indices, self.index_type = np.ascontiguousarray(indices, dtype=np.uint32), GL_UNSIGNED_INT
+        self.index_count = len(indices)
+        self.nbytes = vertices.nbytes + colors.nbytes + indices.nbytes
+
+        self.vertex_array = VertexArray()
+        self.vertex_array.bind()
+
+        self.vertex_buffer = InstancedShape._create_buffer(vertices, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(0)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 0, 0)
+
+        self.color_buffer = InstancedShape._create_buffer(colors, GL_STATIC_DRAW)
+        glEnableVertexAttribArray(1)
+        glVertexAttribPointer(1, 4, GL_UNSIGNED_BYTE, GL_TRUE, 0, 0)
+
+        self.index_buffer = InstancedShape._create_buffer(indices, GL_STATIC_DRAW)
+        self.index_buffer.bind_to_index_buffer()
+
+        self.vertex_array.unbind()
+
+    def draw(self):
+        self.shader_program.use()
+        self.shader_program['model'] = Mat4()
+        self.vertex_array.bind()
+        glDrawElements(GL_TRIANGLES, self.index_count, self.index_type, None)
+        self.vertex_array.unbind()
+        self.shader_program.stop()
+
+    def delete(self):
+        for buffer in (self.vertex_buffer, self.color_buffer, self.index_buffer):
+            buffer.delete()
+        self.vertex_array.delete()
+
+
+def _as_scale(scale):
+    # accept a scalar or a Vec3/sequence of three factors
+    return np.resize(np.asarray(scale, dtype=np.float32), 3)
+
+
+def _normal_colors(normals):
+    # RGBA bytes visualizing the normal direction
+    normals = np.reshape(normals, (-1, 3))
+    colors = np.full((len(normals), 4), 255, dtype=np.uint8)
+    colors[:, :3] = (normals * 127.5 + 127.5).astype(np.uint8)
+    return colors.ravel()
+
+
 class Cube:
     '''
-    default structure of cube
+    default structure of cube: four vertices per face so each face has its own normal and UVs,
+    with the colors of the eight corners
     '''
+    corners = np.array([[-0.5, -0.5, 0.5], [0.5, -0.5, 0.5], [0.5, 0.5, 0.5], [-0.5, 0.5, 0.5],
+                        [-0.5, -0.5, -0.5], [0.5, -0.5, -0.5], [0.5, 0.5, -0.5], [-0.5, 0.5, -0.5]],
+                       dtype=np.float32)
+    corner_colors = np.array([[255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255], [255, 255, 255, 255],
+                              [255, 0, 0, 255], [0, 255, 0, 255], [0, 0, 255, 255], [255, 255, 255, 255]],
+                             dtype=np.uint8)
+    # counter-clockwise quads: front, back, bottom, top, right, left
+    faces = np.array([[0, 1, 2, 3], [4, 7, 6, 5], [4, 5, 1, 0], [6, 7, 3, 2], [5, 6, 2, 1], [7, 4, 0, 3]])
+    face_normals = np.array([[0, 0, 1], [0, 0, -1], [0, -1, 0], [0, 1, 0], [1, 0, 0], [-1, 0, 0]],
+                            dtype=np.float32)
+
     def __init__(self, scale=1.0):
-        self.vertices = [-0.5, -0.5, 0.5,
-            0.5, -0.5, 0.5,
-            0.5, 0.5, 0.5,
-            -0.5, 0.5, 0.5,
-            -0.5, -0.5, -0.5,
-            0.5, -0.5, -0.5,
-            0.5,0.5,-0.5,
-            -0.5,0.5,-0.5]
-        self.vertices = [scale[idx%3] * x for idx, x in enumerate(self.vertices)]
-    
-        self.indices = [0, 1, 2, 2, 3, 0,
-                    4, 7, 6, 6, 5, 4,
-                    4, 5, 1, 1, 0, 4,
-                    6, 7, 3, 3, 2, 6,
-                    5, 6, 2, 2, 1, 5,
-                    7, 4, 0, 0, 3, 7]
-    
-        self.colors = (255, 0,  0,255,
-                0, 255,  0,255,
-                0,   0,255,255,
-                255,255,255,255,
-                
-                255, 0,  0,255,
-                0, 255,  0,255,
-                0,   0,255,255,
-                255,255,255,255)
-        
+        self.vertices = (self.corners[self.faces] * _as_scale(scale)).ravel()
+        self.normals = np.repeat(self.face_normals, 4, axis=0).ravel()
+        self.tex_coords = np.tile(np.array([0, 0, 1, 0, 1, 1, 0, 1], dtype=np.float32), 6)
+        self.colors = self.corner_colors[self.faces].ravel()
+
+        quad = np.array([0, 1, 2, 2, 3, 0], dtype=np.uint32)
+        self.indices = (np.arange(6, dtype=np.uint32)[:, None] * 4 + quad).ravel()
+
+
 class Sphere:
     '''
-    default structure of sphere
+    default structure of sphere: a (stacks + 1) x (slices + 1) grid of shared vertices,
+    with the seam column duplicated for the UVs
     '''
     def __init__(self, stacks, slices, scale=1.0):
-        num_triangles = 2 * slices * (stacks - 1)
-
-        self.vertices = []
-        self.indices = []
-        self.colors = ()
-
-        for i in range(stacks):
-            phi0 = 0.5 * math.pi - (i * math.pi) / stacks
-            phi1 = 0.5 * math.pi - ((i + 1) * math.pi) / stacks
-            coord_v0 = 1.0 - float(i) / stacks
-            coord_v1 = 1.0 - float(i + 1) / stacks
-
-            y0 = scale * math.sin(phi0)
-            r0 = scale * math.cos(phi0)
-            y1 = scale * math.sin(phi1)
-            r1 = scale * math.cos(phi1)
-            y2 = y1
-            y3 = y0
-
-            for j in range(slices):
-                theta0 = (j * 2 * math.pi) / slices
-                theta1 = ((j + 1) * 2 * math.pi) / slices
-                coord_u0 = float(j) / slices
-                coord_u1 = float(j + 1) / slices
-
-                x0 = r0 * math.cos(theta0)
-                z0 = r0 * math.sin(-theta0)
-                u0 = coord_u0
-                v0 = coord_v0
-                x1 = r1 * math.cos(theta0)
-                z1 = r1 * math.sin(-theta0)
-                u1 = coord_u0
-                v1 = coord_v1
-                x2 = r1 * math.cos(theta1)
-                z2 = r1 * math.sin(-theta1)
-                u2 = coord_u1
-                v2 = coord_v1
-                x3 = r0 * math.cos(theta1)
-                z3 = r0 * math.sin(-theta1)
-                u3 = coord_u1
-                v3 = coord_v0
-
-                if (i != stacks - 1):
-                    self.vertices.append(x0)
-                    self.vertices.append(y0)
-                    self.vertices.append(z0)
-
-                    self.vertices.append(x1)
-                    self.vertices.append(y1)
-                    self.vertices.append(z1)
-
-                    self.vertices.append(x2)
-                    self.vertices.append(y2)
-                    self.vertices.append(z2)
-                    
-                    self.colors += (int(math.cos(phi0) * 255),int(math.cos(theta0) * 255),int(math.sin(phi0)*255),255)
-                    self.colors += (int(math.cos(phi0) * 255),int(math.cos(theta0) * 255),int(math.sin(phi0)*255),255)
-                    self.colors += (int(math.cos(phi0) * 255),int(math.cos(theta0) * 255),int(math.sin(phi0)*255),255)
-                
-                if (i != 0):
-                    self.vertices.append(x2)
-                    self.vertices.append(y2)
-                    self.vertices.append(z2)
-
-                    self.vertices.append(x3)
-                    self.vertices.append(y3)
-                    self.vertices.append(z3)
-
-                    self.vertices.append(x0)
-                    self.vertices.append(y0)
-                    self.vertices.append(z0)
-                    
-                    self.colors += (int(math.cos(phi0) * 255),int(math.cos(theta0) * 255),int(math.sin(phi0)*255),255)
-                    self.colors += (int(math.cos(phi0) * 255),int(math.cos(theta0) * 255),int(math.sin(phi0)*255),255)
-                    self.colors += (int(math.cos(phi0) * 255),int(math.cos(theta0) * 255),int(math.sin(phi0)*255),255)
-
-        for i in range(num_triangles*3):
-            self.indices.append(i)
\ No newline at end of file
+        # trigonometry on the 1D angle arrays, broadcast over the grid
+        phi = 0.5 * np.pi - np.arange(stacks + 1) * np.pi / stacks
+        theta = np.arange(slices + 1) * 2 * np.pi / slices
+        cos_phi, sin_phi = np.cos(phi)[:, None], np.sin(phi)[:, None]
+        cos_theta, sin_theta = np.cos(theta)[None, :], np.sin(theta)[None, :]
+
+        normals = np.empty((stacks + 1, slices + 1, 3), dtype=np.float32)
+        normals[..., 0] = cos_phi * cos_theta
+        normals[..., 1] = sin_phi
+        normals[..., 2] = -cos_phi * sin_theta
+        self.normals = normals.ravel()
+        self.vertices = (normals * _as_scale(scale)).ravel()
+
+        tex_coords = np.empty((stacks + 1, slices + 1, 2), dtype=np.float32)
+        tex_coords[..., 0] = np.arange(slices + 1) / slices
+        tex_coords[..., 1] = (1.0 - np.arange(stacks + 1) / stacks)[:, None]
+        self.tex_coords = tex_coords.ravel()
+
+        # same coloring as before, truncated and wrapped to bytes
+        colors = np.empty((stacks + 1, slices + 1, 4), dtype=np.int32)
+        colors[..., 0] = cos_phi * 255
+        colors[..., 1] = cos_theta * 255
+        colors[..., 2] = sin_phi * 255
+        colors[..., 3] = 255
+        self.colors = colors.astype(np.uint8).ravel()
+
+        # two triangles per quad, skipping the degenerate ones at the poles
+        p0 = (np.arange(stacks, dtype=np.uint32)[:, None] * (slices + 1)
+              + np.arange(slices, dtype=np.uint32)[None, :])
+        p1 = p0 + (slices + 1)
+        upper = np.stack([p0, p1, p1 + 1], axis=-1)[:-1]
+        lower = np.stack([p1 + 1, p0 + 1, p0], axis=-1)[1:]
+        self.indices = np.concatenate([upper.ravel(), lower.ravel()])
+
+
+class Icosphere:
+    '''
+    sphere made by subdividing an icosahedron, with evenly sized triangles
+    '''
+    def __init__(self, subdivisions=2, scale=1.0):
+        t = (1.0 + 5 ** 0.5) / 2
+        positions = np.array([[-1, t, 0], [1, t, 0], [-1, -t, 0], [1, -t, 0],
+                              [0, -1, t], [0, 1, t], [0, -1, -t], [0, 1, -t],
+                              [t, 0, -1], [t, 0, 1], [-t, 0, -1], [-t, 0, 1]], dtype=np.float64)
+        faces = np.array([[0, 11, 5], [0, 5, 1], [0, 1, 7], [0, 7, 10], [0, 10, 11],
+                          [1, 5, 9], [5, 11, 4], [11, 10, 2], [10, 7, 6], [7, 1, 8],
+                          [3, 9, 4], [3, 4, 2], [3, 2, 6], [3, 6, 8], [3, 8, 9],
+                          [4, 9, 5], [2, 4, 11], [6, 2, 10], [8, 6, 7], [9, 8, 1]])
+
+        for _ in range(subdivisions):
+            # one new vertex per unique edge, then every triangle splits in four
+            edges = np.sort(faces[:, [[0, 1], [1, 2], [2, 0]]].reshape(-1, 2), axis=1)
+            keys, edge_index = np.unique(edges[:, 0] * len(positions) + edges[:, 1], return_inverse=True)
+            midpoints = len(positions) + edge_index.reshape(-1, 3)
+            ends = np.stack([keys // len(positions), keys % len(positions)], axis=1)
+            positions = np.concatenate([positions, positions[ends].mean(axis=1)])
+            a, b, c = faces.T
+            ab, bc, ca = midpoints.T
+            faces = np.stack([np.stack([a, ab, ca], axis=1), np.stack([b, bc, ab], axis=1),
+                              np.stack([c, ca, bc], axis=1), np.stack([ab, bc, ca], axis=1)], axis=1).reshape(-1, 3)
+
+        normals = (positions / np.linalg.norm(positions, axis=1, keepdims=True)).astype(np.float32)
+        self.normals = normals.ravel()
+        self.vertices = (normals * _as_scale(scale)).ravel()
+        u = 0.5 + np.arctan2(-normals[:, 2], normals[:, 0]) / (2 * np.pi)
+        v = 0.5 + np.arcsin(np.clip(normals[:, 1], -1, 1)) / np.pi
+        self.tex_coords = np.stack([u, v], axis=1).astype(np.float32).ravel()
+        self.colors = _normal_colors(normals)
+        self.indices = faces.astype(np.uint32).ravel()
+
+
+class Cylinder:
+    '''
+    cylinder along the y axis, centered at the origin, with capped ends
+    '''
+    def __init__(self, slices=32, radius=0.5, height=1.0):
+        theta = np.arange(slices + 1) * 2 * np.pi / slices
+        ring = np.stack([np.cos(theta), np.zeros_like(theta), -np.sin(theta)], axis=1)
+        half = np.array([0, 0.5 * height, 0])
+
+        # side: bottom and top rings with outward normals
+        side = np.concatenate([ring * radius - half, ring * radius + half])
+        side_normals = np.concatenate([ring, ring])
+        side_uv = np.stack([np.tile(theta / (2 * np.pi), 2), np.repeat([0.0, 1.0], slices + 1)], axis=1)
+
+        # caps: a center vertex followed by a ring, for the bottom then the top
+        caps, cap_normals, cap_uv = [], [], []
+        for sign in (-1, 1):
+            caps.append(np.concatenate([[sign * half], ring * radius + sign * half]))
+            cap_normals.append(np.tile([0.0, sign, 0.0], (slices + 2, 1)))
+            cap_uv.append(np.concatenate([[[0.5, 0.5]], 0.5 + 0.5 * ring[:, [0, 2]]]))
+
+        positions = np.concatenate([side] + caps)
+        normals = np.concatenate([side_normals] + cap_normals)
+        self.vertices = positions.astype(np.float32).ravel()
+        self.normals = normals.astype(np.float32).ravel()
+        self.tex_coords = np.concatenate([side_uv] + cap_uv).astype(np.float32).ravel()
+        self.colors = _normal_colors(normals)
+
+        j = np.arange(slices)
+        bottom, top = j, j + slices + 1
+        side_indices = np.stack([bottom, bottom + 1, top + 1, top + 1, top, bottom], axis=1)
+        base = 2 * (slices + 1)
+        bottom_cap = np.stack([np.full(slices, base), base + 2 + j, base + 1 + j], axis=1)
+        base += slices + 2
+        top_cap = np.stack([np.full(slices, base), base + 1 + j, base + 2 + j], axis=1)
+        self.indices = np.concatenate([side_indices.ravel(), bottom_cap.ravel(), top_cap.ravel()]).astype(np.uint32)
+
+
+class Plane:
+    '''
+    square grid in the xz plane facing +y, centered at the origin
+    '''
+    def __init__(self, divisions=1, size=1.0):
+        steps = np.linspace(-0.5 * size, 0.5 * size, divisions + 1, dtype=np.float32)
+        positions = np.zeros((divisions + 1, divisions + 1, 3), dtype=np.float32)
+        positions[..., 0] = steps[None, :]
+        positions[..., 2] = steps[::-1, None]
+        self.vertices = positions.ravel()
+        self.normals = np.tile(np.array([0, 1, 0], dtype=np.float32), (divisions + 1) ** 2)
+        tex_coords = np.empty((divisions + 1, divisions + 1, 2), dtype=np.float32)
+        tex_coords[..., 0] = steps[None, :] / size + 0.5
+        tex_coords[..., 1] = 0.5 - steps[::-1, None] / size
+        self.tex_coords = tex_coords.ravel()
+        self.colors = _normal_colors(self.normals)
+
+        # row 0 is the near edge (z = size/2), rows advance towards -z
+        p0 = (np.arange(divisions, dtype=np.uint32)[:, None] * (divisions + 1)
+              + np.arange(divisions, dtype=np.uint32)[None, :])
+        p1 = p0 + (divisions + 1)
+        self.indices = np.stack([p0, p0 + 1, p1 + 1, p1 + 1, p1, p0], axis=-1).ravel()
+
+
+class GeometryCache:
+    '''
+    LRU-bounded cache of procedural meshes keyed on (shape type, parameters), e.g.
+    geometry_cache.get(Sphere, 30, 30). Cached meshes are shared by every caller, so their
+    arrays are made read-only; RenderWindow.add_shape relies on that to upload them only once.
+    With `optimize`, meshes are reordered for the vertex cache and overdraw when they are
+    generated (see model.optimize). Uniformly scaled meshes get the same order, so they
+    can still share indices.
+    '''
+    def __init__(self, maxsize=64, optimize=True):
+        self.maxsize = maxsize
+        self.optimize = optimize
+        self.hits = 0
+        self.misses = 0
+        self._meshes = OrderedDict()
+
+    @staticmethod
+    def _freeze(value):
+        # Vec3 and other sequences become hashable tuples
+        if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+            return value
+        return tuple(GeometryCache._freeze(item) for item in value)
+
+    def get(self, shape_type, *args, **kwargs):
+        key = (shape_type, self._freeze(args), self._freeze(sorted(kwargs.items())))
+        mesh = self._meshes.get(key)
+        if mesh is not None:
+            self.hits += 1
+            self._meshes.move_to_end(key)
+            return mesh
+
+        self.misses += 1
+        mesh = shape_type(*args, **kwargs)
+        if self.optimize:
+            optimize_mesh(mesh)
+        for value in vars(mesh).values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+        self._meshes[key] = mesh
+        while len(self._meshes) > self.maxsize:
+            self._meshes.popitem(last=False)
+        return mesh
+
+    @property
+    def nbytes(self):
+        '''
+        Host memory held by the cached mesh arrays.
+        '''
+        return sum(value.nbytes for mesh in self._meshes.values()
+                   for value in vars(mesh).values() if isinstance(value, np.ndarray))
+
+    def __len__(self):
+        return len(self._meshes)
+
+    def clear(self):
+        self._meshes.clear()
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(entries={len(self)}/{self.maxsize}, hits={self.hits}, '
+                f'misses={self.misses}, nbytes={self.nbytes})')
+
+
+geometry_cache = GeometryCache()
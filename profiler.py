@@ -0,0 +1,154 @@
+import contextlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+
+from pyglet.graphics import vertexdomain
+from pyglet.graphics.shader import ShaderProgram
+
+from primitives import CustomGroup, InstancedShape
+
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ('frame', 'name', 'start')
+
+    def __init__(self, frame, name):
+        self.frame = frame
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        self.frame.events.append((self.name, self.start, duration))
+        self.frame.times[self.name] += duration
+
+
+class FrameRecord:
+    '''
+    What happened during one frame: (stage, start, duration) events, total seconds per
+    stage and counters such as draw calls, shader binds and uniform uploads.
+    '''
+    def __init__(self):
+        self.events = []
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+
+
+class Profiler:
+    '''
+    Records per-stage timings and GL work counters of the last `capacity` frames in a ring
+    buffer. Stages are marked with `with profiler.stage(name)`, which is free while the
+    profiler is disabled.
+
+    While enabled, draw calls (vertex domain draws and instanced draws), shader binds,
+    uniform uploads and group set_state/unset_state are counted by wrapping those methods
+    on their classes; disable() restores the originals. Only one profiler can be enabled
+    at a time.
+    '''
+    def __init__(self, capacity=300):
+        self.enabled = False
+        self.frames = deque(maxlen=capacity)
+        self.current = FrameRecord()
+        self._originals = []
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self.current, name)
+
+    def count(self, name, n=1):
+        self.current.counts[name] += n
+
+    def end_frame(self):
+        self.frames.append(self.current)
+        self.current = FrameRecord()
+
+    def _wrap(self, cls, name, counter=None, stage=None):
+        original = cls.__dict__[name]
+
+        def wrapper(*args, **kwargs):
+            frame = self.current
+            if counter:
+                frame.counts[counter] += 1
+            if stage is None:
+                return original(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                frame.times[stage] += time.perf_counter() - start
+
+        setattr(cls, name, wrapper)
+        self._originals.append((cls, name, original))
+
+    def enable(self, batches=()):
+        '''
+        Start recording. `batches` are invalidated so their draw lists pick up the wrapped
+        group methods, which they bind when the list is built.
+        '''
+        if self.enabled:
+            return
+        for cls in (vertexdomain.VertexDomain, vertexdomain.IndexedVertexDomain,
+                    vertexdomain.InstancedVertexDomain, vertexdomain.InstancedIndexedVertexDomain):
+            for name in ('draw', 'draw_subset'):
+                if name in cls.__dict__:
+                    self._wrap(cls, name, counter='draw calls')
+        self._wrap(InstancedShape, 'draw', counter='draw calls')
+        self._wrap(ShaderProgram, 'use', counter='shader binds')
+        self._wrap(ShaderProgram, '__setitem__', counter='uniform uploads')
+        self._wrap(CustomGroup, 'set_state', counter='state changes', stage='set_state')
+        self._wrap(CustomGroup, 'unset_state', stage='unset_state')
+        self.enabled = True
+        self.current = FrameRecord()
+        for batch in batches:
+            batch.invalidate()
+
+    def disable(self, batches=()):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals.clear()
+        self.enabled = False
+        for batch in batches:
+            batch.invalidate()
+
+    def summary(self, frames=60):
+        '''
+        Mean milliseconds per stage and mean counts per frame over the last `frames` frames.
+        '''
+        recent = list(self.frames)[-frames:]
+        times, counts = defaultdict(float), defaultdict(float)
+        for frame in recent:
+            for name, seconds in frame.times.items():
+                times[name] += seconds * 1e3 / len(recent)
+            for name, n in frame.counts.items():
+                counts[name] += n / len(recent)
+        return dict(times), dict(counts)
+
+    def overlay_text(self, frames=60):
+        times, counts = self.summary(frames)
+        lines = [f'{name:<12} {ms:7.3f} ms' for name, ms in times.items()]
+        lines += [f'{name:<16} {n:9.1f}' for name, n in counts.items()]
+        return '\n'.join(lines)
+
+    def dump_chrome_trace(self, filename):
+        '''
+        Write the recorded frames as Chrome trace JSON (chrome://tracing, Perfetto): one
+        complete event per stage and one counter event per frame.
+        '''
+        origin = self.frames[0].events[0][1] if self.frames and self.frames[0].events else 0.0
+        events = []
+        for frame in self.frames:
+            for name, start, duration in frame.events:
+                events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                               'ts': (start - origin) * 1e6, 'dur': duration * 1e6})
+            if frame.events:
+                events.append({'name': 'counters', 'ph': 'C', 'pid': os.getpid(), 'tid': 0,
+                               'ts': (frame.events[0][1] - origin) * 1e6, 'args': dict(frame.counts)})
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
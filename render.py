@@ -6,35 +6,173 @@ from pyglet.graphics.shader import Shader, ShaderProgram
 from pyglet.gl import GL_TRIANGLES
 from pyglet.math import Mat4, Vec3
 from pyglet.gl import *
+import numpy as np
+import os
+import time
+from collections import deque
 
+import scene
 import shader
-from primitives import CustomGroup
+from camera import Camera
+from assets import AssetManager, AssetHandle, obj_shape_arrays
+from model.obj import upload_vertex_list
+from primitives import Cube, CustomGroup, InstancedShape, StaticMesh, geometry_cache, merge_meshes
+from store import ArrayStore, array_property
+from transforms import TransformStore
+from culling import BoundsStore, aabb_from_vertices, aabbs_in_frustum, frustum_planes, transform_aabbs
+from bvh import BVH, ray_aabbs, ray_triangles
+from profiler import Profiler
+from render_queue import RenderQueue
 
+# below this many shapes a linear scan over every box answers culling and picking faster
+# than the BVH (see benchmarks/bvh.py), so the BVH is only built for larger scenes
+BVH_MIN_SHAPES = 4096
+
+
+def _camera_property(name):
+    # a camera parameter, kept in the window's Camera
+    return property(lambda self: getattr(self.camera, name), lambda self, value: setattr(self.camera, name, value))
 
 
 class RenderWindow(pyglet.window.Window):
     '''
     inherits pyglet.window.Window which is the default render window of Pyglet
     '''
+    # View (camera) and projection parameters. They live in `camera`, which caches the view,
+    # projection and view-proj matrices and rebuilds them only after a parameter changed
+    cam_eye = _camera_property('eye')
+    cam_target = _camera_property('target')
+    cam_vup = _camera_property('up')
+    z_near = _camera_property('z_near')
+    z_far = _camera_property('z_far')
+    fov = _camera_property('fov')
+
+    # Per-shape arrays, views of the rows of `shape_arrays` for the shapes added so far
+    shape_visible = array_property('shape_arrays', 'visible')
+    shape_triangles = array_property('shape_arrays', 'triangles')
+    frozen = array_property('shape_arrays', 'frozen')
+    frozen_versions = array_property('shape_arrays', 'frozen_versions')
+    frozen_velocity = array_property('shape_arrays', 'frozen_velocity')
+    lod_levels = array_property('shape_arrays', 'lod_levels')
+    # shapes with a LOD chain, and the length of each chain
+    lod_shapes = array_property('lod_arrays', 'shapes')
+    lod_counts = array_property('lod_arrays', 'counts')
+
+    @property
+    def view_mat(self) -> Mat4:
+        return self.camera.view
+
+    @property
+    def proj_mat(self) -> Mat4:
+        return self.camera.projection
+
     def __init__(self, *args, **kwargs):
+        # the camera exists before the window, which may be resized while it is created
+        self.camera = Camera()
         super().__init__(*args, **kwargs)
         self.batch = pyglet.graphics.Batch()
+
         '''
-        View (camera) parameters
+        view_proj is uploaded to a shader program only when the camera changed since its
+        last upload (or the program is new); see upload_camera.
         '''
-        self.cam_eye = Vec3(0,2,4)
-        self.cam_target = Vec3(0,0,0)
-        self.cam_vup = Vec3(0,1,0)
-        self.view_mat = None
+        self.uploaded_camera_version = -1
+        self.uploaded_programs = set()
+
         '''
-        Projection parameters
+        Redraw on demand (see run): a frame is drawn only when the scene or the camera
+        changed, was invalidated, or is animating. Input events arriving between frames
+        are coalesced by the controller (see Control) into one update per frame, and the
+        time from the first of them to the end of the next frame's draw submission is
+        recorded in input_latencies.
         '''
-        self.z_near = 0.1
-        self.z_far = 100
-        self.fov = 60
-        self.proj_mat = None
+        self.redraw_on_demand = True
+        self.frame_interval = 1/60
+        self.controller = None
+        self.dirty = True
+        self.running = False
+        self.frame_scheduled = False
+        self.last_frame_time = 0.0
+        self.drawn_state = None
+        self.frames_drawn = 0
+        self.input_time = None
+        self.input_latencies = deque(maxlen = 1000)
 
         self.shapes = []
+        self.transforms = TransformStore()
+        self.shape_arrays = ArrayStore(visible = (bool, ()), triangles = (np.int64, ()), frozen = (bool, ()),
+                                       frozen_versions = (np.int64, ()), frozen_velocity = (np.float32, (3,)),
+                                       lod_levels = (np.int64, ()))
+
+        '''
+        Frustum culling: shapes whose world-space bounding box lies outside the view frustum
+        are skipped when drawing. visible_count and culled_count describe the last frame.
+        '''
+        self.bounds = BoundsStore()
+        self.frustum_culling = True
+        self.visible_count = 0
+        self.culled_count = 0
+
+        '''
+        BVH over the world-space bounding boxes, refit in update for the shapes whose
+        transform changed. It answers the culling pass and mouse picking (see pick) once
+        the scene holds BVH_MIN_SHAPES shapes; smaller scenes test every box.
+        '''
+        self.bvh = None
+        self.bvh_versions = np.zeros(0, dtype=np.int64)
+        self._bvh_build = None
+        self.meshes = []
+        self.selected = None
+
+        # triangles submitted by the last on_draw
+        self.triangle_count = 0
+
+        '''
+        Vertex lists of the shapes live in a batch that is never drawn as a whole: the render
+        queue draws each shape's list with its own transform, sorted by program, texture and
+        depth. Shapes built from cached (read-only) meshes share one vertex list per mesh.
+        With render_queue_enabled off, shapes are drawn one group at a time in insertion
+        order instead, each binding its program and model matrix (the previous behavior).
+        '''
+        self.mesh_batch = pyglet.graphics.Batch()
+        self.mesh_group = pyglet.graphics.Group()
+        self.mesh_vertex_lists = {}
+        # id of the vertex list of a writable mesh -> number of shapes drawing it
+        self.vertex_list_users = {}
+        self.render_queue = RenderQueue()
+        self.render_queue_enabled = True
+
+        '''
+        Frozen (static) shapes are merged in world space into static_mesh and drawn with one
+        call instead of through the render queue; see freeze_static and unfreeze.
+        '''
+        self.static_mesh = None
+        self.static_bounds = None
+
+        '''
+        Level of detail: shapes added with lods draw a coarser mesh for each halving of their
+        projected size below lod_screen_size (bounding radius over half the viewport height).
+        '''
+        self.lod_chains = {}
+        self.lod_arrays = ArrayStore(shapes = (np.int64, ()), counts = (np.int64, ()))
+        self.lod_screen_size = 0.5
+
+        self.instanced_shapes = []
+        self.programs = set()
+
+        '''
+        Models, textures and shape meshes loaded in the background (see load_shape). update
+        runs their GL uploads within the asset manager's time budget every frame.
+        '''
+        self.assets = AssetManager()
+
+        '''
+        Frame profiler, toggled with toggle_profiler (see Control). While enabled, its
+        summary is drawn as an overlay in the top left corner.
+        '''
+        self.profiler = Profiler()
+        self.profiler_label = None
+        self.profiler_label_time = 0.0
         self.setup()
 
         self.animate = False
@@ -45,66 +183,574 @@ class RenderWindow(pyglet.window.Window):
         glEnable(GL_DEPTH_TEST)
         glEnable(GL_CULL_FACE)
 
-        # 1. Create a view matrix
-        self.view_mat = Mat4.look_at(
-            self.cam_eye, target=self.cam_target, up=self.cam_vup)
-        
-        # 2. Create a projection matrix 
-        self.proj_mat = Mat4.perspective_projection(
-            aspect = self.width/self.height, 
-            z_near=self.z_near, 
-            z_far=self.z_far, 
-            fov = self.fov)
+        # the camera builds the view and projection matrices when they are first used
+        self.camera.aspect = self.width/self.height
+        self.invalidate()
 
     def on_draw(self) -> None:
-        self.clear()
-        self.batch.draw()
+        profiler = self.profiler
+        with profiler.stage('on_draw'):
+            self.clear()
+            if self.frustum_culling:
+                with profiler.stage('cull'):
+                    self.cull()
+            with profiler.stage('batch.draw'):
+                self.batch.draw()
+            with profiler.stage('shapes'):
+                if self.frustum_culling:
+                    indices = np.flatnonzero(self.shape_visible & ~self.frozen)
+                else:
+                    indices = np.flatnonzero(~self.frozen)
+                if self.render_queue_enabled:
+                    self.render_queue.draw(indices, self.transforms.matrices, self.shape_depths())
+                    if profiler.enabled:
+                        # uploaded directly with glUniformMatrix4fv, unseen by the profiler
+                        profiler.count('uniform uploads', self.render_queue.uniform_uploads)
+                else:
+                    for index in indices:
+                        shape = self.shapes[index]
+                        shape.set_state()
+                        shape.indexed_vertices_list.draw(GL_TRIANGLES)
+                        shape.unset_state()
+            static_visible = self.static_mesh is not None and (not self.frustum_culling or aabbs_in_frustum(
+                *self.static_bounds, frustum_planes(self.camera.view_proj))[0])
+            if static_visible:
+                with profiler.stage('static'):
+                    self.static_mesh.draw()
+            with profiler.stage('instanced'):
+                for instances in self.instanced_shapes:
+                    if not self.frustum_culling:
+                        instances.cull(None)
+                    instances.draw()
+
+        self.triangle_count = int(self.shape_triangles[indices].sum()) + sum(
+            instances.drawn_count * (instances.index_count // 3) for instances in self.instanced_shapes)
+        if static_visible:
+            self.triangle_count += self.static_mesh.index_count // 3
+        if self.input_time is not None:
+            self.input_latencies.append(time.perf_counter() - self.input_time)
+            self.input_time = None
+
+        if profiler.enabled:
+            # the overlay's own draw call and binds are part of the frame it is drawn in
+            profiler.count('triangles', self.triangle_count)
+            with profiler.stage('overlay'):
+                self.draw_profiler_overlay()
+            profiler.end_frame()
+
+    def toggle_profiler(self) -> None:
+        if self.profiler.enabled:
+            self.profiler.disable(batches = (self.batch,))
+        else:
+            self.profiler.enable(batches = (self.batch,))
+        self.invalidate()
+
+    def draw_profiler_overlay(self) -> None:
+        if self.profiler_label is None:
+            self.profiler_label = pyglet.text.Label('', font_name = 'monospace', font_size = 10,
+                                                    multiline = True, width = 400, anchor_y = 'top')
+        # laying the text out is slow, so refresh it a few times per second only
+        now = time.perf_counter()
+        if now - self.profiler_label_time > 0.25:
+            self.profiler_label.text = self.profiler.overlay_text()
+            self.profiler_label_time = now
+        self.profiler_label.position = (10, self.height - 10, 0)
+        glDisable(GL_DEPTH_TEST)
+        self.profiler_label.draw()
+        glEnable(GL_DEPTH_TEST)
+
+    def cull(self) -> None:
+        '''
+        Test every shape's bounding box against the view frustum (see update_bvh).
+        '''
+        planes = frustum_planes(self.camera.view_proj)
+        if self.transforms.count < BVH_MIN_SHAPES:
+            visible = self.bounds.visible(self.transforms.matrices, planes)
+        else:
+            visible = self.update_bvh().frustum_query(planes)
+        self.shape_visible = visible
+        for instances in self.instanced_shapes:
+            instances.cull(planes)
+        self.visible_count = int(np.count_nonzero(visible))
+        self.culled_count = len(visible) - self.visible_count
+
+    def freeze_static(self, shapes = None) -> None:
+        '''
+        Merge `shapes` (CustomGroups, all shapes by default) into the static mesh: their
+        geometry is transformed into world space once and drawn with a single call. Frozen
+        shapes stop animating; changing a frozen shape's transform_mat unfreezes it.
+        '''
+        indices = self._shape_indices(shapes)
+        indices = indices[~self.frozen[indices]]
+        self.frozen_velocity[indices] = self.transforms.angular_velocity[indices]
+        self.transforms.angular_velocity[indices] = 0
+        self.frozen[indices] = True
+        self.frozen_versions[indices] = self.transforms.versions[indices]
+        self._rebuild_static()
+
+    def unfreeze(self, shapes = None) -> None:
+        '''
+        Make frozen `shapes` (all by default) dynamic again: they are drawn individually and
+        animate with their previous angular velocity.
+        '''
+        indices = self._shape_indices(shapes)
+        indices = indices[self.frozen[indices]]
+        self.transforms.angular_velocity[indices] = self.frozen_velocity[indices]
+        self.frozen[indices] = False
+        self._rebuild_static()
+
+    def _shape_indices(self, shapes) -> np.ndarray:
+        if shapes is None:
+            return np.arange(len(self.shapes))
+        return np.array([shape.transform_index for shape in shapes], dtype=np.int64)
+
+    def _rebuild_static(self) -> None:
+        self.invalidate()
+        if self.static_mesh is not None:
+            self.static_mesh.delete()
+            self.static_mesh = self.static_bounds = None
+        indices = np.flatnonzero(self.frozen)
+        if not len(indices):
+            return
+        vertices, colors, mesh_indices = merge_meshes([self.meshes[i] for i in indices],
+                                                      self.transforms.matrices[indices])
+        self.static_mesh = StaticMesh(vertices, mesh_indices, colors)
+        low, high = aabb_from_vertices(vertices)
+        self.static_bounds = (((low + high) / 2)[None], ((high - low) / 2)[None])
+
+    def select_lods(self) -> None:
+        '''
+        Pick every LOD shape's level from its projected screen size, seen from cam_eye
+        with the vertical field of view fov, and switch the vertex lists that changed.
+        '''
+        indices = self.lod_shapes
+        centers, extents = transform_aabbs(self.bounds.centers[indices], self.bounds.extents[indices],
+                                           self.transforms.matrices[indices])
+        distances = np.linalg.norm(centers - np.array(self.cam_eye, dtype=np.float32), axis=1)
+        sizes = np.linalg.norm(extents, axis=1) / (np.maximum(distances, 1e-6) * np.tan(np.radians(self.fov) / 2))
+        with np.errstate(divide='ignore'):
+            levels = np.floor(np.log2(self.lod_screen_size / sizes))
+        levels = np.clip(np.nan_to_num(levels), 0, self.lod_counts - 1).astype(np.int64)
+        for index, level in zip(indices[levels != self.lod_levels[indices]].tolist(),
+                                levels[levels != self.lod_levels[indices]].tolist()):
+            self.shapes[index].indexed_vertices_list, self.shape_triangles[index] = self.lod_chains[index][level]
+        self.lod_levels[indices] = levels
+
+    def shape_depths(self) -> np.ndarray:
+        '''
+        View-space depth of every shape's bounding box center, for front-to-back sorting.
+        '''
+        centers, _ = self.bounds.world(self.transforms.matrices)
+        view = np.array(self.view_mat, dtype=np.float32).reshape(4, 4)   # column-major: V^T
+        return -(centers @ view[:3, 2] + view[3, 2])
+
+    def update_bvh(self) -> BVH:
+        '''
+        Refit the boxes of the shapes whose transform version changed since the last call,
+        and append those of shapes added since (e.g. while a scene streams in). Once the
+        appended shapes outnumber those the BVH was built with, it is built again on a worker
+        thread and replaces the current one when done, so no frame waits for the build.
+        '''
+        if self._bvh_build is not None and self._bvh_build.done():
+            self.bvh, self.bvh_versions = self._bvh_build.result()
+            self._bvh_build = None
+        versions = self.transforms.versions
+        count = self.transforms.count
+        if self.bvh is None or count < self.bvh.count:
+            centers, extents = self.bounds.world(self.transforms.matrices)
+            self.bvh = BVH(centers - extents, centers + extents)
+        else:
+            if count > 2 * self.bvh.sorted_count and self._bvh_build is None:
+                self._bvh_build = self.assets.executor.submit(self._build_bvh, self.bounds.centers.copy(),
+                                                              self.bounds.extents.copy(),
+                                                              self.transforms.matrices.copy(), versions.copy())
+            old = self.bvh.count
+            changed = np.flatnonzero(versions[:old] != self.bvh_versions)
+            if len(changed):
+                centers, extents = transform_aabbs(self.bounds.centers[changed], self.bounds.extents[changed],
+                                                   self.transforms.matrices[changed])
+                self.bvh.refit(changed, centers - extents, centers + extents)
+            if count > old:
+                centers, extents = transform_aabbs(self.bounds.centers[old:], self.bounds.extents[old:],
+                                                   self.transforms.matrices[old:])
+                self.bvh.append(centers - extents, centers + extents)
+        self.bvh_versions = versions.copy()
+        return self.bvh
+
+    @staticmethod
+    def _build_bvh(centers, extents, matrices, versions):
+        # on a worker thread, from copies of the stores; the shapes moved or added since are
+        # refit and appended by the update_bvh call that takes the result
+        centers, extents = transform_aabbs(centers, extents, matrices)
+        return BVH(centers - extents, centers + extents), versions
+
+    def pick(self, x, y):
+        '''
+        Index of the nearest shape under the window coordinates (x, y), or None.
+        The BVH (or in small scenes a test of every box) yields the shapes whose boxes the
+        mouse ray enters, nearest first; their triangles are tested in object space until no
+        closer box remains.
+        '''
+        ndc_x, ndc_y = 2 * x / self.width - 1, 2 * y / self.height - 1
+        inverse = np.linalg.inv(np.array(self.camera.view_proj, dtype=np.float64).reshape(4, 4).T)
+        near, far = (inverse @ (ndc_x, ndc_y, z, 1) for z in (-1, 1))
+        origin = near[:3] / near[3]
+        direction = far[:3] / far[3] - origin
+
+        if self.transforms.count < BVH_MIN_SHAPES:
+            centers, extents = self.bounds.world(self.transforms.matrices)
+            hit, t_near = ray_aabbs(origin, direction, centers - extents, centers + extents)
+            hits = np.flatnonzero(hit)
+            hits = hits[np.argsort(t_near[hits], kind='stable')]
+            candidates = hits, t_near[hits]
+        else:
+            candidates = self.update_bvh().ray_query(origin, direction)
+
+        nearest, nearest_t = None, np.inf
+        for index, t_near in zip(*candidates):
+            if t_near > nearest_t:
+                break
+            # Column-major storage holds M^T: world p = local p @ M^T, local p = world p @ (M^T)^-1
+            to_local = np.linalg.inv(self.transforms.matrices[index].astype(np.float64))
+            local_origin = (np.append(origin, 1) @ to_local)[:3]
+            local_direction = direction @ to_local[:3, :3]
+            vertices, indices, _ = self.meshes[index]
+            triangles = np.reshape(vertices, (-1, 3))[np.reshape(indices, (-1, 3))]
+            t = ray_triangles(local_origin, local_direction, triangles)
+            if t is not None and t < nearest_t:
+                nearest, nearest_t = int(index), t
+        return nearest
 
     def update(self,dt) -> None:
-        view_proj = self.proj_mat @ self.view_mat
-        for i, shape in enumerate(self.shapes):
-            '''
-            Update position/orientation in the scene. In the current setting, 
-            shapes created later rotate faster while positions are not changed.
-            '''
+        with self.profiler.stage('update'):
+            if self.controller is not None:
+                # input received since the last frame, applied at once
+                self.controller.update(dt)
             if self.animate:
-                rotate_angle = dt
-                rotate_axis = Vec3(0,0,1)
-                rotate_mat = Mat4.from_rotation(angle = rotate_angle, vector = rotate_axis)
-                
-                shape.transform_mat @= rotate_mat
+                '''
+                Update position/orientation in the scene. Every shape rotates about its local
+                axes by its angular velocity (see add_shape), all in one vectorized step;
+                positions are not changed.
+                '''
+                self.transforms.step(dt)
+                if self.bvh is not None:
+                    self.update_bvh()
 
                 # # Example) You can control the vertices of shape.
-                # shape.indexed_vertices_list.vertices[0] += 0.5 * dt
+                # for shape in self.shapes:
+                #     shape.indexed_vertices_list.vertices[0] += 0.5 * dt
 
-            '''
-            Update view and projection matrix. There exist only one view and projection matrix 
-            in the program, so we just assign the same matrices for all the shapes
-            '''
-            shape.shader_program['view_proj'] = view_proj
+                # instances rotate like the shapes above, each by its angular velocity
+                for instances in self.instanced_shapes:
+                    instances.transforms.step(dt)
+
+            if self.assets.pending:
+                with self.profiler.stage('assets'):
+                    self.assets.update()
+
+            if len(self.lod_shapes):
+                self.select_lods()
+
+            # frozen shapes whose transform was changed become dynamic
+            changed = np.flatnonzero(self.frozen & (self.transforms.versions != self.frozen_versions))
+            if len(changed):
+                self.unfreeze([self.shapes[i] for i in changed])
+
+            self.upload_camera()
+
+    def upload_camera(self) -> None:
+        '''
+        Update view and projection matrix. There exist only one view and projection matrix
+        in the program, so we assign it once to each shader program shared by the shapes,
+        and again only after the camera changed.
+        '''
+        if self.camera.version != self.uploaded_camera_version:
+            self.uploaded_camera_version = self.camera.version
+            self.uploaded_programs = set()
+        for program in self.programs - self.uploaded_programs:
+            program['view_proj'] = self.camera.view_proj
+        self.uploaded_programs |= self.programs
 
     def on_resize(self, width, height):
         glViewport(0, 0, *self.get_framebuffer_size())
-        self.proj_mat = Mat4.perspective_projection(
-            aspect = width/height, z_near=self.z_near, z_far=self.z_far, fov = self.fov)
+        # 2D projection of the profiler overlay
+        self.projection = Mat4.orthogonal_projection(0, width, 0, height, -255, 255)
+        self.camera.aspect = width/height
+        self.invalidate()
         return pyglet.event.EVENT_HANDLED
 
-    def add_shape(self, transform, vertice, indice, color):
-        
+    def on_expose(self):
+        self.invalidate()
+
+    def _vertex_list(self, program, vertice, indice, color):
         '''
-        Assign a group for each shape
+        Upload a mesh into the mesh batch. Returns the vertex list and the mesh's AABB.
         '''
-        shape = CustomGroup(transform, len(self.shapes))
-        shape.indexed_vertices_list = shape.shader_program.vertex_list_indexed(len(vertice)//3, GL_TRIANGLES,
-                        batch = self.batch,
-                        group = shape,
+        arrays = (vertice, indice, color)
+        if self._immutable_mesh(arrays):
+            '''
+            Immutable mesh (see primitives.geometry_cache): reuse its vertex list if it was
+            uploaded before. The arrays are kept alive with the list, so their ids stay valid.
+            '''
+            key = tuple(id(array) for array in arrays)
+            if key not in self.mesh_vertex_lists:
+                vertex_list = program.vertex_list_indexed(len(vertice)//3, GL_TRIANGLES,
+                                batch = self.mesh_batch,
+                                group = self.mesh_group,
+                                indices = indice,
+                                vertices = ('f', vertice),
+                                colors = ('Bn', color))
+                self.mesh_vertex_lists[key] = (vertex_list, arrays, aabb_from_vertices(vertice))
+            vertex_list, _, aabb = self.mesh_vertex_lists[key]
+            return vertex_list, aabb
+        vertex_list = program.vertex_list_indexed(len(vertice)//3, GL_TRIANGLES,
+                        batch = self.mesh_batch,
+                        group = self.mesh_group,
                         indices = indice,
                         vertices = ('f', vertice),
                         colors = ('Bn', color))
-        self.shapes.append(shape)
-         
+        return vertex_list, aabb_from_vertices(vertice)
+
+    @staticmethod
+    def _immutable_mesh(arrays):
+        return all(isinstance(array, np.ndarray) and not array.flags.writeable for array in arrays)
+
+    def add_shape(self, transform, vertice, indice, color, angular_velocity = Vec3(0,0,1), lods = None):
+        
+        '''
+        Assign a group for each shape. While animating, the shape rotates about its
+        local axes by angular_velocity (radians per second).
+        lods optionally lists coarser versions of the mesh as (vertice, indice, color), from
+        fine to coarse; select_lods switches between them by projected size on screen.
+        '''
+        index = int(self.add_shapes([transform], [(vertice, indice, color)], angular_velocity = angular_velocity)[0])
+        shape = self.shapes[index]
+
+        if lods:
+            chain = [(shape.indexed_vertices_list, len(indice) // 3)]
+            for lod_vertice, lod_indice, lod_color in lods:
+                vertex_list, _ = self._vertex_list(shape.shader_program, lod_vertice, lod_indice, lod_color)
+                chain.append((vertex_list, len(lod_indice) // 3))
+            self.lod_chains[index] = chain
+            self.lod_arrays.extend(1, shapes = index, counts = len(chain))
+
+    def add_shapes(self, transforms, meshes, mesh_ids = None, angular_velocity = Vec3(0,0,1)) -> np.ndarray:
+        '''
+        Add one shape per transform, an (N, 4, 4) or (N, 16) array in the column-major Mat4
+        layout (or a sequence of Mat4): shape i draws meshes[mesh_ids[i]], each mesh given
+        as (vertice, indice, color), or meshes[0] for all without mesh_ids. angular_velocity
+        is one for all shapes or (N, 3). The transforms and bounds are stored as whole
+        arrays and every mesh is uploaded once. Returns the indices of the new shapes.
+        '''
+        matrices = np.reshape(np.asarray(transforms, dtype = np.float32), (-1, 4, 4))
+        count = len(matrices)
+        mesh_ids = np.zeros(count, dtype = np.int64) if mesh_ids is None else np.asarray(mesh_ids, dtype = np.int64)
+        start = len(self.shapes)
+        rows = self.transforms.extend(matrices, angular_velocity)
+
+        program = shader.get_program(shader.vertex_source_default, shader.fragment_source_default)
+        program.use()
+        shapes = [CustomGroup(None, order, self.transforms, row, program)
+                  for order, row in enumerate(rows.tolist(), start)]
+        uploads = [self._vertex_list(program, *mesh) for mesh in meshes] if shapes else []
+        for shape, mesh_id in zip(shapes, mesh_ids.tolist()):
+            shape.indexed_vertices_list = uploads[mesh_id][0]
+        users = np.bincount(mesh_ids, minlength = len(meshes)).tolist()
+        for mesh, (vertex_list, _), mesh_users in zip(meshes, uploads, users):
+            if not self._immutable_mesh(mesh):
+                if mesh_users:
+                    self.vertex_list_users[id(vertex_list)] = mesh_users
+                else:
+                    vertex_list.delete()
+
+        # bounds rows are indexed like the transform store rows
+        if count:
+            aabbs = np.array([aabb for _, aabb in uploads], dtype = np.float32)[mesh_ids]
+            assert self.bounds.extend(aabbs[:, 0], aabbs[:, 1])[0] == rows[0] == start
+        triangles = np.array([len(indice) // 3 for _, indice, _ in meshes], dtype = np.int64)
+        self.shape_arrays.extend(count, visible = True, triangles = triangles[mesh_ids])
+        self.meshes += [tuple(meshes[mesh_id]) for mesh_id in mesh_ids.tolist()]
+        self.shapes += shapes
+        self.render_queue.extend(shapes)
+        if shapes:
+            self.programs.add(program)
+        self.invalidate()
+        return rows
+
+    def set_shape_mesh(self, index, vertice, indice, color) -> None:
+        '''
+        Replace the mesh of shape `index`, keeping its transform, and update its bounds.
+        '''
+        shape = self.shapes[index]
+        old = shape.indexed_vertices_list
+        shape.indexed_vertices_list, aabb = self._vertex_list(shape.shader_program, vertice, indice, color)
+        if not self._immutable_mesh((vertice, indice, color)):
+            self.vertex_list_users[id(shape.indexed_vertices_list)] = 1
+        # shapes added together with add_shapes share the vertex list of a writable mesh too;
+        # it is deleted with its last user, while cached and LOD vertex lists are kept
+        users = self.vertex_list_users.pop(id(old), None)
+        if users == 1:
+            old.delete()
+        elif users is not None:
+            self.vertex_list_users[id(old)] = users - 1
+
+        self.bounds.set(index, *aabb)
+        self.meshes[index] = (vertice, indice, color)
+        self.shape_triangles[index] = len(indice) // 3
+        if self.bvh is not None:
+            centers, extents = transform_aabbs(self.bounds.centers[[index]], self.bounds.extents[[index]],
+                                               self.transforms.matrices[[index]])
+            self.bvh.refit(np.array([index]), centers - extents, centers + extents)
+        # a BVH being built holds the old box
+        self._bvh_build = None
+        if self.frozen[index]:
+            self._rebuild_static()
+        self.invalidate()
+
+    def load_shape(self, transform, filename, angular_velocity = Vec3(0,0,1)) -> AssetHandle:
+        '''
+        Add a shape whose mesh is loaded from an OBJ file in the background (see
+        assets.obj_shape_arrays). A small cube stands in for it until the mesh is uploaded;
+        the returned handle's value is the shape index. Shapes loading the same file at the
+        same time share one parse and one vertex list.
+        '''
+        placeholder = geometry_cache.get(Cube, 0.25)
+        index = len(self.shapes)
+        self.add_shape(transform, placeholder.vertices, placeholder.indices, placeholder.colors, angular_velocity)
+
+        def upload(result):
+            arrays, aabb = result
+            yield from self._upload_mesh(self.shapes[index].shader_program, arrays, aabb)
+            self.set_shape_mesh(index, *arrays)
+            return index
+
+        return self.assets.submit(AssetHandle(filename, index), lambda: obj_shape_arrays(filename, self.assets.chunk_size), upload,
+                                  key = ('shape', filename))
+
+    def _upload_mesh(self, program, arrays, aabb):
+        '''
+        Upload read-only mesh arrays into the mesh batch in steps of the asset manager's
+        block size, unless they were uploaded before; see _vertex_list.
+        '''
+        key = tuple(id(array) for array in arrays)
+        if key not in self.mesh_vertex_lists:
+            vertice, indice, color = arrays
+            vertex_list = yield from upload_vertex_list(
+                program, len(vertice) // 3, indice, self.mesh_batch,
+                self.mesh_group, self.assets.block, vertices = ('f', vertice), colors = ('Bn', color))
+            self.mesh_vertex_lists[key] = (vertex_list, arrays, aabb)
+
+    def load_scene(self, filename, stream = False):
+        '''
+        Add the objects of a scene file (see scene.Scene) with one add_shapes call and return
+        their shape indices. With stream, return an AssetHandle right away instead: the file
+        and its OBJ meshes are read in the background, and the meshes uploaded and the
+        objects added in blocks of scene.SCENE_BLOCK within the asset manager's per-frame
+        budget. The handle's value is then the shape indices.
+        '''
+        if not stream:
+            return scene.load_scene(self, filename)
+        directory = os.path.dirname(filename)
+
+        def prepare():
+            layout = scene.read_scene(filename)
+            # OBJ files are parsed here; primitives come from the geometry cache on the main thread
+            files = {name: obj_shape_arrays(os.path.join(directory, reference['obj']), self.assets.chunk_size)
+                     for name, reference in layout.meshes.items() if scene.is_file_mesh(reference)}
+            return layout, files
+
+        def upload(result):
+            layout, files = result
+            program = shader.get_program(shader.vertex_source_default, shader.fragment_source_default)
+            meshes = []
+            for name, reference in layout.meshes.items():
+                if name in files:
+                    arrays, aabb = files[name]
+                else:
+                    arrays = scene.resolve_mesh(reference)
+                    aabb = aabb_from_vertices(arrays[0])
+                yield from self._upload_mesh(program, arrays, aabb)
+                meshes.append(arrays)
+
+            indices = [np.zeros(0, dtype = np.int64)]
+            for start in range(0, len(layout), scene.SCENE_BLOCK):
+                block = layout[start:start + scene.SCENE_BLOCK]
+                indices.append(self.add_shapes(block.matrices, meshes, block.mesh_ids, block.angular_velocity))
+                yield
+            return np.concatenate(indices)
+
+        return self.assets.submit(AssetHandle(filename, np.zeros(0, dtype = np.int64)), prepare, upload,
+                                  key = ('scene', filename))
+
+    def add_instances(self, mesh, transforms, angular_velocity = Vec3(0,0,1)):
+        '''
+        Draw `mesh` (any object with vertices, indices and colors, like Cube or Sphere) once
+        per transform with GPU instancing. Instances rotate by angular_velocity (one for all or
+        (N, 3)) while animating, and are frustum culled with the shapes. Returns the
+        InstancedShape holding the transforms.
+        '''
+        instances = InstancedShape(mesh.vertices, mesh.indices, mesh.colors, transforms, angular_velocity)
+        self.instanced_shapes.append(instances)
+        self.programs.add(instances.shader_program)
+        self.invalidate()
+        return instances
+
+    @property
+    def continuous(self) -> bool:
+        # states that change every frame by themselves
+        return self.animate or self.assets.pending > 0 or self.profiler.enabled
+
+    def invalidate(self) -> None:
+        '''
+        Mark the window for redrawing; while running on demand, schedule the next frame,
+        at most one frame_interval after the previous one.
+        '''
+        self.dirty = True
+        if self.running and not self.frame_scheduled:
+            self.frame_scheduled = True
+            delay = max(0.0, self.last_frame_time + self.frame_interval - time.perf_counter())
+            pyglet.clock.schedule_once(self.frame, delay)
+
+    def input_received(self) -> None:
+        '''
+        Called by the controller for every input event that changes the view.
+        '''
+        if self.input_time is None:
+            self.input_time = time.perf_counter()
+        self.invalidate()
+
+    def frame(self, dt) -> None:
+        '''
+        One frame of the on-demand loop: update, then draw if anything changed (the
+        window was invalidated, or the camera or a transform was changed directly).
+        '''
+        self.frame_scheduled = False
+        self.last_frame_time = time.perf_counter()
+        self.update(dt)
+        state = (self.camera.version, self.transforms.version)
+        if self.dirty or state != self.drawn_state:
+            self.dirty = False
+            self.drawn_state = state
+            self.draw(dt)
+            self.frames_drawn += 1
+        if self.continuous:
+            self.invalidate()
+
     def run(self):
-        pyglet.clock.schedule_interval(self.update, 1/60)
-        pyglet.app.run()
+        '''
+        Run the event loop. With redraw_on_demand, frames are scheduled by invalidate, so an
+        idle window does no work between input events; otherwise the scene is updated and
+        redrawn 60 times per second.
+        '''
+        if not self.redraw_on_demand:
+            pyglet.clock.schedule_interval(self.update, 1/60)
+            pyglet.app.run()
+            return
+        self.running = True
+        self.invalidate()
+        try:
+            pyglet.app.run(None)
+        finally:
+            self.running = False
 
     
\ No newline at end of file
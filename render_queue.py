@@ -0,0 +1,94 @@
+import ctypes
+
+import numpy as np
+from pyglet.gl import *
+
+from store import ArrayStore, array_property
+
+
+class RenderQueue:
+    '''
+    Draws shapes sorted by shader program, then texture, then depth (front to back), so a
+    program is bound once per run of shapes using it and a texture once per run within
+    that. Between two draws of a run only the per-object `model` uniform changes, and it is
+    uploaded straight from the TransformStore matrices instead of through a Mat4.
+
+    Shapes are CustomGroups; a shape's `texture` (None by default) is bound to unit 0.
+    Counts of the last frame are kept in draw_calls, program_binds, texture_binds and
+    uniform_uploads.
+    '''
+    # sort keys per shape, views of the rows of `keys`
+    program_keys = array_property('keys', 'program')
+    texture_keys = array_property('keys', 'texture')
+
+    def __init__(self):
+        self.shapes = []
+        self.keys = ArrayStore(program=(np.int64, ()), texture=(np.int64, ()))
+        self._program_ids = {}
+        self._texture_ids = {None: 0}
+        self._model_locations = {}
+
+        self.draw_calls = 0
+        self.program_binds = 0
+        self.texture_binds = 0
+        self.uniform_uploads = 0
+
+    def add(self, shape):
+        self.extend([shape])
+
+    def extend(self, shapes):
+        program_keys, texture_keys = [], []
+        for shape in shapes:
+            program = shape.shader_program
+            if program not in self._program_ids:
+                self._program_ids[program] = len(self._program_ids)
+                self._model_locations[program] = glGetUniformLocation(program.id, b'model')
+            texture = getattr(shape, 'texture', None)
+            if texture not in self._texture_ids:
+                self._texture_ids[texture] = len(self._texture_ids)
+            program_keys.append(self._program_ids[program])
+            texture_keys.append(self._texture_ids[texture])
+        self.shapes += shapes
+        self.keys.extend(len(program_keys), program=program_keys, texture=texture_keys)
+
+    def sort(self, indices, depths):
+        '''
+        Order `indices` (into the queued shapes) by program, texture, then depth.
+        '''
+        order = np.lexsort((depths[indices], self.texture_keys[indices], self.program_keys[indices]))
+        return indices[order]
+
+    def draw(self, indices, matrices, depths):
+        '''
+        Draw the shapes `indices` with their model matrices in `matrices` (TransformStore
+        layout, float32) and view depths `depths`, both indexed like the queued shapes.
+        '''
+        self.draw_calls = self.program_binds = self.texture_binds = self.uniform_uploads = 0
+        if not len(indices):
+            return
+
+        matrices = np.ascontiguousarray(matrices, dtype=np.float32)
+        base = matrices.ctypes.data
+        stride = matrices.strides[0]
+        program = texture = None
+        location = -1
+        float_pointer = ctypes.POINTER(GLfloat)
+        for index in self.sort(indices, depths).tolist():
+            shape = self.shapes[index]
+            if shape.shader_program is not program:
+                if program is not None:
+                    program.stop()
+                program = shape.shader_program
+                program.use()
+                location = self._model_locations[program]
+                self.program_binds += 1
+            if shape.texture is not texture:
+                texture = shape.texture
+                if texture is not None:
+                    glActiveTexture(GL_TEXTURE0)
+                    glBindTexture(texture.target, texture.id)
+                    self.texture_binds += 1
+            glUniformMatrix4fv(location, 1, GL_FALSE, ctypes.cast(base + stride * index, float_pointer))
+            shape.indexed_vertices_list.draw(GL_TRIANGLES)
+        program.stop()
+        self.uniform_uploads = self.draw_calls = len(indices)
@@ -0,0 +1,244 @@
+import json
+import os
+
+import numpy as np
+
+from assets import LOAD_CHUNK_SIZE, obj_shape_arrays
+from model.obj import CACHE_PREAMBLE, align_offset, atomic_write
+from primitives import Cube, Cylinder, Icosphere, Plane, Sphere, geometry_cache
+
+
+# Primitive types scene files may reference by name
+PRIMITIVES = {shape_type.__name__: shape_type for shape_type in (Cube, Sphere, Icosphere, Cylinder, Plane)}
+
+# Objects added per upload step by RenderWindow.load_scene(..., stream=True)
+SCENE_BLOCK = 256
+
+DEFAULT_ANGULAR_VELOCITY = (0.0, 0.0, 1.0)
+
+_SCENE_MAGIC = b'SCENEBIN'
+_SCENE_VERSION = 1
+_SCENE_SECTIONS = (('mesh_ids', np.uint32, ()), ('matrices', np.float32, (4, 4)),
+                   ('angular_velocity', np.float32, (3,)))
+BINARY_SUFFIX = '.scene'
+
+
+class Scene:
+    '''
+    A scene layout: `meshes` maps mesh names to their references, and object i draws
+    mesh `mesh_ids[i]` (an index into `meshes`) with model matrix `matrices[i]`, in the
+    column-major layout of TransformStore, rotating by `angular_velocity[i]`.
+
+    A mesh is referenced as a primitive with its parameters, e.g. {"primitive": "Sphere",
+    "args": [30, 30]}, or as an OBJ file relative to the scene file, e.g. {"obj":
+    "model/bunny.obj"}; objects of the same mesh share its geometry and vertex list. The
+    text variant of scene files (.json, or .toml to read) is meant to be edited by hand:
+
+        {"meshes": {"cube": {"primitive": "Cube", "args": [1.0]}},
+         "objects": [{"mesh": "cube", "translation": [-2, 0, 0], "rotation": [0, 45, 0],
+                      "scale": [1, 2, 1], "angular_velocity": [0, 0, 1]}]}
+
+    Rotations are Euler angles in degrees, applied about x, then y, then z; an object may
+    give its `matrix` as 16 floats in column-major order instead. The binary variant
+    (.scene) holds the same tables as raw arrays after a JSON header.
+    '''
+    def __init__(self, meshes, mesh_ids, matrices, angular_velocity=None):
+        self.meshes = dict(meshes)
+        self.mesh_ids = np.asarray(mesh_ids, dtype=np.uint32)
+        self.matrices = np.reshape(np.asarray(matrices, dtype=np.float32), (-1, 4, 4))
+        if angular_velocity is None:
+            angular_velocity = np.tile(np.float32(DEFAULT_ANGULAR_VELOCITY), (len(self.mesh_ids), 1))
+        self.angular_velocity = np.reshape(np.asarray(angular_velocity, dtype=np.float32), (-1, 3))
+        if not len(self.mesh_ids) == len(self.matrices) == len(self.angular_velocity):
+            raise ValueError('Scene tables differ in length.')
+        if len(self.mesh_ids) and self.mesh_ids.max() >= len(self.meshes):
+            raise ValueError('Scene object refers to an undefined mesh.')
+
+    def __len__(self):
+        return len(self.mesh_ids)
+
+    def __getitem__(self, objects):
+        # a slice of the objects, with all the meshes
+        return Scene(self.meshes, self.mesh_ids[objects], self.matrices[objects], self.angular_velocity[objects])
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({len(self.meshes)} meshes, {len(self)} objects)'
+
+
+def euler_matrices(rotation):
+    '''
+    Rotation matrices Rz @ Ry @ Rx of (N, 3) Euler angles in degrees, as (N, 3, 3).
+    '''
+    x, y, z = np.radians(np.asarray(rotation, dtype=np.float64)).T
+    (cx, cy, cz), (sx, sy, sz) = np.cos([x, y, z]), np.sin([x, y, z])
+    return np.stack([cy * cz, sx * sy * cz - cx * sz, cx * sy * cz + sx * sz,
+                     cy * sz, sx * sy * sz + cx * cz, cx * sy * sz - sx * cz,
+                     -sy, sx * cy, cx * cy], axis=1).reshape(-1, 3, 3)
+
+
+def compose_matrices(translation, rotation, scale):
+    '''
+    Model matrices T @ R @ S of (N, 3) translations, Euler angles in degrees and scales,
+    in the column-major layout of TransformStore (the transposes), as (N, 4, 4) float32.
+    '''
+    translation = np.asarray(translation, dtype=np.float64)
+    matrices = np.zeros((len(translation), 4, 4))
+    matrices[:, :3, :3] = euler_matrices(rotation) * np.asarray(scale, dtype=np.float64)[:, None, :]
+    matrices[:, :3, 3] = translation
+    matrices[:, 3, 3] = 1
+    return matrices.transpose(0, 2, 1).astype(np.float32)
+
+
+def _text_scene(data):
+    meshes = data.get('meshes', {})
+    objects = data.get('objects', [])
+    ids = {name: i for i, name in enumerate(meshes)}
+    try:
+        mesh_ids = [ids[item['mesh']] for item in objects]
+    except KeyError as ex:
+        raise ValueError(f'Scene object refers to an undefined mesh {ex}.')
+
+    # objects given by translation, rotation and scale are composed together
+    matrices = compose_matrices([item.get('translation', (0, 0, 0)) for item in objects],
+                                [item.get('rotation', (0, 0, 0)) for item in objects],
+                                [item.get('scale', (1, 1, 1)) for item in objects]).reshape(-1, 16)
+    for i, item in enumerate(objects):
+        if 'matrix' in item:
+            matrices[i] = item['matrix']
+    angular_velocity = [item.get('angular_velocity', DEFAULT_ANGULAR_VELOCITY) for item in objects]
+    return Scene(meshes, mesh_ids, matrices, np.reshape(angular_velocity, (-1, 3)))
+
+
+def _floats(array):
+    # the shortest decimals that read back to the same float32 values
+    return [float(str(value)) for value in np.ravel(array).astype(np.float32)]
+
+
+def _object_entry(name, matrix, angular_velocity):
+    entry = {'mesh': name}
+    # pure translations are written as such, anything else as the whole matrix
+    if np.array_equal(matrix[:3, :3], np.eye(3)) and not matrix[:3, 3].any() and matrix[3, 3] == 1:
+        entry['translation'] = _floats(matrix[3, :3])
+    else:
+        entry['matrix'] = _floats(matrix)
+    if not np.array_equal(angular_velocity, DEFAULT_ANGULAR_VELOCITY):
+        entry['angular_velocity'] = _floats(angular_velocity)
+    return entry
+
+
+def write_text_scene(filename, scene):
+    names = list(scene.meshes)
+    objects = [_object_entry(names[mesh_id], matrix, angular_velocity) for mesh_id, matrix, angular_velocity
+               in zip(scene.mesh_ids.tolist(), scene.matrices, scene.angular_velocity)]
+    with open(filename, 'w') as f:
+        json.dump({'meshes': scene.meshes, 'objects': objects}, f, indent=1)
+
+
+def read_text_scene(filename):
+    if filename.endswith('.toml'):
+        import tomllib
+        with open(filename, 'rb') as f:
+            return _text_scene(tomllib.load(f))
+    with open(filename) as f:
+        return _text_scene(json.load(f))
+
+
+def write_binary_scene(filename, scene):
+    '''
+    Write a scene as a JSON header with the meshes and the table offsets, followed by the
+    raw uint32/float32 tables, each aligned to 16 bytes.
+    '''
+    header = {'meshes': scene.meshes, 'count': len(scene), 'sections': {}}
+    arrays = []
+    offset = 0
+    for name, dtype, _ in _SCENE_SECTIONS:
+        array = np.ascontiguousarray(getattr(scene, name), dtype=dtype)
+        header['sections'][name] = offset
+        arrays.append((offset, array))
+        offset = align_offset(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode()
+    data_start = align_offset(CACHE_PREAMBLE.size + len(header_bytes))
+    with atomic_write(filename) as f:
+        f.write(CACHE_PREAMBLE.pack(_SCENE_MAGIC, _SCENE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for array_offset, array in arrays:
+            f.seek(data_start + array_offset)
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def read_binary_scene(filename):
+    '''
+    Read a binary scene; its tables are read-only memory-mapped arrays, so the objects of
+    a large scene are only read from disk as they are added.
+    '''
+    with open(filename, 'rb') as f:
+        magic, version, header_size = CACHE_PREAMBLE.unpack(f.read(CACHE_PREAMBLE.size))
+        if magic != _SCENE_MAGIC or version != _SCENE_VERSION:
+            raise ValueError(f'{filename} is not a binary scene of version {_SCENE_VERSION}.')
+        header = json.loads(f.read(header_size))
+
+    data_start = align_offset(CACHE_PREAMBLE.size + header_size)
+    count = header['count']
+    tables = {}
+    for name, dtype, shape in _SCENE_SECTIONS:
+        if count:
+            tables[name] = np.memmap(filename, dtype=dtype, mode='r', offset=data_start + header['sections'][name],
+                                     shape=(count,) + shape)
+        else:
+            tables[name] = np.zeros((0,) + shape, dtype=dtype)
+    return Scene(header['meshes'], **tables)
+
+
+def read_scene(filename):
+    '''
+    Read a binary (.scene) or text (.json or .toml) scene file.
+    '''
+    if filename.endswith(BINARY_SUFFIX):
+        return read_binary_scene(filename)
+    return read_text_scene(filename)
+
+
+def write_scene(filename, scene):
+    '''
+    Write a scene file, binary if `filename` ends in .scene and JSON otherwise.
+    '''
+    if filename.endswith(BINARY_SUFFIX):
+        write_binary_scene(filename, scene)
+    else:
+        write_text_scene(filename, scene)
+
+
+def is_file_mesh(reference):
+    return 'obj' in reference
+
+
+def resolve_mesh(reference, directory='', chunk_size=LOAD_CHUNK_SIZE):
+    '''
+    The read-only (vertice, indice, color) arrays of a mesh reference, as taken by
+    RenderWindow.add_shape. Primitives come from the geometry cache and OBJ files through
+    their mesh cache, so resolving a mesh twice returns the same geometry.
+    '''
+    if 'primitive' in reference:
+        try:
+            shape_type = PRIMITIVES[reference['primitive']]
+        except KeyError:
+            raise ValueError(f'Unknown primitive {reference["primitive"]!r} in scene.')
+        mesh = geometry_cache.get(shape_type, *reference.get('args', ()), **reference.get('kwargs', {}))
+        return mesh.vertices, mesh.indices, mesh.colors
+    if is_file_mesh(reference):
+        arrays, _ = obj_shape_arrays(os.path.join(directory, reference['obj']), chunk_size)
+        return arrays
+    raise ValueError(f'Unknown mesh reference {reference!r} in scene.')
+
+
+def load_scene(renderer, filename):
+    '''
+    Add the objects of a scene file to a renderer (RenderWindow or SoftwareRenderer) with
+    one add_shapes call. Returns the indices of the new shapes.
+    '''
+    scene = read_scene(filename)
+    directory = os.path.dirname(filename)
+    meshes = [resolve_mesh(reference, directory) for reference in scene.meshes.values()]
+    return renderer.add_shapes(scene.matrices, meshes, scene.mesh_ids, scene.angular_velocity)
@@ -1,3 +1,5 @@
+import hashlib
+
 from pyglet.graphics.shader import Shader, ShaderProgram
 
 # create vertex and fragment shader sources
@@ -19,6 +21,29 @@ void main()
 }
 """
 
+# instanced variant: the model matrix is a per-instance attribute given as four columns
+# (pyglet cannot introspect mat4 attributes)
+vertex_source_instanced = """
+#version 330
+layout(location =0) in vec3 vertices;
+layout(location =1) in vec4 colors;
+layout(location =2) in vec4 model_col0;
+layout(location =3) in vec4 model_col1;
+layout(location =4) in vec4 model_col2;
+layout(location =5) in vec4 model_col3;
+
+out vec4 newColor;
+
+uniform mat4 view_proj;
+
+void main()
+{
+    mat4 model = mat4(model_col0, model_col1, model_col2, model_col3);
+    gl_Position = view_proj * model * vec4(vertices, 1.0f);
+    newColor = colors;
+}
+"""
+
 fragment_source_default = """
 #version 330
 in vec4 newColor;
@@ -31,8 +56,137 @@ void main()
 }
 """
 
+# packed OBJ vertex format (see model.quantize): positions are unsigned normalized shorts
+# spanning the mesh AABB, normals octahedral signed normalized shorts, texture coordinates
+# half floats given as raw unsigned shorts; the diffuse color is a uniform. Lighting is
+# the same as in pyglet's model shaders, which they replace.
+_packed_decode = """
+uniform WindowBlock
+{
+    mat4 projection;
+    mat4 view;
+} window;
+
+uniform mat4 model;
+uniform vec3 position_offset;
+uniform vec3 position_extent;
+uniform vec4 material_color;
+
+vec3 octahedral_decode(vec2 e)
+{
+    vec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));
+    float t = max(-n.z, 0.0);
+    n.x += n.x >= 0.0 ? -t : t;
+    n.y += n.y >= 0.0 ? -t : t;
+    return normalize(n);
+}
+
+float half_to_float(float bits)
+{
+    uint h = uint(bits);
+    uint exponent = (h >> 10u) & 31u;
+    float mantissa = float(h & 1023u);
+    float value = exponent == 0u ? mantissa * exp2(-24.0)
+                                 : (1.0 + mantissa / 1024.0) * exp2(float(exponent) - 15.0);
+    return (h & 32768u) != 0u ? -value : value;
+}
+
+vec3 lit_normal(vec2 normals)
+{
+    return transpose(inverse(mat3(model))) * octahedral_decode(normals);
+}
+"""
+
+vertex_source_packed = """#version 330 core
+in vec3 position;
+in vec2 normals;
+
+out vec4 vertex_colors;
+out vec3 vertex_normals;
+out vec3 vertex_position;
+""" + _packed_decode + """
+void main()
+{
+    vec4 pos = window.view * model * vec4(position_offset + position * position_extent, 1.0);
+    gl_Position = window.projection * pos;
+
+    vertex_position = pos.xyz;
+    vertex_colors = material_color;
+    vertex_normals = lit_normal(normals);
+}
+"""
+
+vertex_source_packed_textured = """#version 330 core
+in vec3 position;
+in vec2 normals;
+in vec2 tex_coords;
+
+out vec4 vertex_colors;
+out vec3 vertex_normals;
+out vec2 texture_coords;
+out vec3 vertex_position;
+""" + _packed_decode + """
+void main()
+{
+    vec4 pos = window.view * model * vec4(position_offset + position * position_extent, 1.0);
+    gl_Position = window.projection * pos;
+
+    vertex_position = pos.xyz;
+    vertex_colors = material_color;
+    texture_coords = vec2(half_to_float(tex_coords.x), half_to_float(tex_coords.y));
+    vertex_normals = lit_normal(normals);
+}
+"""
+
+fragment_source_packed = """#version 330 core
+in vec4 vertex_colors;
+in vec3 vertex_normals;
+in vec3 vertex_position;
+out vec4 final_colors;
+
+void main()
+{
+    float l = dot(normalize(-vertex_position), normalize(vertex_normals));
+    final_colors = vertex_colors * l * 1.2;
+}
+"""
+
+fragment_source_packed_textured = """#version 330 core
+in vec4 vertex_colors;
+in vec3 vertex_normals;
+in vec2 texture_coords;
+in vec3 vertex_position;
+out vec4 final_colors;
+
+uniform sampler2D our_texture;
+
+void main()
+{
+    float l = dot(normalize(-vertex_position), normalize(vertex_normals));
+    final_colors = (texture(our_texture, texture_coords) * vertex_colors) * l * 1.2;
+}
+"""
+
 def create_program(vs_source, fs_source):
     # compile the vertex and fragment sources to a shader program
     vert_shader = Shader(vs_source, 'vertex')
     frag_shader = Shader(fs_source, 'fragment')
-    return ShaderProgram(vert_shader, frag_shader)
\ No newline at end of file
+    return ShaderProgram(vert_shader, frag_shader)
+
+
+# shared programs, keyed on a hash of their sources
+_programs = {}
+
+def source_hash(vs_source, fs_source):
+    return hashlib.sha1(f'{vs_source}\0{fs_source}'.encode()).hexdigest()
+
+def get_program(vs_source, fs_source):
+    '''
+    Return the shared shader program for the given sources, compiling and linking it
+    only the first time it is requested.
+    '''
+    key = source_hash(vs_source, fs_source)
+    program = _programs.get(key)
+    if program is None:
+        program = _programs[key] = create_program(vs_source, fs_source)
+    return program
@@ -0,0 +1,404 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from pyglet.math import Mat4, Vec3
+
+from culling import BoundsStore, aabb_from_vertices, aabbs_in_frustum, frustum_planes
+from transforms import TransformStore
+
+
+# Side of the square screen tiles in pixels. Every tile owns its part of the color and depth
+# buffers, so tiles are rasterized independently, in parallel on several threads
+TILE_SIZE = 64
+
+# Fragments evaluated in one vectorized step, which bounds the size of temporary arrays
+FRAGMENT_BLOCK = 1 << 18
+
+# Window coordinates are snapped to 1/SUBPIXEL of a pixel like GL rasterizers do, which
+# makes the edge functions exact in float64
+SUBPIXEL = 256
+
+# The depth buffer holds 24-bit integers like GL_DEPTH_COMPONENT24
+DEPTH_MAX = (1 << 24) - 1
+
+# Outcode bit of the near plane: bits 0-2 for x, y, z < -w, 3-5 for x, y, z > w
+_NEAR_PLANE = 1 << 2
+
+
+def clip_near(clip, colors):
+    '''
+    Clip triangles, given as (T, 3, 4) clip-space positions with (T, 3, 4) colors, against
+    the near plane z = -w like GL: a triangle with one vertex in front of the plane becomes
+    a smaller triangle, one with two a quad (two triangles); winding is preserved. Colors
+    are interpolated linearly in clip space, which keeps them perspective-correct.
+    Returns the clipped positions and colors, and the index of every clipped triangle's
+    source triangle.
+    '''
+    distance = clip[..., 2] + clip[..., 3]
+    inside = distance >= 0
+    count = inside.sum(axis=1)
+    parts_clip, parts_colors = [clip[count == 3]], [colors[count == 3]]
+    parts_source = [np.flatnonzero(count == 3)]
+
+    for kept in (1, 2):
+        selected = np.flatnonzero(count == kept)
+        if not len(selected):
+            continue
+        # rotate every triangle (keeping its winding) so the odd vertex comes first
+        odd = inside[selected] if kept == 1 else ~inside[selected]
+        first = np.argmax(odd, axis=1)
+        order = (first[:, None] + np.arange(3)) % 3
+        c = np.take_along_axis(clip[selected], order[..., None], axis=1)
+        a = np.take_along_axis(colors[selected], order[..., None], axis=1)
+        d = np.take_along_axis(distance[selected], order, axis=1)
+        # points where the edges from the odd vertex cross the plane
+        t = d[:, :1] / (d[:, :1] - d[:, 1:])
+        crossing = c[:, :1] + (c[:, 1:] - c[:, :1]) * t[..., None]
+        crossing_colors = a[:, :1] + (a[:, 1:] - a[:, :1]) * t[..., None].astype(a.dtype)
+        if kept == 1:
+            parts_clip.append(np.concatenate([c[:, :1], crossing], axis=1))
+            parts_colors.append(np.concatenate([a[:, :1], crossing_colors], axis=1))
+            parts_source.append(selected)
+        else:
+            # quad (ab, b, c, ac) as (ab, b, c) and (ab, c, ac)
+            parts_clip += [np.concatenate([crossing[:, :1], c[:, 1:]], axis=1),
+                           np.stack([crossing[:, 0], c[:, 2], crossing[:, 1]], axis=1)]
+            parts_colors += [np.concatenate([crossing_colors[:, :1], a[:, 1:]], axis=1),
+                             np.stack([crossing_colors[:, 0], a[:, 2], crossing_colors[:, 1]], axis=1)]
+            parts_source += [selected, selected]
+    return np.concatenate(parts_clip), np.concatenate(parts_colors), np.concatenate(parts_source)
+
+
+class SoftwareRenderer:
+    '''
+    CPU backend for machines without a GL context. It takes the same shapes as
+    RenderWindow.add_shape (vertices, indices, RGBA byte colors and a model matrix) and
+    camera, and renders them like the default shaders with GL_DEPTH_TEST and GL_CULL_FACE:
+    perspective-correct per-vertex colors, a depth test (GL_LESS), counter-clockwise front
+    faces, near plane clipping and the top-left fill rule.
+
+    Triangles are transformed, clipped and set up for all shapes at once, then binned into
+    screen tiles; render rasterizes the tiles on a pool of `workers` threads (NumPy releases
+    the GIL in its array operations). The frame is in `color`, an (height, width, 4) array
+    with its bottom row first like OffscreenTarget.read_pixels, and its 24-bit depth is in
+    `depth`.
+    '''
+    def __init__(self, width, height, tile_size=TILE_SIZE, workers=None):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.workers = workers or os.cpu_count()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+        # camera, as in RenderWindow
+        self.cam_eye = Vec3(0, 2, 4)
+        self.cam_target = Vec3(0, 0, 0)
+        self.cam_vup = Vec3(0, 1, 0)
+        self.z_near = 0.1
+        self.z_far = 100
+        self.fov = 60
+        self.view_mat = None
+        self.proj_mat = None
+
+        self.transforms = TransformStore()
+        self.bounds = BoundsStore()
+        self.meshes = []
+        self.clear_color = (0, 0, 0, 0)
+        self.color = np.zeros((height, width, 4), dtype=np.uint8)
+        self.depth = np.full((height, width), DEPTH_MAX, dtype=np.uint32)
+
+        # triangles submitted (in visible shapes), rasterized (after clipping and culling)
+        # and fragments written in the last frame
+        self.triangle_count = 0
+        self.raster_triangles = 0
+        self.fragment_count = 0
+
+        self.animate = False
+        self.setup()
+
+    @classmethod
+    def from_window(cls, window, **kwargs):
+        '''
+        A software renderer holding the shapes and camera matrices of a RenderWindow.
+        '''
+        renderer = cls(*window.get_framebuffer_size(), **kwargs)
+        renderer.view_mat, renderer.proj_mat = window.view_mat, window.proj_mat
+        for (vertice, indice, color), matrix in zip(window.meshes, window.transforms.matrices):
+            renderer.add_shape(Mat4(matrix.ravel().tolist()), vertice, indice, color, Vec3(0, 0, 0))
+        renderer.transforms.angular_velocity[:] = window.transforms.angular_velocity
+        return renderer
+
+    def setup(self) -> None:
+        self.view_mat = Mat4.look_at(self.cam_eye, target=self.cam_target, up=self.cam_vup)
+        self.proj_mat = Mat4.perspective_projection(
+            aspect=self.width / self.height, z_near=self.z_near, z_far=self.z_far, fov=self.fov)
+
+    def add_shape(self, transform, vertice, indice, color, angular_velocity=Vec3(0, 0, 1), lods=None):
+        '''
+        Add a shape like RenderWindow.add_shape. `lods` are accepted and ignored: the full
+        mesh is always drawn.
+        '''
+        index = self.transforms.add(transform, angular_velocity)
+        assert self.bounds.add(*aabb_from_vertices(vertice)) == index
+        self.meshes.append((vertice, indice, color))
+        return index
+
+    def add_shapes(self, transforms, meshes, mesh_ids=None, angular_velocity=Vec3(0, 0, 1)) -> np.ndarray:
+        '''
+        Add many shapes at once like RenderWindow.add_shapes.
+        '''
+        matrices = np.reshape(np.asarray(transforms, dtype=np.float32), (-1, 4, 4))
+        mesh_ids = np.zeros(len(matrices), dtype=np.int64) if mesh_ids is None else np.asarray(mesh_ids, np.int64)
+        rows = self.transforms.extend(matrices, angular_velocity)
+        if len(rows):
+            aabbs = np.array([aabb_from_vertices(mesh[0]) for mesh in meshes], dtype=np.float32)[mesh_ids]
+            assert self.bounds.extend(aabbs[:, 0], aabbs[:, 1])[0] == rows[0]
+        self.meshes += [tuple(meshes[mesh_id]) for mesh_id in mesh_ids.tolist()]
+        return rows
+
+    def update(self, dt) -> None:
+        if self.animate:
+            self.transforms.step(dt)
+
+    def _triangles(self):
+        '''
+        The shapes whose bounding boxes are in the view frustum, as clip-space vertex
+        positions (N, 4), vertex colors (N, 4) and triangles (T, 3) indexing them, in the
+        order the shapes were added.
+        '''
+        view_proj = self.proj_mat @ self.view_mat
+        matrices = self.transforms.matrices
+        visible = aabbs_in_frustum(*self.bounds.world(matrices), frustum_planes(view_proj))
+        # column-major storage holds the transposes: clip = p @ M^T @ (PV)^T
+        view_proj = np.array(view_proj, dtype=np.float64).reshape(4, 4)
+
+        positions, colors, triangles = [], [], []
+        offset = 0
+        for i in np.flatnonzero(visible).tolist():
+            vertices, indices, color = self.meshes[i]
+            points = np.reshape(np.asarray(vertices, dtype=np.float64), (-1, 3))
+            transform = matrices[i].astype(np.float64) @ view_proj
+            positions.append(points @ transform[:3] + transform[3])
+            colors.append(np.reshape(np.asarray(color, dtype=np.uint8), (-1, 4)))
+            triangles.append(np.reshape(np.asarray(indices, dtype=np.int64), (-1, 3)) + offset)
+            offset += len(points)
+        if not positions:
+            return np.zeros((0, 4)), np.zeros((0, 4), dtype=np.uint8), np.zeros((0, 3), dtype=np.int64)
+        return np.concatenate(positions), np.concatenate(colors), np.concatenate(triangles)
+
+    def _window_coordinates(self, clip):
+        # window x and y snapped to the subpixel grid, depth in [0, 1], and 1 / w
+        inverse_w = 1 / np.where(clip[..., 3] > 0, clip[..., 3], 1)
+        x = np.rint((clip[..., 0] * inverse_w + 1) * (self.width * SUBPIXEL / 2)) / SUBPIXEL
+        y = np.rint((clip[..., 1] * inverse_w + 1) * (self.height * SUBPIXEL / 2)) / SUBPIXEL
+        z = (clip[..., 2] * inverse_w + 1) / 2
+        return x, y, z, inverse_w
+
+    def _setup_triangles(self, positions, colors, triangles):
+        '''
+        Window-space triangles that survive clipping, culling and the pixel grid: a dict of
+        per-triangle arrays, and their pixel bounding boxes (x0, y0, x1, y1 inclusive).
+        '''
+        # outcodes: a bit for every frustum plane a vertex is outside of; triangles with all
+        # vertices outside of one plane are rejected, those crossing the near plane clipped
+        w = positions[:, 3:]
+        outcodes = np.packbits(np.concatenate([positions[:, :3] < -w, positions[:, :3] > w], axis=1),
+                               axis=1, bitorder='little')[:, 0]
+        corners = outcodes[triangles]
+        inside = (corners[:, 0] & corners[:, 1] & corners[:, 2]) == 0
+        triangles = triangles[inside]
+        near = ((corners[inside, 0] | corners[inside, 1] | corners[inside, 2]) & _NEAR_PLANE) != 0
+        colors = colors.astype(np.float32) / 255
+        if np.any(near):
+            # clipped triangles get vertices of their own, and keep their place in drawing
+            # order, which decides between fragments of equal depth
+            clipped, clipped_colors, source = clip_near(positions[triangles[near]], colors[triangles[near]])
+            new = len(positions) + np.arange(clipped.size // 4).reshape(-1, 3)
+            order = np.argsort(np.concatenate([np.flatnonzero(~near), np.flatnonzero(near)[source]]), kind='stable')
+            triangles = np.concatenate([triangles[~near], new])[order]
+            positions = np.concatenate([positions, clipped.reshape(-1, 4)])
+            colors = np.concatenate([colors, clipped_colors.reshape(-1, 4)])
+
+        x, y, z, inverse_w = self._window_coordinates(positions)
+        tx, ty = x[triangles], y[triangles]
+        # counter-clockwise triangles face the camera; back faces and slivers are culled
+        area = (tx[:, 1] - tx[:, 0]) * (ty[:, 2] - ty[:, 0]) - (tx[:, 2] - tx[:, 0]) * (ty[:, 1] - ty[:, 0])
+        front = np.flatnonzero(area > 0)
+        triangles, tx, ty, area = triangles[front], tx[front], ty[front], area[front]
+        # pixels whose centers can be covered
+        x0 = np.maximum(np.ceil(np.minimum(np.minimum(tx[:, 0], tx[:, 1]), tx[:, 2]) - 0.5), 0)
+        x1 = np.minimum(np.floor(np.maximum(np.maximum(tx[:, 0], tx[:, 1]), tx[:, 2]) - 0.5), self.width - 1)
+        y0 = np.maximum(np.ceil(np.minimum(np.minimum(ty[:, 0], ty[:, 1]), ty[:, 2]) - 0.5), 0)
+        y1 = np.minimum(np.floor(np.maximum(np.maximum(ty[:, 0], ty[:, 1]), ty[:, 2]) - 0.5), self.height - 1)
+        keep = np.flatnonzero((x0 <= x1) & (y0 <= y1))
+
+        triangles, x, y, area = triangles[keep], tx[keep], ty[keep], area[keep]
+        # edge functions E(p) = a * px + b * py + c of the edges opposite each vertex,
+        # positive inside; E / area are the barycentric coordinates
+        start, end = np.roll(np.arange(3), -1), np.roll(np.arange(3), -2)
+        dx, dy = x[:, end] - x[:, start], y[:, end] - y[:, start]
+        a, b = -dy, dx
+        c = -(a * x[:, start] + b * y[:, start])
+        # top-left rule: pixel centers on left edges (going down) and top edges are inside.
+        # Edge functions at pixel centers are multiples of 1 / SUBPIXEL**2, so moving the
+        # other edges in by that much makes E >= 0 the whole test
+        top_left = (dy < 0) | ((dy == 0) & (dx < 0))
+        c -= np.where(top_left, 0, 1 / SUBPIXEL ** 2)
+
+        # depth, 1 / w and color / w are linear in window space: planes through the first
+        # vertex, value = origin + gradient_x * (px - x0) + gradient_y * (py - y0)
+        inverse_w = inverse_w[triangles]
+        values = np.concatenate([z[triangles][..., None], inverse_w[..., None],
+                                 colors[triangles] * inverse_w[..., None]], axis=2)
+        setup = {'a': a, 'b': b, 'c': c, 'x': x[:, 0], 'y': y[:, 0], 'origin': values[:, 0],
+                 'gradient_x': np.einsum('ti,tik->tk', a, values) / area[:, None],
+                 'gradient_y': np.einsum('ti,tik->tk', b, values) / area[:, None]}
+        boxes = np.stack([x0[keep], y0[keep], x1[keep], y1[keep]], axis=1).astype(np.int64)
+        return setup, boxes
+
+    def _bin(self, boxes):
+        '''
+        The triangles overlapping every tile: (tile, triangle) pairs sorted by tile with
+        triangles in drawing order, as a dict from tile index to triangle indices.
+        '''
+        tiles = boxes // self.tile_size
+        columns = -(-self.width // self.tile_size)
+        spans_x = tiles[:, 2] - tiles[:, 0] + 1
+        counts = spans_x * (tiles[:, 3] - tiles[:, 1] + 1)
+        triangle = np.repeat(np.arange(len(boxes)), counts)
+        local = np.arange(len(triangle)) - np.repeat(np.cumsum(counts) - counts, counts)
+        spans = spans_x[triangle]
+        tile = (tiles[triangle, 1] + local // spans) * columns + tiles[triangle, 0] + local % spans
+        order = np.argsort(tile, kind='stable')
+        tile, triangle = tile[order], triangle[order]
+        bounds = np.flatnonzero(np.diff(tile)) + 1
+        return dict(zip(tile[np.concatenate([[0], bounds])].tolist(), np.split(triangle, bounds))) if len(tile) else {}
+
+    def _rasterize_tile(self, tile, selected, triangles, boxes):
+        '''
+        Rasterize the triangles `selected` into one tile of the color and depth buffers.
+        Returns the number of fragments written.
+        '''
+        columns = -(-self.width // self.tile_size)
+        left, bottom = tile % columns * self.tile_size, tile // columns * self.tile_size
+        right, top = min(left + self.tile_size, self.width), min(bottom + self.tile_size, self.height)
+        color = self.color[bottom:top, left:right]
+        depth = self.depth[bottom:top, left:right]
+
+        x0 = np.maximum(boxes[selected, 0], left)
+        y0 = np.maximum(boxes[selected, 1], bottom)
+        widths = np.minimum(boxes[selected, 2], right - 1) - x0 + 1
+        counts = widths * (np.minimum(boxes[selected, 3], top - 1) - y0 + 1)
+
+        written = 0
+        # blocks of whole triangles with about FRAGMENT_BLOCK fragments each, in order
+        ends = np.cumsum(counts)
+        splits = np.searchsorted(ends, np.arange(FRAGMENT_BLOCK, ends[-1], FRAGMENT_BLOCK), side='right')
+        for block in np.split(np.arange(len(selected)), np.unique(splits)):
+            if not len(block):
+                continue
+            # rows of every triangle in the tile
+            heights = counts[block] // widths[block]
+            row_owner = np.repeat(block, heights)
+            row_y = y0[row_owner] + np.arange(len(row_owner)) - np.repeat(np.cumsum(heights) - heights, heights)
+            index = selected[row_owner]
+            a, b = triangles['a'][index], triangles['b'][index]
+            # edge functions at the start of each row, E = a * x + row_edges; exact on the
+            # subpixel grid, so pixels on shared edges are covered once
+            row_edges = b * (row_y[:, None] + 0.5) + triangles['c'][index]
+
+            # the span of every row, where each edge's function is >= 0, widened by a pixel
+            # against rounding in the division (pixels are then tested exactly)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossing = -row_edges / a - 0.5
+            lower = np.where(a > 0, np.ceil(crossing) - 1, -np.inf).max(axis=1)
+            upper = np.where(a < 0, np.floor(crossing) + 1, np.inf).min(axis=1)
+            first_x, last_x = x0[row_owner], x0[row_owner] + widths[row_owner] - 1
+            start = np.clip(lower, first_x, last_x + 1).astype(np.int64)
+            stop = np.clip(upper, first_x - 1, last_x).astype(np.int64)
+            sizes = np.where(np.all((a != 0) | (row_edges >= 0), axis=1), np.maximum(stop - start + 1, 0), 0)
+
+            row = np.repeat(np.arange(len(row_owner)), sizes)
+            px = start[row] + np.arange(len(row)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+            center_x = px + 0.5
+            inside = row_edges[row, 0] + a[row, 0] * center_x >= 0
+            for i in (1, 2):
+                inside &= row_edges[row, i] + a[row, i] * center_x >= 0
+            row, px, center_x = row[inside], px[inside], center_x[inside]
+
+            # the attribute planes at the start of every row
+            gradient_x = triangles['gradient_x'][index]
+            row_values = (triangles['origin'][index] - gradient_x * triangles['x'][index, None]
+                          + triangles['gradient_y'][index] * (row_y + 0.5 - triangles['y'][index])[:, None])
+            z = row_values[row, 0] + gradient_x[row, 0] * center_x
+            kept = (z >= 0) & (z <= 1)
+            row, px, center_x = row[kept], px[kept], center_x[kept]
+            depth_values = np.rint(z[kept] * DEPTH_MAX).astype(np.int64)
+
+            # depth test (GL_LESS) against the buffer and the other fragments of the pixel: the
+            # least depth << 32 | drawing order, where the buffer's depth has order 0, wins
+            rows, cols = row_y[row] - bottom, px - left
+            pixel = rows * (right - left) + cols
+            nearest = depth.astype(np.int64).ravel() << 32
+            np.minimum.at(nearest, pixel, depth_values << 32 | np.arange(1, len(pixel) + 1))
+            nearest = (nearest[np.flatnonzero(nearest & 0xFFFFFFFF)] & 0xFFFFFFFF) - 1
+            row, rows, cols = row[nearest], rows[nearest], cols[nearest]
+
+            # perspective-correct colors: interpolate c / w and 1 / w, then divide
+            values = row_values[row, 1:] + gradient_x[row, 1:] * center_x[nearest, None]
+            depth[rows, cols] = depth_values[nearest]
+            color[rows, cols] = np.clip(np.rint(values[:, 1:] / values[:, :1] * 255), 0, 255).astype(np.uint8)
+            written += len(nearest)
+        return written
+
+    def render(self) -> np.ndarray:
+        '''
+        Render a frame into `color` and `depth`, and return `color`.
+        '''
+        self.color[:] = self.clear_color
+        self.depth[:] = DEPTH_MAX
+        positions, colors, triangles = self._triangles()
+        self.triangle_count = len(triangles)
+        triangles, boxes = self._setup_triangles(positions, colors, triangles)
+        self.raster_triangles = len(boxes)
+        bins = self._bin(boxes)
+
+        # the busiest tiles first, so the workers finish together
+        jobs = sorted(bins.items(), key=lambda item: -len(item[1]))
+        if self.executor is None:
+            written = [self._rasterize_tile(tile, selected, triangles, boxes) for tile, selected in jobs]
+        else:
+            written = list(self.executor.map(lambda job: self._rasterize_tile(*job, triangles, boxes), jobs))
+        self.fragment_count = sum(written)
+        return self.color
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def render_frames(renderer, frames, dt=1/60):
+    '''
+    Render `frames` frames of a SoftwareRenderer's scene with a fixed time step `dt`, timed
+    like headless.render_frames; the draw time is the whole software frame.
+    '''
+    from headless import FrameStats
+
+    # warm up, like headless.render_frames
+    renderer.update(dt)
+    renderer.render()
+
+    stats = FrameStats()
+    start = time.perf_counter()
+    for _ in range(frames):
+        frame_start = time.perf_counter()
+        renderer.update(dt)
+        update_end = time.perf_counter()
+        renderer.render()
+        stats.update_times.append(update_end - frame_start)
+        stats.draw_times.append(time.perf_counter() - update_end)
+        stats.triangles += renderer.triangle_count
+    stats.wall_time = time.perf_counter() - start
+    return stats
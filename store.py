@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class ArrayStore:
+    '''
+    Named arrays with one row per item (per shape in TransformStore, BoundsStore and the
+    RenderWindow), kept with spare capacity: the capacity doubles when full, so adding items
+    one at a time costs amortized O(1) instead of a copy of every array. The arrays are given as name=(dtype, row shape), and reading
+    one returns a view of its first `count` rows, which may be written in place.
+    '''
+    def __init__(self, capacity=64, **arrays):
+        self.count = 0
+        self._arrays = {name: np.zeros((capacity,) + tuple(shape), dtype=dtype)
+                        for name, (dtype, shape) in arrays.items()}
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('_arrays', {})
+        if name not in arrays:
+            raise AttributeError(f'{self.__class__.__name__!r} object has no attribute {name!r}')
+        return arrays[name][:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        for name, old in self._arrays.items():
+            new = np.zeros((max(2 * len(old), 1),) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            self._arrays[name] = new
+
+    def extend(self, count, **values) -> np.ndarray:
+        '''
+        Add `count` rows, filled from `values` (name=array or one value for all) and with
+        zeros in the arrays not given. Returns their indices.
+        '''
+        while self.count + count > len(next(iter(self._arrays.values()))):
+            self._grow()
+        rows = slice(self.count, self.count + count)
+        for name, array in self._arrays.items():
+            array[rows] = values.get(name, 0)
+        self.count += count
+        return np.arange(rows.start, rows.stop)
+
+
+def array_property(store, name):
+    # an array of an ArrayStore attribute, read without a __getattr__ call as it is read
+    # per shape while drawing; assigning writes into its rows
+    def get_array(self):
+        rows = getattr(self, store)
+        return rows._arrays[name][:rows.count]
+
+    def set_array(self, value):
+        get_array(self)[:] = value
+    return property(get_array, set_array)
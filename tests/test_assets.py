@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+from pyglet.math import Mat4, Vec3
+
+from benchmarks.obj_parallel import write_grid_obj
+from primitives import Cube, geometry_cache
+from render import RenderWindow
+
+
+def run_until_done(renderer, handles):
+    # returns the time the asset manager took in every update that ran an upload step
+    times = []
+    while not all(handle.done for handle in handles):
+        if renderer.assets.update():
+            times.append(renderer.assets.update_time)
+        time.sleep(0.001)
+    return np.array(times)
+
+
+def test_uploads_keep_to_the_frame_budget(tmp_path):
+    filename = str(tmp_path / 'grid.obj')
+    write_grid_obj(filename, 150)
+    renderer = RenderWindow(160, 120, 'test', visible=False)
+    renderer.assets.budget, renderer.assets.block = 0.001, 500
+    handle = renderer.load_shape(Mat4(), filename)
+    times = run_until_done(renderer, [handle])
+    assert handle.ready and renderer.shape_triangles[0] == 2 * 149 * 149
+    # the upload is spread over frames; a step may start just before the budget runs out
+    assert len(times) > 1
+    assert np.median(times) < 2 * renderer.assets.budget
+    renderer.close()
+
+
+def test_loads_share_a_parse_only_while_it_runs(tmp_path):
+    filename = str(tmp_path / 'grid.obj')
+    write_grid_obj(filename, 20)
+    renderer = RenderWindow(160, 120, 'test', visible=False)
+    handles = [renderer.load_shape(Mat4.from_translation(Vec3(x, 0, 0)), filename) for x in (-1, 1)]
+    run_until_done(renderer, handles)
+    assert renderer.shapes[0].indexed_vertices_list is renderer.shapes[1].indexed_vertices_list
+    assert renderer.assets._prepared == {}
+
+    # a later load reads the file as it is now
+    write_grid_obj(filename, 30)
+    handle = renderer.load_shape(Mat4(), filename)
+    run_until_done(renderer, [handle])
+    assert renderer.shape_triangles.tolist() == [2 * 19 * 19] * 2 + [2 * 29 * 29]
+    renderer.close()
+
+
+def test_shared_vertex_lists_are_deleted_with_their_last_shape():
+    cube = geometry_cache.get(Cube, Vec3(1, 1, 1))
+    writable = tuple(np.array(array) for array in (cube.vertices, cube.indices, cube.colors))
+    renderer = RenderWindow(160, 120, 'test', visible=False)
+    renderer.add_shapes([Mat4()] * 3, [writable])
+    shared = renderer.shapes[0].indexed_vertices_list
+    assert renderer.vertex_list_users == {id(shared): 3}
+
+    for index in range(3):
+        renderer.set_shape_mesh(index, cube.vertices, cube.indices, cube.colors)
+        assert renderer.vertex_list_users.get(id(shared), 0) == 2 - index
+    # cached meshes are not counted, and replacing them keeps their vertex list
+    renderer.set_shape_mesh(0, *writable)
+    renderer.set_shape_mesh(0, cube.vertices, cube.indices, cube.colors)
+    assert renderer.vertex_list_users == {}
+    assert all(shape.indexed_vertices_list is renderer.shapes[1].indexed_vertices_list for shape in renderer.shapes)
+    renderer.close()
@@ -0,0 +1,62 @@
+import os
+import shutil
+
+import numpy as np
+import pyglet
+import pytest
+
+from assets import AssetManager
+from benchmarks.atlas import write_block_obj
+from model.atlas import ATLAS_CACHE_SUFFIX, load_texture_atlas, texture_file, texture_names
+from model.obj import load_obj_meshes
+
+
+TEXTURES = ['textures/grass_top.png', 'textures/sand.png', 'textures/bedrock.png']
+
+
+@pytest.fixture
+def resources(tmp_path, monkeypatch):
+    # textures only found through pyglet.resource, not relative to the working directory
+    resource_path = tmp_path / 'resources'
+    os.makedirs(resource_path / 'blocks')
+    names = []
+    for source in TEXTURES:
+        shutil.copy(source, resource_path / 'blocks' / os.path.basename(source))
+        names.append('blocks/' + os.path.basename(source))
+    monkeypatch.setattr(pyglet.resource, 'path', [str(resource_path)])
+    pyglet.resource.reindex()
+    monkeypatch.chdir(tmp_path)
+    yield resource_path, names
+    monkeypatch.undo()
+    pyglet.resource.reindex()
+
+
+def test_atlas_resolves_textures_like_the_loader(resources):
+    resource_path, names = resources
+    assert texture_file(names[0]) == os.path.join(resource_path, names[0])
+    assert texture_file('missing.png') == 'missing.png'
+
+    filename = 'blocks.obj'
+    write_block_obj(filename, 3, names)
+    assert texture_names(load_obj_meshes(filename)) == names
+    atlas = load_texture_atlas(names, filename + ATLAS_CACHE_SUFFIX)
+    assert set(atlas.regions) == set(names)
+
+    manager = AssetManager()
+    handle = manager.load_model(filename, atlas=atlas)
+    manager.finish()
+    assert handle.ready
+    # every block is drawn from the atlas, with one shared group
+    assert len(set(handle.value.groups)) == 1 and handle.value.groups[0].texture is atlas.texture
+    manager.shutdown()
+
+
+def test_atlas_cache_follows_the_resolved_files(resources):
+    resource_path, names = resources
+    cache_filename = 'blocks' + ATLAS_CACHE_SUFFIX
+    built = load_texture_atlas(names, cache_filename)
+    cached = load_texture_atlas(names, cache_filename)
+    assert isinstance(cached.pixels, np.memmap) and np.array_equal(cached.pixels, built.pixels)
+    os.utime(resource_path / names[0], ns=(0, 0))
+    assert not isinstance(load_texture_atlas(names, cache_filename).pixels, np.memmap)
+    assert sorted(os.listdir('.')) == ['blocks' + ATLAS_CACHE_SUFFIX, 'resources']
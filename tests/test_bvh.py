@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from pyglet.math import Mat4, Vec3
+
+import render
+from bvh import BVH, ray_aabbs
+from culling import aabbs_in_frustum, frustum_planes
+from primitives import Cube, geometry_cache
+from render import RenderWindow
+
+
+def random_boxes(rng, count, spread=10):
+    centers = rng.uniform(-spread, spread, (count, 3)).astype(np.float32)
+    extents = rng.uniform(0.1, 1.0, (count, 3)).astype(np.float32)
+    return centers - extents, centers + extents
+
+
+def random_frustums(rng, count, spread=10):
+    projection = Mat4.perspective_projection(aspect=4 / 3, z_near=0.1, z_far=2 * spread, fov=60)
+    for eye, target in rng.uniform(-spread, spread, (count, 2, 3)).tolist():
+        yield frustum_planes(projection @ Mat4.look_at(Vec3(*eye), target=Vec3(*target), up=Vec3(0, 1, 0)))
+
+
+def check(tree, lo, hi, rng):
+    # every query answers like a test of every box
+    for origin, direction in zip(rng.uniform(-10, 10, (30, 3)), rng.normal(size=(30, 3))):
+        hit, t_near = ray_aabbs(origin, direction, lo, hi)
+        indices, distances = tree.ray_query(origin, direction)
+        assert np.array_equal(np.sort(indices), np.flatnonzero(hit))
+        assert np.all(np.diff(distances) >= 0) and np.allclose(distances, t_near[indices])
+    for planes in random_frustums(rng, 10):
+        assert np.array_equal(tree.frustum_query(planes), aabbs_in_frustum((lo + hi) / 2, (hi - lo) / 2, planes))
+
+
+@pytest.mark.parametrize('count', [1, 5, 300])
+def test_build(count):
+    rng = np.random.default_rng(count)
+    lo, hi = random_boxes(rng, count)
+    check(BVH(lo, hi), lo, hi, rng)
+
+
+def test_refit():
+    rng = np.random.default_rng(1)
+    lo, hi = random_boxes(rng, 300)
+    tree = BVH(lo, hi)
+    moved = rng.choice(300, 40, replace=False)
+    offset = rng.uniform(-5, 5, (40, 3)).astype(np.float32)
+    lo[moved] += offset
+    hi[moved] += offset
+    tree.refit(moved, lo[moved], hi[moved])
+    check(tree, lo, hi, rng)
+
+
+def test_append():
+    rng = np.random.default_rng(2)
+    lo, hi = random_boxes(rng, 300)
+    tree = BVH(lo[:0], hi[:0])
+    check(tree, lo[:0], hi[:0], rng)
+    for start in range(0, 300, 70):
+        tree.append(lo[start:start + 70], hi[start:start + 70])
+        check(tree, lo[:start + 70], hi[:start + 70], rng)
+    assert tree.count == 300
+
+
+def test_small_scenes_cull_and_pick_like_the_bvh(monkeypatch):
+    cube = geometry_cache.get(Cube, Vec3(1, 1, 1))
+    renderer = RenderWindow(160, 120, 'test', visible=False)
+    for position in np.random.default_rng(3).uniform(-6, 6, (100, 3)).tolist():
+        renderer.add_shape(Mat4.from_translation(Vec3(*position)), cube.vertices, cube.indices, cube.colors)
+    renderer.update(0)
+    points = [(x, y) for x in range(0, 160, 16) for y in range(0, 120, 12)]
+
+    renderer.cull()
+    linear_visible, linear_picks = renderer.shape_visible.copy(), [renderer.pick(x, y) for x, y in points]
+    assert renderer.bvh is None
+    monkeypatch.setattr(render, 'BVH_MIN_SHAPES', 0)
+    renderer.cull()
+    assert renderer.bvh is not None
+    assert np.array_equal(renderer.shape_visible, linear_visible)
+    assert [renderer.pick(x, y) for x, y in points] == linear_picks
+    assert any(index is not None for index in linear_picks)
+    renderer.close()
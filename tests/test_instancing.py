@@ -0,0 +1,71 @@
+import numpy as np
+from pyglet.math import Mat4, Vec3
+
+from headless import OffscreenTarget
+from primitives import Cube, geometry_cache
+from render import RenderWindow
+
+
+def draw(renderer, target, dt=0.0):
+    renderer.switch_to()
+    target.bind()
+    renderer.update(dt)
+    renderer.on_draw()
+    pixels = target.read_pixels()
+    target.unbind()
+    return pixels
+
+
+def scenes(positions, angular_velocity=(0, 0, 1)):
+    cube = geometry_cache.get(Cube, Vec3(1, 1, 1))
+    transforms = [Mat4.from_translation(Vec3(*position)) for position in positions]
+    velocities = np.broadcast_to(np.asarray(angular_velocity, dtype=np.float32), (len(positions), 3))
+    shapes = RenderWindow(160, 120, 'test', visible=False)
+    for transform, velocity in zip(transforms, velocities.tolist()):
+        shapes.add_shape(transform, cube.vertices, cube.indices, cube.colors, angular_velocity=Vec3(*velocity))
+    instanced = RenderWindow(160, 120, 'test', visible=False)
+    instances = instanced.add_instances(cube, transforms, angular_velocity)
+    return shapes, instanced, instances
+
+
+def test_instances_draw_like_shapes():
+    shapes, instanced, instances = scenes([(-2, 0, 0), (0, 0, 0), (2, 0, 0)])
+    target = OffscreenTarget(160, 120)
+    assert np.array_equal(draw(shapes, target), draw(instanced, target))
+    assert instances.drawn_count == 3 and instanced.triangle_count == shapes.triangle_count
+
+    # both rotate by their angular velocity through TransformStore.step
+    shapes.animate = instanced.animate = True
+    for _ in range(3):
+        assert np.array_equal(draw(shapes, target, 0.2), draw(instanced, target, 0.2))
+    assert np.array_equal(instances.transforms.matrices, shapes.transforms.matrices)
+    shapes.close()
+    instanced.close()
+
+
+def test_instances_are_culled():
+    # the last cube is behind the camera
+    shapes, instanced, instances = scenes([(-2, 0, 0), (2, 0, 0), (0, 0, 50)])
+    target = OffscreenTarget(160, 120)
+    assert np.array_equal(draw(shapes, target), draw(instanced, target))
+    assert shapes.visible_count == instances.drawn_count == 2
+    assert instanced.triangle_count == shapes.triangle_count == 24
+
+    instanced.frustum_culling = False
+    draw(instanced, target)
+    assert instances.drawn_count == 3
+    shapes.close()
+    instanced.close()
+
+
+def test_instance_angular_velocity():
+    shapes, instanced, instances = scenes([(-2, 0, 0), (2, 0, 0)], [(0, 0, 0), (0, 1, 0)])
+    before = instances.transforms.matrices.copy()
+    shapes.animate = instanced.animate = True
+    shapes.update(0.5)
+    instanced.update(0.5)
+    assert np.array_equal(instances.transforms.matrices[0], before[0])
+    assert not np.array_equal(instances.transforms.matrices[1], before[1])
+    assert np.array_equal(instances.transforms.matrices, shapes.transforms.matrices)
+    shapes.close()
+    instanced.close()
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from model.normals import compute_normals, compute_tangents
+from model.obj import load_obj_meshes
+from primitives import Cube, Icosphere, Sphere
+
+
+def angle_errors(normals, expected):
+    normals, expected = np.reshape(normals, (-1, 3)), np.reshape(expected, (-1, 3))
+    expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+    return np.degrees(np.arccos(np.clip(np.einsum('ij,ij->i', normals, expected), -1, 1)))
+
+
+@pytest.mark.parametrize('weighting, ratio', [('angle', 3), ('area', 1.8)])
+def test_sphere_normals_converge(weighting, ratio):
+    errors = []
+    for size in (8, 16, 32):
+        sphere = Sphere(size, size)
+        vertices, _, normals = compute_normals(sphere.vertices, sphere.indices, weighting=weighting)
+        assert np.allclose(np.linalg.norm(np.reshape(normals, (-1, 3)), axis=1), 1, atol=1e-5)
+        # on a unit sphere the normal is the position
+        errors.append(angle_errors(normals, vertices).max())
+    assert errors[-1] < 1 and np.all(np.array(errors[:-1]) / errors[1:] > ratio), errors
+
+
+def test_icosphere_normals():
+    sphere = Icosphere(4)
+    vertices, _, normals = compute_normals(sphere.vertices, sphere.indices, smoothing_angle=None)
+    assert len(vertices) == len(sphere.vertices)
+    assert angle_errors(normals, sphere.normals).max() < 0.1
+
+
+def test_sphere_tangents():
+    # tangents follow increasing u, around the y axis; the seam columns and the poles are
+    # left out, as they only see the faces on one side or have no u direction
+    size = 32
+    sphere = Sphere(size, size)
+    tangents = compute_tangents(sphere.vertices, sphere.normals, sphere.tex_coords, sphere.indices).reshape(-1, 4)
+    theta = np.tile(np.arange(size + 1) * 2 * np.pi / size, size + 1)
+    column = np.tile(np.arange(size + 1), size + 1)
+    interior = (np.abs(np.reshape(sphere.normals, (-1, 3))[:, 1]) < 0.9) & (column > 0) & (column < size)
+    expected = np.stack([-np.sin(theta), np.zeros_like(theta), -np.cos(theta)], axis=1)
+    assert angle_errors(tangents[interior, :3], expected[interior]).max() < 0.5
+    assert np.all(tangents[:, 3] == 1)
+    assert np.allclose(np.linalg.norm(tangents[:, :3], axis=1), 1, atol=1e-5)
+    assert np.abs(np.einsum('ij,ij->i', tangents[:, :3], np.reshape(sphere.normals, (-1, 3)))).max() < 1e-5
+
+
+def test_hard_edges_split_corners():
+    quads = Cube.faces
+    triangles = np.concatenate([quads[:, [0, 1, 2]], quads[:, [2, 3, 0]]])
+    vertices, indices, normals = compute_normals(Cube.corners, triangles)
+    assert len(vertices) == 24 * 3 and len(indices) == len(triangles) * 3
+    face_normals = np.repeat(np.concatenate([Cube.face_normals, Cube.face_normals]), 3, axis=0)
+    assert np.allclose(np.reshape(normals, (-1, 3))[indices], face_normals, atol=1e-6)
+
+    # without a smoothing angle the corners stay shared and average their three faces
+    vertices, _, normals = compute_normals(Cube.corners, triangles, smoothing_angle=None)
+    assert len(vertices) == 8 * 3 and angle_errors(normals, Cube.corners).max() < 0.05
+
+
+def test_loaded_mesh_normals_face_outwards():
+    # bunny.obj has no vn records, so its normals and tangents are generated on load
+    mesh = load_obj_meshes('model/bunny.obj')[0]
+    points = np.reshape(mesh.vertices, (-1, 3))[np.reshape(mesh.indices, (-1, 3))]
+    face_normals = np.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+    corner_normals = np.reshape(mesh.normals, (-1, 3))[np.reshape(mesh.indices, (-1, 3))]
+    assert np.all(np.einsum('ti,tci->tc', face_normals, corner_normals) > 0)
+    assert len(mesh.tangents) == len(mesh.vertices) // 3 * 4
@@ -0,0 +1,55 @@
+import os
+import threading
+
+import numpy as np
+
+from model.obj import atomic_write, load_mesh_cache, parse_obj_file, write_mesh_cache
+
+
+def test_cache_round_trip(tmp_path):
+    cache_filename = str(tmp_path / 'monkey.obj.meshcache')
+    expected = parse_obj_file('model/monkey.obj', indexed=True)
+    write_mesh_cache(cache_filename, expected, ['model/monkey.obj'])
+    result = load_mesh_cache(cache_filename)
+    assert [mesh.name for mesh in result] == [mesh.name for mesh in expected]
+    for old, new in zip(expected, result):
+        for attribute in ('vertices', 'normals', 'tex_coords', 'indices'):
+            assert np.array_equal(getattr(old, attribute), getattr(new, attribute)), attribute
+    assert os.listdir(tmp_path) == ['monkey.obj.meshcache']
+
+
+def test_atomic_writes_from_threads(tmp_path):
+    filename = str(tmp_path / 'cache')
+    start = threading.Barrier(8)
+
+    def write(value):
+        start.wait()
+        with atomic_write(filename) as f:
+            for _ in range(100):
+                f.write(bytes([value]) * 1000)
+
+    threads = [threading.Thread(target=write, args=(value,)) for value in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # one writer's whole file, and no temporary files left behind
+    with open(filename, 'rb') as f:
+        data = f.read()
+    assert len(data) == 100_000 and len(set(data)) == 1
+    assert os.listdir(tmp_path) == ['cache']
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    filename = str(tmp_path / 'cache')
+    with atomic_write(filename) as f:
+        f.write(b'old')
+    try:
+        with atomic_write(filename) as f:
+            f.write(b'new')
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    with open(filename, 'rb') as f:
+        assert f.read() == b'old'
+    assert os.listdir(tmp_path) == ['cache']
@@ -0,0 +1,64 @@
+import io
+
+import numpy as np
+import pytest
+
+from model.obj import parse_obj_file
+
+
+# Two objects, a quad and a pentagon (fan triangulated), negative (relative) indices and
+# corners with and without texture coordinates and normals
+SYNTHETIC = b'''\
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+v 0.5 1.5 0
+vt 0 0
+vt 1 0
+vt 1 1
+vt 0 1
+vn 0 0 1
+o first
+f 1/1/1 2/2/1 3/3/1 4/4/1
+f -5//-1 -4//-1 -3//-1 -2//-1 -1//-1
+o second
+v 0 0 1
+v 1 0 1
+v 0 1 1
+f -3 -2 -1
+f 1/1 2/2 5/4
+'''
+
+
+def check_same_meshes(expected, result):
+    assert len(expected) == len(result)
+    for old, new in zip(expected, result):
+        assert old.name == new.name and old.material.name == new.material.name
+        for attribute in ('vertices', 'normals', 'tex_coords'):
+            values = getattr(new, attribute)
+            assert values.dtype == np.float32 and values.flags.c_contiguous, attribute
+            assert np.allclose(np.asarray(getattr(old, attribute), dtype=np.float32), values), attribute
+
+
+@pytest.mark.parametrize('filename', ['model/bunny.obj', 'model/monkey.obj'])
+def test_vectorized_matches_per_line_parser(filename):
+    check_same_meshes(parse_obj_file(filename, vectorized=False), parse_obj_file(filename))
+
+
+def test_negative_indices_and_polygons():
+    meshes = parse_obj_file('synthetic.obj', file=io.BytesIO(SYNTHETIC))
+    check_same_meshes(parse_obj_file('synthetic.obj', file=io.BytesIO(SYNTHETIC), vectorized=False), meshes)
+    # the quad and the pentagon make 2 + 3 triangles, the second object 2
+    assert [len(mesh.vertices) // 9 for mesh in meshes] == [5, 2]
+    assert np.array_equal(meshes[1].vertices[:9], [0, 0, 1, 1, 0, 1, 0, 1, 1])
+
+
+def test_indexed_expands_to_soup():
+    soup = parse_obj_file('synthetic.obj', file=io.BytesIO(SYNTHETIC))
+    for flat, mesh in zip(soup, parse_obj_file('synthetic.obj', file=io.BytesIO(SYNTHETIC), indexed=True)):
+        assert mesh.indices.dtype == np.uint32
+        for attribute, width in (('vertices', 3), ('normals', 3), ('tex_coords', 2)):
+            expanded = getattr(mesh, attribute).reshape(-1, width)[mesh.indices]
+            assert np.array_equal(getattr(flat, attribute).reshape(-1, width), expanded), attribute
+
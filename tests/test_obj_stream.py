@@ -0,0 +1,52 @@
+import tracemalloc
+
+import pytest
+
+from benchmarks.obj_stream import check_same_meshes, stream, write_synthetic_obj
+from model.obj import iter_obj_meshes, parse_obj_file
+
+
+@pytest.fixture(scope='module')
+def synthetic(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('stream') / 'small.obj')
+    write_synthetic_obj(filename, 50_000, grid=8)
+    return filename
+
+
+@pytest.mark.parametrize('indexed', [False, True])
+@pytest.mark.parametrize('chunk_size', [7, 1000])
+@pytest.mark.parametrize('source', ['model/monkey.obj', 'synthetic'])
+def test_chunks_parse_like_whole_file(synthetic, source, chunk_size, indexed):
+    # chunks this small split lines, records and objects
+    source = synthetic if source == 'synthetic' else source
+    check_same_meshes(parse_obj_file(source, indexed=indexed),
+                      list(iter_obj_meshes(source, chunk_size=chunk_size, indexed=indexed)), source)
+
+
+def test_dropping_vertices_between_objects(synthetic):
+    result = list(iter_obj_meshes(synthetic, chunk_size=1000, indexed=True, keep_vertices=False))
+    check_same_meshes(parse_obj_file(synthetic, indexed=True), result, 'keep_vertices=False')
+    assert [mesh.material.name for mesh in result[:3]] == ['red', 'red', 'blue']
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        result = function()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_streaming_memory_is_bounded(tmp_path):
+    chunk_size = 65536
+    peaks = []
+    for size in (2 ** 19, 2 ** 21):
+        filename = str(tmp_path / f'{size}.obj')
+        write_synthetic_obj(filename, size, grid=8)
+        triangles, peak = peak_memory(lambda: stream(filename, chunk_size, keep_vertices=False))
+        assert triangles > 0
+        peaks.append(peak)
+    # four times the file, about the same peak, set by the chunk size
+    assert peaks[1] < 1.25 * peaks[0]
+    assert peaks[1] < 16 * chunk_size
@@ -0,0 +1,70 @@
+import numpy as np
+import pyglet
+import pytest
+
+from assets import AssetManager
+from model.obj import load_obj_meshes
+from model.quantize import PACKED_VERTEX_SIZE, PackedMaterialGroup, dequantize_positions, half_tex_coords, \
+    octahedral_decode, octahedral_encode, quantize_positions
+
+
+def position_errors(vertices, aabb=None):
+    # errors in quantization steps, allowing for the float32 rounding of the decode
+    vertices = np.reshape(np.asarray(vertices, dtype=np.float32), (-1, 3))
+    quantized, offset, extent = quantize_positions(vertices, aabb)
+    assert quantized.dtype == np.uint16
+    error = np.abs(dequantize_positions(quantized, offset, extent) - vertices)
+    step = extent / 65535
+    rounding = 4 * np.finfo(np.float32).eps * np.abs(vertices).max(axis=0)
+    return error / np.where(step > 0, step, 1), rounding / np.where(step > 0, step, 1)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_positions_within_half_a_step(seed):
+    rng = np.random.default_rng(seed)
+    vertices = rng.normal(size=(1000, 3)) * rng.uniform(0.01, 100) + rng.uniform(-100, 100, 3)
+    errors, rounding = position_errors(vertices)
+    assert np.all(errors <= 0.5 + rounding)
+
+
+@pytest.mark.parametrize('filename', ['model/bunny.obj', 'model/monkey.obj'])
+def test_model_positions_within_half_a_step(filename):
+    for mesh in load_obj_meshes(filename):
+        errors, rounding = position_errors(mesh.vertices, mesh.aabb)
+        assert np.all(errors <= 0.5 + rounding)
+
+
+def test_flat_axis_decodes_exactly():
+    flat = np.random.default_rng(1).uniform(-1, 1, (100, 3)).astype(np.float32)
+    flat[:, 1] = 0.25
+    quantized, offset, extent = quantize_positions(flat)
+    assert np.all(dequantize_positions(quantized, offset, extent)[:, 1] == 0.25)
+
+
+def test_octahedral_normals():
+    # both hemispheres, the axes and the octahedron's edges
+    rng = np.random.default_rng(2)
+    normals = np.concatenate([rng.normal(size=(10000, 3)), np.eye(3), -np.eye(3),
+                              [[1, 1, 0], [1, -1, 0], [-1, 1, 0], [-1, -1, 0], [1, 0, -1], [0, -1, -1]]])
+    normals = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    decoded = octahedral_decode(octahedral_encode(normals.astype(np.float32))).astype(np.float64)
+    # arccos of the dot product is too coarse for angles this small
+    angles = np.degrees(np.arctan2(np.linalg.norm(np.cross(normals, decoded), axis=1), (normals * decoded).sum(axis=1)))
+    assert angles.max() < 0.01
+
+
+def test_half_tex_coords():
+    tex_coords = np.random.default_rng(3).uniform(-4, 4, (1000, 2)).astype(np.float32)
+    decoded = half_tex_coords(tex_coords).view(np.float16).astype(np.float32)
+    assert np.all(np.abs(decoded - tex_coords) <= np.abs(tex_coords) * 2.0 ** -11)
+
+
+def test_asset_manager_packs_models():
+    manager = AssetManager()
+    handle = manager.load_model('model/monkey.obj', batch=pyglet.graphics.Batch(), packed=True)
+    manager.finish()
+    assert handle.ready and all(isinstance(group, PackedMaterialGroup) for group in handle.value.groups)
+    for vertex_list in handle.value.vertex_lists:
+        attributes = vertex_list.domain.attribute_names.values()
+        assert sum(attribute.count * attribute.element_size for attribute in attributes) == PACKED_VERTEX_SIZE
+    manager.shutdown()
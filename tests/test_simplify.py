@@ -0,0 +1,62 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from model.obj import load_obj_meshes
+from model.simplify import LOD_RATIOS, load_obj_lods, simplify_mesh, simplify_obj_mesh
+
+
+@pytest.fixture(scope='module')
+def bunny():
+    return load_obj_meshes('model/bunny.obj')[0]
+
+
+def grid(size):
+    # a flat size x size quad grid in the z = 0 plane
+    x, y = np.meshgrid(np.arange(size + 1), np.arange(size + 1))
+    vertices = np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1).astype(np.float32)
+    corners = (np.arange(size)[:, None] * (size + 1) + np.arange(size)).ravel()
+    quads = np.stack([corners, corners + 1, corners + size + 2, corners + size + 1], axis=1)
+    indices = quads[:, [0, 1, 2, 0, 2, 3]].astype(np.uint32)
+    return vertices.ravel(), indices.ravel()
+
+
+@pytest.mark.parametrize('ratio', LOD_RATIOS[1:] + (0.05,))
+def test_triangle_targets(bunny, ratio):
+    target = int(len(bunny.indices) // 3 * ratio)
+    level = simplify_obj_mesh(bunny, ratio)
+    triangles = len(level.indices) // 3
+    assert 0.9 * target <= triangles <= target, (triangles, target)
+
+    points = np.reshape(level.vertices, (-1, 3))
+    assert level.indices.max() < len(points)
+    assert np.allclose(np.linalg.norm(np.reshape(level.normals, (-1, 3)), axis=1), 1, atol=1e-5)
+    base = np.reshape(bunny.vertices, (-1, 3))
+    diagonal = np.linalg.norm(base.max(axis=0) - base.min(axis=0))
+    assert np.abs(points.min(axis=0) - base.min(axis=0)).max() < 0.05 * diagonal
+    assert np.abs(points.max(axis=0) - base.max(axis=0)).max() < 0.05 * diagonal
+
+
+def test_flat_grid_stays_flat():
+    vertices, indices = grid(16)
+    new_vertices, new_indices = simplify_mesh(vertices, indices, 64)
+    assert 0.9 * 64 <= len(new_indices) // 3 <= 64
+    points = np.reshape(new_vertices, (-1, 3))
+    # a plane has no quadric error, but collapses must not leave it or fold triangles over
+    assert np.allclose(points[:, 2], 0)
+    triangles = points[np.reshape(new_indices, (-1, 3))]
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    assert np.all(normals[:, 2] >= 0)
+
+
+def test_lod_chain_is_cached(tmp_path, bunny):
+    filename = tmp_path / 'bunny.obj'
+    shutil.copy('model/bunny.obj', filename)
+    cold = load_obj_lods(str(filename))
+    warm = load_obj_lods(str(filename))
+    assert [len(level) for level in cold] == [1] * len(LOD_RATIOS)
+    for cold_level, warm_level in zip(cold, warm):
+        assert np.array_equal(cold_level[0].indices, warm_level[0].indices)
+        assert np.array_equal(cold_level[0].vertices, warm_level[0].vertices)
+    assert len(cold[-1][0].indices) < len(cold[0][0].indices)
@@ -0,0 +1,82 @@
+import numpy as np
+from pyglet.math import Mat4, Vec3
+
+from store import ArrayStore, array_property
+
+
+class TransformStore:
+    '''
+    Model matrices of all shapes in one (N, 4, 4) float32 array, together with an angular
+    velocity per shape, so animating the scene is one vectorized step per tick.
+
+    Matrices keep pyglet's column-major Mat4 layout, i.e. matrices[i] is the transpose of
+    the mathematical matrix. Every row carries a version number which is bumped whenever
+    the matrix changes, so consumers only convert and push matrices that actually changed;
+    `version` counts the changes of the whole store (adds included).
+    '''
+    matrices = array_property('rows', 'matrices')
+    # rotation speed about each shape's local axes, in radians per second
+    angular_velocity = array_property('rows', 'angular_velocity')
+    versions = array_property('rows', 'versions')
+
+    def __init__(self, capacity=64):
+        self.rows = ArrayStore(capacity, matrices=(np.float32, (4, 4)), angular_velocity=(np.float32, (3,)),
+                               versions=(np.int64, ()))
+        self.version = 0
+
+    @property
+    def count(self):
+        return self.rows.count
+
+    def add(self, transform: Mat4, angular_velocity=Vec3(0, 0, 1)) -> int:
+        index = int(self.rows.extend(1, matrices=np.reshape(transform, (4, 4)), angular_velocity=angular_velocity)[0])
+        self.version += 1
+        return index
+
+    def extend(self, matrices, angular_velocity=Vec3(0, 0, 1)) -> np.ndarray:
+        '''
+        Add many matrices at once: an (N, 4, 4) or (N, 16) array in the column-major Mat4
+        layout, with one angular velocity for all or one per matrix. Returns their indices.
+        '''
+        matrices = np.reshape(np.asarray(matrices, dtype=np.float32), (-1, 4, 4))
+        rows = self.rows.extend(len(matrices), matrices=matrices,
+                                angular_velocity=np.asarray(angular_velocity, dtype=np.float32))
+        self.version += 1
+        return rows
+
+    def get(self, index) -> Mat4:
+        return Mat4(self.matrices[index].ravel().tolist())
+
+    def set(self, index, transform: Mat4):
+        self.matrices[index] = np.reshape(transform, (4, 4))
+        self.versions[index] += 1
+        self.version += 1
+
+    def step(self, dt):
+        '''
+        Rotate every shape by its angular velocity times dt about its local axes, the
+        batched equivalent of `transform_mat @= Mat4.from_rotation(angle, axis)`.
+        '''
+        speed = np.linalg.norm(self.angular_velocity, axis=1)
+        moving = np.flatnonzero(speed > 0)
+        if not len(moving):
+            return
+        if len(moving) == self.count:
+            moving = slice(0, self.count)    # views instead of gathered copies
+
+        # Rodrigues' formula for all moving shapes at once
+        angle = (speed[moving] * dt)[:, None, None]
+        axis = self.angular_velocity[moving] / speed[moving, None]
+        x, y, z = axis.T
+        zero = np.zeros_like(x)
+        cross = np.stack([zero, -z, y, z, zero, -x, -y, x, zero], axis=1).reshape(-1, 3, 3)
+        cos, sin = np.cos(angle), np.sin(angle)
+        rotation = cos * np.eye(3, dtype=np.float32) + sin * cross + (1 - cos) * axis[:, :, None] * axis[:, None, :]
+
+        # Column-major storage holds M^T, and (M R)^T = R^T M^T
+        matrices = self.matrices[moving]
+        matrices[:, :3, :] = np.matmul(rotation.transpose(0, 2, 1), matrices[:, :3, :])
+        if not isinstance(moving, slice):
+            self.matrices[moving] = matrices
+        self.versions[moving] += 1
+        self.version += 1